@@ -0,0 +1,135 @@
+"""Micro-benchmark of tRPC response decoding on large synthetic environments.
+
+Builds environment.one and project.all bodies shaped like Dokploy's (composes
+with their compose file, env, mounts, domains and deployments) and compares
+the former way of reading them -- logging ``response.text[:200]`` and keeping
+the whole decoded body -- with dokploy_lib.trpc (byte preview, projection to
+the fields the automation reads). Both paths parse with the same parser, run
+once with the standard library and once with orjson when it is installed, so
+the comparison shows what the preview and projection change on their own.
+Reports the best time per call, the peak memory while decoding and the memory
+still held by the result.
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import requests
+
+from dokploy_lib.api import ENVIRONMENT_FIELDS, PROJECT_FIELDS
+from dokploy_lib.trpc import body_preview, fast_json, project_fields
+
+COMPOSE_FILE = "services:\n" + "".join(
+    f"  svc{i}:\n    image: ghcr.io/example/svc{i}:latest\n    environment:\n"
+    f"      - KEY_{i}=${{KEY_{i}}}\n    volumes:\n      - data{i}:/var/lib/svc{i}\n"
+    for i in range(40)
+)
+
+
+def compose_record(i, deployments):
+    return {
+        "composeId": f"cmp{i:05d}", "name": f"app-{i}", "appName": f"app-{i}-x1y2z3",
+        "suffix": "x1y2z3", "serverId": "srv1", "composeStatus": "done",
+        "description": "input fingerprint " + "f" * 64, "createdAt": "2026-01-01T00:00:00.000Z",
+        "composeFile": COMPOSE_FILE, "env": "\n".join(f"KEY_{k}=value-{k}-" + "v" * 40 for k in range(40)),
+        "customGitUrl": "git@github.com:example/app.git", "customGitBranch": "main",
+        "mounts": [{"mountId": f"m{k}", "type": "volume", "volumeName": f"data{k}", "mountPath": f"/data/{k}"}
+                   for k in range(5)],
+        "domains": [{"domainId": f"d{k}", "host": f"app-{i}-{k}.example.com", "port": 8080,
+                     "https": True, "certificateType": "letsencrypt"} for k in range(3)],
+        "deployments": [{"deploymentId": f"dep{i}-{k}", "title": "Rebuild deployment", "status": "done",
+                         "logPath": f"/etc/dokploy/logs/app-{i}/app-{i}-{k}.log",
+                         "createdAt": "2026-01-01T00:00:00.000Z"} for k in range(deployments)],
+    }
+
+
+def environment_body(composes, deployments):
+    env = {
+        "environmentId": "env1", "name": "production",
+        "compose": [compose_record(i, deployments) for i in range(composes)],
+        "applications": [], "postgres": [], "redis": [],
+    }
+    return [{"result": {"data": {"json": env}}}]
+
+
+def projects_body(projects, composes, deployments):
+    listing = []
+    for p in range(projects):
+        env = environment_body(composes, deployments)[0]["result"]["data"]["json"]
+        listing.append({"projectId": f"prj{p}", "name": f"Project {p}", "environments": [env]})
+    return [{"result": {"data": {"json": listing}}}]
+
+
+def make_response(body):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["content-type"] = "application/json"
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = json.dumps(body).encode()
+    return response
+
+
+def full_decode(response, fields, loads):
+    preview = response.text[:200]
+    return preview, loads(response.content)[0]["result"]["data"]["json"]
+
+
+def lean_decode(response, fields, loads):
+    # trpc_data with the parser given explicitly
+    return body_preview(response), project_fields(loads(response.content)[0]["result"]["data"]["json"], fields)
+
+
+def best_time(fn, response, fields, loads, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(response, fields, loads)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def memory(fn, response, fields, loads):
+    """(peak MB while decoding, MB retained by the result)."""
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = fn(response, fields, loads)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return (peak - base) / 1e6, (current - base) / 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lean vs full decoding of tRPC responses")
+    parser.add_argument("--composes", type=int, default=200, help="Composes per environment (default: 200)")
+    parser.add_argument("--projects", type=int, default=5, help="Projects in the project.all body (default: 5)")
+    parser.add_argument("--deployments", type=int, default=20, help="Deployments per compose (default: 20)")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per case; the best is used (default: 10)")
+    args = parser.parse_args(argv)
+
+    cases = [
+        ("environment.one", make_response(environment_body(args.composes, args.deployments)), ENVIRONMENT_FIELDS),
+        ("project.all", make_response(projects_body(args.projects, args.composes, args.deployments)), PROJECT_FIELDS),
+    ]
+    parsers = [("json", json.loads)] + ([("orjson", fast_json.loads)] if fast_json else [])
+    if not fast_json:
+        print("orjson is not installed: only the standard library parser is measured")
+    print(f"{'response':<16} {'size':>8} {'parser':<7} {'decoder':<6} {'time':>9} {'peak':>9} {'retained':>9}")
+    for name, response, fields in cases:
+        size = len(response.content) / 1e6
+        for parser_name, loads in parsers:
+            timings = {}
+            for label, fn in (("full", full_decode), ("lean", lean_decode)):
+                timings[label] = best_time(fn, response, fields, loads, args.repeat)
+                peak, retained = memory(fn, response, fields, loads)
+                print(f"{name:<16} {size:>6.1f}MB {parser_name:<7} {label:<6} {timings[label] * 1000:>7.1f}ms "
+                      f"{peak:>7.1f}MB {retained:>7.2f}MB")
+            print(f"{'':<16} {'':>8} {'':<7} {'':<6} {timings['full'] / timings['lean']:>8.2f}x faster")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
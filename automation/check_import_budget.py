@@ -0,0 +1,76 @@
+"""Check that the importable automation modules start fast and without side effects.
+
+Each module is imported in a fresh interpreter (best of several runs, measured
+with -X importtime). A module fails if it exceeds its budget, prints anything
+on import, or drags in a heavy dependency it should only load lazily.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# module -> (budget in ms, modules that must NOT be loaded by importing it)
+BUDGETS = {
+    "dokploy_lib": (15, ["requests", "sqlite3", "dokploy_lib.api"]),
+    "dokploy_lib.compose": (30, ["requests", "sqlite3", "subprocess"]),
+    "dokploy_lib.envfiles": (15, ["requests", "sqlite3"]),
+    "dokploy_lib.history": (20, ["requests", "sqlite3", "statistics"]),
+    "dokploy_automate": (60, ["requests", "sqlite3", "dokploy_lib.api"]),
+}
+
+PROBE = (
+    "import sys, {module}; "
+    "print('LOADED', ' '.join(m for m in {forbidden!r} if m in sys.modules))"
+)
+
+
+def measure(module, forbidden, runs=5):
+    """Return (best cumulative import time in ms, stray stdout lines, forbidden modules loaded)."""
+    best = None
+    stray = []
+    loaded = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, forbidden=forbidden)],
+            capture_output=True, text=True, cwd=script_dir,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr}")
+        for line in proc.stderr.splitlines():
+            parts = [p.strip() for p in line.split("|")]
+            if len(parts) == 3 and parts[2] == module:
+                cumulative_ms = int(parts[1]) / 1000.0
+                best = cumulative_ms if best is None else min(best, cumulative_ms)
+        stray = [l for l in proc.stdout.splitlines() if not l.startswith("LOADED")]
+        loaded = proc.stdout.splitlines()[-1].split()[1:]
+    return best, stray, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time budget check for the automation library")
+    parser.add_argument("--runs", type=int, default=5, help="Imports per module; the best run is used (default: 5)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply all budgets (for slow CI machines)")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    print(f"{'module':<24} {'import':>9} {'budget':>9}  result")
+    for module, (budget, forbidden) in BUDGETS.items():
+        elapsed, stray, loaded = measure(module, forbidden, args.runs)
+        budget *= args.scale
+        problems = []
+        if elapsed is None or elapsed > budget:
+            problems.append("over budget")
+        if stray:
+            problems.append(f"prints on import: {stray[0]!r}")
+        if loaded:
+            problems.append(f"eagerly imports {', '.join(loaded)}")
+        failures += bool(problems)
+        shown = f"{elapsed:.1f}ms" if elapsed is not None else "?"
+        print(f"{module:<24} {shown:>9} {budget:>7.0f}ms  {'; '.join(problems) or 'ok'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
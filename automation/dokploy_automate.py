@@ -4,936 +4,38 @@ import sys
 import subprocess
 import json
 import os
-
-# Ensure requests is installed (for fresh VM environments)
-try:
-    import requests
-except ImportError:
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "requests"])
-    import requests
-
-print("DEBUG: Script started...")
-
-ROOT_DOMAIN = "cpdemo.ca"
-
-def replace_domain(content):
-    if content is None: return None
-    if isinstance(content, str):
-        return content.replace("{{DOMAIN}}", ROOT_DOMAIN)
-    if isinstance(content, list):
-        return [replace_domain(i) for i in content]
-    if isinstance(content, dict):
-        return {k: replace_domain(v) for k, v in content.items()}
-    return content
-
-def find_env_file(app_name):
-    slugs = [
-        app_name.lower().replace(" ", "-"),
-        app_name.lower().replace(" ", "_"),
-        app_name.lower(),
-        "agentic" if "agentic" in app_name.lower() else None,
-        "dev-hub" if "dev hub" in app_name.lower() else None,
-    ]
-    slugs = [s for s in slugs if s]
-    search_dirs = [".", "automation", "automation/envs", "envs"]
-    for directory in search_dirs:
-        for slug in slugs:
-            path = os.path.join(directory, f".env_{slug}")
-            if os.path.exists(path):
-                return path
-    return None
-
-def copy_env_file_to_remote(local_path, remote_ip, app_slug):
-    try:
-        target_path = f"/etc/dokploy/compose/{app_slug}/code/.env"
-        print(f"Ensuring {target_path} on {remote_ip}...")
-        
-        # Check if we're running locally on the target VM
-        is_local = False
-        try:
-            import socket
-            if os.path.exists(f"/etc/dokploy/compose/{app_slug}"):
-                is_local = True
-        except:
-            pass
-
-        if is_local:
-            print(f"Detected local execution. Copying {local_path} to {target_path}...")
-            subprocess.run(["sudo", "mkdir", "-p", os.path.dirname(target_path)], check=True)
-            subprocess.run(["sudo", "cp", local_path, target_path], check=True)
-            subprocess.run(["sudo", "chmod", "644", target_path], check=True)
-        else:
-            # SSH copy
-            print(f"Using SCP to copy {local_path} to {target_path} on {remote_ip}...")
-            # We assume the user has sudo rights without password or we use a temporary directory
-            subprocess.run([
-                "ssh", "-o", "StrictHostKeyChecking=no", "-i", os.path.expanduser("~/.ssh/id_rsa"),
-                f"adminuser@{remote_ip}", f"sudo mkdir -p {os.path.dirname(target_path)}"
-            ], check=True)
-            
-            # Copy to temp first then move with sudo
-            temp_path = f"/tmp/.env_{app_slug}"
-            subprocess.run(["scp", "-o", "StrictHostKeyChecking=no", "-i", os.path.expanduser("~/.ssh/id_rsa"), local_path, f"adminuser@{remote_ip}:{temp_path}"], check=True)
-            subprocess.run(["ssh", "-o", "StrictHostKeyChecking=no", "-i", os.path.expanduser("~/.ssh/id_rsa"), f"adminuser@{remote_ip}", f"sudo mv {temp_path} {target_path}"], check=True)
-            subprocess.run(["ssh", "-o", "StrictHostKeyChecking=no", "-i", os.path.expanduser("~/.ssh/id_rsa"), f"adminuser@{remote_ip}", f"sudo chmod 644 {target_path}"], check=True)
-            
-        return True
-    except Exception as e:
-        print(f"Error copying env file: {e}")
-        return False
-
-
-def request_with_retry(
-    method, url, max_retries=3, backoff_factor=2, timeout=30, **kwargs
-):
-    """Makes an HTTP request with retry logic for transient failures."""
-    for attempt in range(max_retries):
-        try:
-            print(f"DEBUG: [REQ] {method} {url} (Attempt {attempt + 1})")
-            start_ptr = time.time()
-            response = requests.request(method, url, timeout=timeout, **kwargs)
-            duration = time.time() - start_ptr
-            print(f"DEBUG: [RES] {response.status_code} ({duration:.2f}s)")
-
-            if response.status_code < 500:
-                print(f"DEBUG: [BODY] {response.text[:200]}...")
-                return response
-
-            print(f"DEBUG: Server error {response.status_code}, retrying...")
-        except requests.exceptions.RequestException as e:
-            print(f"DEBUG: Request failed: {e}")
-            if attempt == max_retries - 1:
-                raise
-
-        sleep_time = backoff_factor**attempt
-        print(f"DEBUG: Sleeping {sleep_time}s before retry...")
-        time.sleep(sleep_time)
-
-    return requests.request(method, url, timeout=timeout, **kwargs)
-
-
-def wait_for_dokploy(url, timeout=300):
-    """Wait for Dokploy service to be accessible."""
-    start_time = time.time()
-    print(f"Waiting for Dokploy at {url}...")
-    while time.time() - start_time < timeout:
-        try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                print("Dokploy is up and running!")
-                return True
-        except requests.exceptions.RequestException:
-            pass
-        time.sleep(5)
-    print("Timeout waiting for Dokploy")
-    return False
-
-
-def register_admin(url, email, password, name="Admin", last_name="User"):
-    """Register admin user via the Better Auth sign-up endpoint."""
-    signup_url = f"{url}/api/auth/sign-up/email"
-    headers = {"Content-Type": "application/json", "Accept": "*/*"}
-    payload = {
-        "email": email,
-        "password": password,
-        "name": name,
-        "lastName": last_name,
-    }
-
-    print(f"Checking/Registering admin with email: {email}")
-    try:
-        response = request_with_retry("POST", signup_url, json=payload, headers=headers)
-        if response.status_code in [200, 201]:
-            print("SUCCESS! Admin account created successfully!")
-            return True
-        elif response.status_code == 422 and "USER_ALREADY_EXISTS" in response.text:
-            print("Admin account already exists, proceeding to login.")
-            return True
-        else:
-            print(f"Registration status: {response.status_code}")
-            print(f"DEBUG: Response Body: {response.text}")
-            return False
-    except requests.exceptions.RequestException as e:
-        print(f"Error during registration: {e}")
-        return False
-
-
-def login(url, email, password):
-    """Log in to Dokploy and return the session token cookie."""
-    login_url = f"{url}/api/auth/sign-in/email"
-    payload = {"email": email, "password": password}
-
-    print(f"Logging in as {email}...")
-    try:
-        response = request_with_retry("POST", login_url, json=payload)
-        if response.status_code == 200:
-            print("Login successful!")
-            return response.cookies
-        else:
-            print(f"Login failed: {response.status_code}")
-            print(f"DEBUG: Response Body: {response.text}")
-            return None
-    except Exception as e:
-        print(f"Error during login: {e}")
-        return None
-
-
-def setup_ssh_and_server(
-    url, cookies, ip_address, organization_id, username="adminuser"
-):
-    """Generate SSH key, add to authorized_keys, and register server."""
-    # 1. Generate SSH Key in Dokploy
-    trpc_url_gen = f"{url}/api/trpc/sshKey.generate?batch=1"
-    payload_gen = {"0": {"json": {}}}
-
-    import time
-
-    timestamp = int(time.time())
-    key_name = f"Key-{timestamp}"
-    server_name = f"Server-{timestamp}"
-
-    print(f"Generating SSH key ({key_name}) in Dokploy...")
-    try:
-        resp_gen = request_with_retry(
-            "POST", trpc_url_gen, json=payload_gen, cookies=cookies
-        )
-        keys = resp_gen.json()[0]["result"]["data"]["json"]
-        private_key = keys["privateKey"]
-        public_key = keys["publicKey"]
-
-        # 2. Add public key to authorized_keys on VM (both adminuser and root)
-        # Purge Azure's restricted root authorized_keys and enable root login
-        print(f"Authorizing public key on VM ({ip_address}) for adminuser and root...")
-        ssh_cmd = [
-            "ssh",
-            "-i",
-            args.ssh_private,
-            "-o",
-            "StrictHostKeyChecking=no",
-            f"{username}@{ip_address}",
-            f"echo '{public_key}' | tee -a /home/{username}/.ssh/authorized_keys > /dev/null && "
-            f"sudo sed -i 's/#PermitRootLogin prohibit-password/PermitRootLogin prohibit-password/' /etc/ssh/sshd_config && "
-            f"sudo sed -i 's/PermitRootLogin no/PermitRootLogin prohibit-password/' /etc/ssh/sshd_config && "
-            f"sudo systemctl reload ssh && "
-            f"sudo mkdir -p /root/.ssh && "
-            f"echo '{public_key}' | sudo tee /root/.ssh/authorized_keys > /dev/null",
-        ]
-        subprocess.run(ssh_cmd, check=True)
-
-        # 3. Create SSH Key record in Dokploy
-        trpc_url_key = f"{url}/api/trpc/sshKey.create?batch=1"
-        payload_key = {
-            "0": {
-                "json": {
-                    "name": key_name,
-                    "description": "Automated key for local deployment",
-                    "privateKey": private_key,
-                    "publicKey": public_key,
-                    "organizationId": organization_id,
-                }
-            }
-        }
-        print(f"Registering SSH key record ({key_name}) in Dokploy...")
-        request_with_retry("POST", trpc_url_key, json=payload_key, cookies=cookies)
-
-        # 4. Fetch the created SSH key ID by name
-        trpc_url_all_keys = f"{url}/api/trpc/sshKey.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
-        resp_all = request_with_retry("GET", trpc_url_all_keys, cookies=cookies)
-        keys_list = resp_all.json()[0]["result"]["data"]["json"]
-        ssh_key_id = next(
-            (k["sshKeyId"] for k in keys_list if k["name"] == key_name), None
-        )
-
-        if not ssh_key_id:
-            print(f"Error: Could not find created SSH key with name {key_name}")
-            return None
-
-        print(f"Found SSH Key ID: {ssh_key_id}")
-
-        # 4. Create Server record in Dokploy (using ROOT)
-        trpc_url_srv = f"{url}/api/trpc/server.create?batch=1"
-        payload_srv = {
-            "0": {
-                "json": {
-                    "name": server_name,
-                    "description": "Primary deployment server",
-                    "ipAddress": ip_address,
-                    "port": 22,
-                    "username": "root",
-                    "sshKeyId": ssh_key_id,
-                    "serverType": "deploy",
-                    "organizationId": organization_id,
-                }
-            }
-        }
-        print(f"Initializing server ({server_name}) in Dokploy...")
-        resp_srv = request_with_retry(
-            "POST", trpc_url_srv, json=payload_srv, cookies=cookies
-        )
-        data_srv = resp_srv.json()
-
-        if isinstance(data_srv, list) and len(data_srv) > 0:
-            res_srv = data_srv[0].get("result", {})
-            if "error" in res_srv:
-                print(f"Server creation error: {res_srv['error']}")
-                return None
-            server_id = res_srv.get("data", {}).get("json", {}).get("serverId")
-        else:
-            print(f"DEBUG: Unexpected server creation response: {data_srv}")
-            return None
-
-        # 5. Start server setup
-        print("Triggering server setup...")
-        trpc_url_setup = f"{url}/api/trpc/server.setup?batch=1"
-        request_with_retry(
-            "POST",
-            trpc_url_setup,
-            json={"0": {"json": {"serverId": server_id}}},
-            cookies=cookies,
-            timeout=60,  # Increased timeout for initial setup trigger
-        )
-
-        return server_id
-    except Exception as e:
-        print(f"Error during SSH/Server setup: {e}")
-        return None
-
-
-def delete_all_services(url, cookies, env_id):
-    """Delete all services (apps and compose) in the environment using environment.one."""
-    trpc_url_one = f"{url}/api/trpc/environment.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22environmentId%22%3A%22{env_id}%22%7D%7D%7D"
-    try:
-        resp = request_with_retry("GET", trpc_url_one, cookies=cookies)
-        env_data = resp.json()[0]["result"]["data"]["json"]
-
-        # Delete Compose Applications
-        composes = env_data.get("compose", [])
-        for comp in composes:
-            print(f"Deleting compose app: {comp['name']}...")
-            trpc_url_del = f"{url}/api/trpc/compose.delete?batch=1"
-            request_with_retry(
-                "POST",
-                trpc_url_del,
-                json={"0": {"json": {"composeId": comp["composeId"], "deleteVolumes": True}}},
-                cookies=cookies,
-            )
-
-        # Delete Single Applications
-        apps = env_data.get("applications", [])
-        for app in apps:
-            print(f"Deleting application: {app['name']}...")
-            trpc_url_del = f"{url}/api/trpc/application.delete?batch=1"
-            request_with_retry(
-                "POST",
-                trpc_url_del,
-                json={"0": {"json": {"applicationId": app["applicationId"]}}},
-                cookies=cookies,
-            )
-    except Exception as e:
-        print(f"DEBUG: Warning - could not cleanup services: {e}")
-        pass
-
-
-def get_all_project_ids(url, cookies):
-    """Find all existing projects and return their IDs and a list of all Env IDs."""
-    trpc_url = f"{url}/api/trpc/project.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%2C%22meta%22%3A%7B%22values%22%3A%5B%22undefined%22%5D%7D%7D%7D"
-    matches = []
-    try:
-        response = requests.get(trpc_url, cookies=cookies, timeout=30)
-        data = response.json()
-        projects = data[0]["result"]["data"]["json"]
-        for p in projects:
-            projectId = p["projectId"]
-            env_ids = get_all_environment_ids(url, cookies, projectId)
-            matches.append((projectId, env_ids, p["name"]))
-    except Exception as e:
-        print(f"DEBUG: Error listing all projects: {e}")
-    return matches
-
-
-def get_all_environment_ids(url, cookies, project_id):
-    """Get all environment IDs for the project."""
-    trpc_url = f"{url}/api/trpc/project.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22projectId%22%3A%22{project_id}%22%7D%7D%7D"
-    ids = []
-    try:
-        response = requests.get(trpc_url, cookies=cookies, timeout=30)
-        data = response.json()
-        environments = data[0]["result"]["data"]["json"]["environments"]
-        for env in environments:
-            ids.append(env["environmentId"])
-    except Exception:
-        pass
-    return ids
-
-
-def get_environment_id(url, cookies, project_id):
-    """Get the production environment ID for the project."""
-    trpc_url = f"{url}/api/trpc/project.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22projectId%22%3A%22{project_id}%22%7D%7D%7D"
-    try:
-        response = requests.get(trpc_url, cookies=cookies, timeout=30)
-        data = response.json()
-        environments = data[0]["result"]["data"]["json"]["environments"]
-        for env in environments:
-            if env["name"] == "production":
-                return env["environmentId"]
-    except Exception:
-        pass
-    return None
-
-
-def delete_project(url, cookies, project_id):
-    """Delete a project and all its resources."""
-    print(f"Deleting project {project_id}...")
-    trpc_url_del = f"{url}/api/trpc/project.delete?batch=1"
-    payload = {"0": {"json": {"projectId": project_id}}}
-    
-    # Retry logic for project deletion
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            resp = requests.post(trpc_url_del, json=payload, cookies=cookies, timeout=60)
-            print(f"DEBUG: Delete project response status: {resp.status_code}")
-            
-            if resp.status_code == 200:
-                try:
-                    data = resp.json()
-                    # Check for errors in TRPC response
-                    if data and isinstance(data, list) and len(data) > 0:
-                        result = data[0].get("result", {})
-                        if "error" in result or "error" in data[0]:
-                            error_msg = result.get("error") or data[0].get("error")
-                            print(f"DEBUG: TRPC error in response: {error_msg}")
-                            if attempt < max_retries - 1:
-                                print(f"Retrying delete... (attempt {attempt + 2}/{max_retries})")
-                                time.sleep(2)
-                                continue
-                            return False
-                    print(f"Project {project_id} deleted successfully.")
-                    return True
-                except Exception as parse_err:
-                    print(f"DEBUG: Could not parse response: {parse_err}")
-                    # If we can't parse but got 200, assume success
-                    print(f"Project {project_id} deleted (assumed success).")
-                    return True
-            else:
-                print(f"Failed to delete project: {resp.status_code} - {resp.text[:200]}")
-                if attempt < max_retries - 1:
-                    print(f"Retrying delete... (attempt {attempt + 2}/{max_retries})")
-                    time.sleep(2)
-                    continue
-                return False
-        except Exception as e:
-            print(f"Error deleting project: {e}")
-            if attempt < max_retries - 1:
-                print(f"Retrying delete... (attempt {attempt + 2}/{max_retries})")
-                time.sleep(2)
-                continue
-            return False
-    return False
-
-
-def force_cleanup_ports(ip_address, username, key_path, ports):
-    """Forcefully remove docker containers binding specific ports via SSH."""
-    print(f"Force-cleaning ports {ports} on {ip_address}...")
-
-    # Construct command to find and kill containers mapping these ports
-    # We loop through each port to be safe
-    commands = []
-
-    # Check for docker ps filtering for published ports
-    for port in ports:
-        # Docker formatting: 0.0.0.0:9000->... or :::9000->...
-        # We look for containers publishing this port
-        cmd = f"docker ps -a --format '{{{{.ID}}}} {{{{.Ports}}}}' | grep ':{port}->' | awk '{{print $1}}' | xargs -r docker rm -f"
-        commands.append(cmd)
-
-    full_command = " && ".join(commands)
-
-    ssh_cmd = [
-        "ssh",
-        "-i",
-        key_path,
-        "-o",
-        "StrictHostKeyChecking=no",
-        f"{username}@{ip_address}",
-        full_command,
-    ]
-
-    try:
-        subprocess.run(
-            ssh_cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-        )
-        print("Port cleanup commands executed successfully.")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"Warning: Port cleanup failed (may be harmless if empty): {e}")
-        return False
-
-
-def create_project(url, cookies, organization_id, name="Agentic Demos"):
-    """Create a new project in Dokploy."""
-    trpc_url = f"{url}/api/trpc/project.create?batch=1"
-    payload = {
-        "0": {
-            "json": {
-                "name": name,
-                "description": "Automated Project",
-                "projectId": "",
-                "organizationId": organization_id,
-            }
-        }
-    }
-    print(f"Creating project: {name}...")
-    try:
-        response = requests.post(trpc_url, json=payload, cookies=cookies, timeout=30)
-        data = response.json()
-        print(f"DEBUG: Create project response structure: {list(data[0].keys())}")
-        result = data[0].get("result", {})
-        if "error" in result:
-             print(f"Error creating project: {result['error']}")
-             return None, None
-             
-        project_data = result["data"]["json"]["project"]
-        env_data = result["data"]["json"]["environment"]
-        print(f"DEBUG: Created Project ID: {project_data.get('projectId')}, Env ID: {env_data.get('environmentId')}")
-        return project_data["projectId"], env_data["environmentId"]
-    except Exception as e:
-        print(f"Exception creating project: {e}")
-        return None, None
-
-
-def create_compose(url, cookies, project_id, environment_id, name, server_id):
-    """Create a Compose application."""
-    trpc_url = f"{url}/api/trpc/compose.create?batch=1"
-    payload = {
-        "0": {
-            "json": {
-                "name": name,
-                "description": f"Compose deployment of {name}",
-                "environmentId": environment_id,
-                "serverId": server_id,
-                "composeType": "docker-compose",
-                "appName": name.lower().replace(" ", "-"),
-            }
-        }
-    }
-    print(f"Creating compose application: {name}...")
-    try:
-        resp = request_with_retry("POST", trpc_url, json=payload, cookies=cookies)
-        data = resp.json()
-        return data[0]["result"]["data"]["json"]["composeId"]
-    except Exception as e:
-        print(f"Error creating compose: {e}")
-        return None
-
-
-def get_all_compose_ids(url, cookies, environment_id):
-    """Fetch all compose apps for a given environment."""
-    trpc_url = f"{url}/api/trpc/compose.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22environmentId%22%3A%22{environment_id}%22%7D%7D%7D"
-    try:
-        resp = requests.get(trpc_url, cookies=cookies, timeout=10).json()
-        apps = resp[0]["result"]["data"]["json"]
-        return [{"name": a["name"], "composeId": a["composeId"]} for a in apps]
-    except Exception as e:
-        print(f"Error fetching compose apps: {e}")
-        return []
-
-
-def get_compose_app_name(url, cookies, compose_id):
-    """Fetch the full appName (with suffix) for a compose service."""
-    trpc_url = f"{url}/api/trpc/compose.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22composeId%22%3A%22{compose_id}%22%7D%7D%7D"
-    try:
-        resp = requests.get(trpc_url, cookies=cookies, timeout=10).json()
-        return resp[0]["result"]["data"]["json"]["appName"]
-    except Exception as e:
-        print(f"Error fetching app name: {e}")
-        return None
-
-
-def update_compose_git(
-    url, cookies, compose_id, github_url, env_vars=None, ssh_key_id=None, branch="main", compose_command=None
-):
-    """Connect GitHub repo to Compose app."""
-    trpc_url = f"{url}/api/trpc/compose.update?batch=1"
-
-    json_payload = {
-        "composeId": compose_id,
-        "customGitUrl": github_url,
-        "customGitBranch": branch,
-        "sourceType": "git",
-        "composePath": "./docker-compose.yml",
-        "composeStatus": "idle",
-        "watchPaths": [],
-        "enableSubmodules": False,
-        "randomize": True,
-    }
-
-    if compose_command:
-        json_payload["command"] = compose_command
-        print(f"Setting compose command: {compose_command}")
-
-    if env_vars:
-        json_payload["env"] = env_vars
-        json_payload["envVars"] = env_vars
-    
-    if ssh_key_id:
-        json_payload["customGitSSHKeyId"] = ssh_key_id
-
-    meta_payload = {"values": {}}
-    if ssh_key_id is None:
-        meta_payload["values"]["customGitSSHKeyId"] = ["undefined"]
-
-    payload = {
-        "0": {
-            "json": json_payload,
-            "meta": meta_payload,
-        }
-    }
-    print(f"Connecting GitHub (sourceType: git): {github_url} (branch: {branch})...")
-    try:
-        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
-    except Exception as e:
-        print(f"Error updating compose git: {e}")
-
-
-def create_domain(url, cookies, compose_id, host, port, service_name):
-    """Create a domain for a Compose service."""
-    trpc_url = f"{url}/api/trpc/domain.create?batch=1"
-    payload = {
-        "0": {
-            "json": {
-                "host": host,
-                "path": "/",
-                "port": port,
-                "https": True,
-                "composeId": compose_id,
-                "serviceName": service_name,
-                "certificateType": "letsencrypt",
-                "domainType": "compose",
-            }
-        }
-    }
-    print(f"Setting up domain: {host} (service: {service_name}, port: {port})...")
-    try:
-        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
-    except Exception as e:
-        print(f"Error creating domain: {e}")
-
-
-def update_compose_file(url, cookies, compose_id, compose_content, source_type=None):
-    """Update the docker-compose.yml content for a Compose application."""
-    trpc_url = f"{url}/api/trpc/compose.update?batch=1"
-    json_data = {
-        "composeId": compose_id,
-    }
-    if compose_content is not None:
-        json_data["composeFile"] = compose_content
-    if source_type:
-        json_data["sourceType"] = source_type
-        
-    payload = {
-        "0": {
-            "json": json_data
-        }
-    }
-    print(f"Updating compose file for {compose_id} (sourceType={source_type})...")
-    try:
-        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
-    except Exception as e:
-        print(f"Error updating compose file: {e}")
-
-
-def update_compose_env(url, cookies, compose_id, env_content):
-    """Update environment variables for a Compose application."""
-    trpc_url = f"{url}/api/trpc/compose.update?batch=1"
-    payload = {
-        "0": {
-            "json": {
-                "composeId": compose_id,
-                "envVars": env_content,
-                "env": env_content
-            }
-        }
-    }
-    print(f"Updating environment variables for {compose_id}...")
-    try:
-        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
-    except Exception as e:
-        print(f"Error updating environment variables: {e}")
-
-
-def detect_env_file(app_name):
-    # 1. Try exact slugs
-    slugs = [
-        app_name.lower().replace(" ", "-"),
-        app_name.lower().replace(" ", "_"),
-        app_name.lower().replace("-", "_"),
-        app_name.lower(),
-    ]
-
-    # Get the directory where this script is located
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    search_dirs = [
-        ".",
-        "envs",
-        os.path.join(script_dir, "envs"),
-        "automation",
-        os.path.join("automation", "envs"),
-    ]
-
-    for directory in search_dirs:
-        for slug in slugs:
-            # Check for .env_<slug>
-            path = os.path.join(directory, f".env_{slug}")
-            if os.path.exists(path):
-                return path
-
-    # 2. Try keyword matching if no exact slug matches
-    # For "CP Agentic MCP Playground", keywords might be ["agentic", "mcp"]
-    keywords = [w.lower() for w in app_name.split() if len(w) > 3]
-    for directory in search_dirs:
-        try:
-            files = os.listdir(directory)
-            for f in files:
-                if f.startswith(".env_"):
-                    # Check if any keyword is in the filename
-                    for kw in keywords:
-                        if kw in f.lower():
-                            return os.path.join(directory, f)
-        except Exception:
-            continue
-
-    return None
-
-
-def deploy_compose(url, cookies, compose_id):
-    """Trigger deployment for Compose app."""
-    trpc_url = f"{url}/api/trpc/compose.deploy?batch=1"
-    payload = {"0": {"json": {"composeId": compose_id, "title": "Automated Setup"}}}
-    print(f"Triggering deployment for compose {compose_id}...")
-    try:
-        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=60)
-    except Exception as e:
-        print(f"Error deploying compose: {e}")
-
-
-def manual_git_clone_and_inject(ip_address, full_app_name, repo_url, ssh_private_path):
-    """Manually clone the repo and inject customizations via SSH."""
-    print(f"Manually cloning {repo_url} for {full_app_name}...")
-    code_dir = f"/etc/dokploy/compose/{full_app_name}/code"
-    
-    commands = [
-        f"sudo rm -rf {code_dir}",
-        f"sudo mkdir -p {code_dir}",
-        f"sudo git clone {repo_url} {code_dir}",
-        f"sudo chown -R adminuser:adminuser {code_dir}"
-    ]
-    
-    try:
-        for cmd in commands:
-            ssh_cmd = ["ssh", "-o", "StrictHostKeyChecking=no", "-i", ssh_private_path, f"adminuser@{ip_address}", cmd]
-            subprocess.run(ssh_cmd, check=True)
-            
-        # Now inject
-        inject_dev_hub_customizations(ip_address, full_app_name, ssh_private_path, wait=False)
-        return True
-    except Exception as e:
-        print(f"Error during manual clone and inject: {e}")
-        return False
-
-
-def inject_dev_hub_customizations(ip_address, full_app_name, ssh_private_path, wait=True):
-    """Inject custom UI files into the Dev-Hub deployment."""
-    print(f"Injecting Dev-Hub UI customizations for {full_app_name}...")
-    
-    directory = f"/etc/dokploy/compose/{full_app_name}/code/frontend/src/pages"
-    
-    if wait:
-        print(f"Waiting for target directory to be created: {directory}")
-        max_retries = 12
-        for i in range(max_retries):
-            check_cmd = ["ssh", "-o", "StrictHostKeyChecking=no", "-i", ssh_private_path, f"adminuser@{ip_address}", f"test -d {directory} && echo 'exists'"]
-            try:
-                result = subprocess.run(check_cmd, capture_output=True, text=True)
-                if "exists" in result.stdout:
-                    print("Directory found!")
-                    break
-            except:
-                pass
-            print(f"Waiting... ({i+1}/{max_retries})")
-            time.sleep(5)
-        else:
-            print("Timeout waiting for directory creation. Skipping injection.")
-            return
-
-    local_files = {
-        "automation/LandingPage_new.tsx": f"/etc/dokploy/compose/{full_app_name}/code/frontend/src/pages/LandingPage.tsx",
-        "automation/AppCard_new.tsx": f"/etc/dokploy/compose/{full_app_name}/code/frontend/src/components/AppCard.tsx",
-        "automation/index_update.css": f"/tmp/index_update.css"
-    }
-    
+import hashlib
+
+from dokploy_lib import history
+from dokploy_lib.state import DEFAULT_STATE_PATH, StateCache
+from dokploy_lib.compose import (
+    LOCAL_COMPOSE_PATHS,
+    extract_compose_images,
+    find_local_compose,
+    hard_inject_env_vars,
+    replace_domain,
+    sanitize_compose_file,
+    set_root_domain,
+)
+from dokploy_lib.envfiles import detect_env_file
+
+
+def ensure_requests():
+    """Ensure requests is installed (for fresh VM environments)."""
     try:
-        for local, remote in local_files.items():
-            if os.path.exists(local):
-                print(f"Uploading {local} to {remote}...")
-                scp_cmd = ["scp", "-o", "StrictHostKeyChecking=no", "-i", ssh_private_path, local, f"adminuser@{ip_address}:{remote}"]
-                subprocess.run(scp_cmd, check=True)
-        # Append CSS
-        append_css_cmd = [
-            "ssh", "-o", "StrictHostKeyChecking=no", "-i", ssh_private_path, f"adminuser@{ip_address}",
-            f"sudo bash -c 'cat /tmp/index_update.css >> /etc/dokploy/compose/{full_app_name}/code/frontend/src/index.css'"
-        ]
-        subprocess.run(append_css_cmd, check=True)
-        print("UI customizations injected successfully.")
-    except Exception as e:
-        print(f"Warning: Failed to inject UI customizations: {e}")
-
+        import requests  # noqa: F401
+    except ImportError:
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "requests"])
 
-def wait_for_server_ready(url, cookies, server_id, timeout=300):
-    """Wait for server status to become active."""
-    print(f"Waiting for server {server_id} to be active...")
-    start_time = time.time()
-    trpc_url = f"{url}/api/trpc/server.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22serverId%22%3A%22{server_id}%22%7D%7D%7D"
-    while time.time() - start_time < timeout:
-        try:
-            resp = requests.get(trpc_url, cookies=cookies, timeout=10).json()
-            status = resp[0]["result"]["data"]["json"]["serverStatus"]
-            if status == "active":
-                print("Server is active!")
-                return True
-            print(f"Server status: {status} (waiting...)")
-        except Exception as e:
-            print(f"Error checking server status: {e}")
-        time.sleep(10)
-    return False
-
-
-def sanitize_compose_file(content, app_name, app_path=None):
-    """Refined sanitization for Dokploy compatibility."""
-    import re
-    
-    # 0. Expand Tildes and standardize relative paths BEFORE volume regex
-    content = content.replace("~/.flowise", "./flowise_data")
-    content = content.replace("~/.n8n", "./n8n_data")
-    content = content.replace("~/.docker", "./docker_config")
-    content = content.replace("~/", "./")
-
-    # 1. Inject env_file: [".env"] into every service
-    lines = content.splitlines()
-    new_lines = []
-    in_services = False
-    
-    for line in lines:
-        stripped = line.strip()
-        if stripped == "services:":
-            in_services = True
-            new_lines.append(line)
-            continue
-        
-        if in_services and line.startswith("  ") and not line.startswith("    ") and stripped.endswith(":"):
-            new_lines.append(line)
-            # Add env_file right after service definition
-            indent = "    "
-            new_lines.append(f"{indent}env_file:")
-            new_lines.append(f"{indent}  - .env")
-            continue
-        
-        new_lines.append(line)
-    
-    content = "\n".join(new_lines)
-
-    # 2. Fix OLLAMA_HOST warnings (escaped $$ for Dokploy inner parser)
-    content = content.replace("@ $OLLAMA_HOST", "@ $${OLLAMA_HOST}")
-    content = content.replace("@ $$OLLAMA_HOST", "@ $${OLLAMA_HOST}")
-    content = content.replace('OLLAMA_HOST="$OLLAMA_HOST"', 'OLLAMA_HOST="$${OLLAMA_HOST}"')
-    
-    # 3. Handle Volumes and Build Contexts - Convert to Absolute
-    if app_path:
-        # Standardize relative mounts/contexts to absolute paths using regex
-        # This targets anything starting with ./ after a space, hyphen, or colon
-        content = re.sub(r'((?:^|\s+)-\s+("?))\./', rf'\1{app_path}/', content, flags=re.MULTILINE)
-        content = re.sub(r'(:)\./', f':{app_path}/', content)
-        content = re.sub(r'(context:\s+)\./', f'\\1{app_path}/', content)
-        content = re.sub(r'(env_file:\s+)\./', f'\\1{app_path}/', content)
-
-    if "Lakera" in app_name:
-        lines = content.splitlines()
-        new_lines = []
-        for line in lines:
-            if ".:/app" in line: continue
-            new_lines.append(line)
-        content = "\n".join(new_lines)
-
-    return content
-
-def hard_inject_env_vars(content, env_file_path):
-    """Replace ${VAR} and ${VAR:-default} with actual values or defaults.
-
-    Preserves $${VAR} docker-compose escape sequences (runtime variables)
-    and bare $VAR references inside shell command blocks.
-    Only replaces ${VAR} (braced form), which is the docker-compose
-    interpolation syntax for build-time substitution.
-    """
-    import re
-    if not env_file_path or not os.path.exists(env_file_path):
-        return content
 
-    env_vars = {}
-    try:
-        with open(env_file_path, "r") as f:
-            for line in f:
-                line = line.strip()
-                if "=" in line and not line.startswith("#"):
-                    k, v = line.split("=", 1)
-                    env_vars[k.strip()] = v.strip()
-    except Exception as e:
-        print(f"Warning: Could not read env file for hard injection: {e}")
-        return content
+def __getattr__(name):
+    # Keep `from dokploy_automate import create_compose` etc. working for older tools
+    import dokploy_lib
 
-    # 0. Protect $${...} and $$VAR escape sequences with placeholders.
-    #    These are docker-compose escapes meant for runtime resolution
-    #    inside containers and must NOT be replaced at build time.
-    _protected = {}
-    _counter = [0]
+    return getattr(dokploy_lib, name)
 
-    def _protect(match):
-        key = f"__DBLDOLLAR_{_counter[0]}__"
-        _protected[key] = match.group(0)
-        _counter[0] += 1
-        return key
 
-    content = re.sub(r'\$\$\{[^}]+\}', _protect, content)
-    content = re.sub(r'\$\$[A-Za-z_][A-Za-z0-9_]*', _protect, content)
-
-    # 1. First pass: Handle ${VAR:-default}
-    def resolve_default(match):
-        var_name = match.group(1)
-        default_val = match.group(2)
-        return env_vars.get(var_name, default_val)
-
-    content = re.sub(r'\$\{([^}:-]+):-([^}]*)\}', resolve_default, content)
-
-    # 2. Second pass: Handle ${VAR} (braced form only)
-    #    We intentionally do NOT replace bare $VAR because those are
-    #    shell variable references inside command: blocks.
-    for k in sorted(env_vars.keys(), key=len, reverse=True):
-        v = env_vars[k]
-        content = content.replace(f"${{{k}}}", v)
-
-    # 3. Third pass: Clean up remaining unresolved ${VAR} patterns
-    def cleanup_unresolved(match):
-        print(f"DEBUG: Resolving empty variable {match.group(0)}")
-        return ""
-
-    content = re.sub(r'\$\{[^}]+\}', cleanup_unresolved, content)
-
-    # 4. Restore protected double-dollar escape sequences
-    for key, original in _protected.items():
-        content = content.replace(key, original)
-
-    return content
-
-if __name__ == "__main__":
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Automate Dokploy setup with Compose and Domains"
     )
@@ -966,134 +68,180 @@ if __name__ == "__main__":
         help="Delete existing project before starting (Fresh Rebuild)",
     )
     parser.add_argument("--app", help="Filter: Only process this specific app name")
+    parser.add_argument(
+        "--retain-volumes",
+        action="store_true",
+        help="Rebuild mode: keep the Docker volumes selected by each app's `volumes` rules and reattach them to the recreated services",
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="Keep the environment and redeploy only apps that failed or whose config, env file, compose file or git commit changed",
+    )
     parser.add_argument("--ssh-user", default="adminuser", help="SSH Username (default: adminuser)")
+    parser.add_argument(
+        "--wait-deploy",
+        action="store_true",
+        help="Wait for triggered deployments to finish and record their durations",
+    )
+    parser.add_argument(
+        "--failure-pattern",
+        action="append",
+        help="Extra regex that marks a deployment failed as soon as it appears in the build log (repeatable)",
+    )
+    parser.add_argument("--deploy-retries", type=int, default=0, help="Redeploy an app this many times after a failed build (default: 0)")
+    parser.add_argument("--no-log-tail", action="store_true", help="With --wait-deploy, only poll deployment status instead of streaming build logs")
+    parser.add_argument(
+        "--extra-ip",
+        action="append",
+        help="Additional VM IP to register as a deploy server for app placement (repeatable)",
+    )
+    parser.add_argument(
+        "--acme-backup-dir",
+        default=None,
+        help="Where Traefik's ACME certificates are backed up between rebuilds (default: ~/.dokploy_acme)",
+    )
+    parser.add_argument("--no-acme-restore", action="store_true", help="Do not back up or restore Traefik ACME certificates")
+    parser.add_argument(
+        "--no-admission-control",
+        action="store_true",
+        help="Trigger all deployments back to back instead of when the server has headroom",
+    )
+    parser.add_argument(
+        "--admission-timeout",
+        type=int,
+        default=1800,
+        help="Longest wait (s) for headroom before a deployment is triggered anyway (default: 1800)",
+    )
+    parser.add_argument(
+        "--build-cache-cap",
+        default="20GB",
+        help="Size the deploy servers' BuildKit layer cache is trimmed to before building (default: 20GB)",
+    )
+    parser.add_argument(
+        "--no-build-cache",
+        action="store_true",
+        help="Leave Dokploy's Docker cleanup and the build cache as they are",
+    )
+    parser.add_argument(
+        "--gc-threshold",
+        type=int,
+        default=80,
+        help="Collect Docker garbage on a server whose Docker disk is at least this %% full (default: 80)",
+    )
+    parser.add_argument("--gc-keep-images", type=int, default=2, help="Images kept per repository by the Docker GC (default: 2)")
+    parser.add_argument("--no-docker-gc", action="store_true", help="Do not measure Docker disk usage or collect garbage")
+    parser.add_argument(
+        "--no-port-check",
+        action="store_true",
+        help="Do not check the apps' host ports for conflicts before deploying",
+    )
+    parser.add_argument(
+        "--registry-mirror",
+        action="store_true",
+        help="Run pull-through cache registries for Docker Hub and GHCR on each server and pull through them",
+    )
+    parser.add_argument(
+        "--lint",
+        action="store_true",
+        help="Lint every app's rendered compose file first and stop on errors (see `dokploy_automate.py lint`)",
+    )
+    parser.add_argument("--no-prepull", action="store_true", help="Do not pre-pull compose images on the VM")
+    parser.add_argument("--prepull-parallel", type=int, default=4, help="Concurrent image pulls during pre-pull (default: 4)")
+    parser.add_argument("--history-db", default=history.DEFAULT_DB_PATH, help="Run history SQLite database")
+    parser.add_argument("--no-history", action="store_true", help="Do not record this run in the history database")
+    parser.add_argument("--state-file", default=DEFAULT_STATE_PATH, help="Cache of session and resource IDs between runs")
+    parser.add_argument("--no-state-cache", action="store_true", help="Look everything up again instead of using the state cache")
 
-    args = parser.parse_args()
-    url = args.url.rstrip("/")
-    ip_address = args.ip or url.split("//")[-1].split(":")[0]
-    root_domain = args.domain
-
-    # Update environment with domain
-    os.environ["DOMAIN"] = root_domain
-
-    def replace_domain(content):
-        if content is None: return None
-        if isinstance(content, str):
-            return content.replace("{{DOMAIN}}", root_domain)
-        if isinstance(content, list):
-            return [replace_domain(i) for i in content]
-        if isinstance(content, dict):
-            return {k: replace_domain(v) for k, v in content.items()}
-        return content
-
-    # Helper to find local env files
-    def find_env_file(app_name):
-        slugs = [
-            app_name.lower().replace(" ", "-"),
-            app_name.lower().replace(" ", "_"),
-            app_name.lower(),
-            "agentic" if "agentic" in app_name.lower() else None,
-            "dev-hub" if "dev hub" in app_name.lower() else None,
-        ]
-        slugs = [s for s in slugs if s]
-        search_dirs = [".", "automation", "automation/envs", "envs"]
-        for directory in search_dirs:
-            for slug in slugs:
-                path = os.path.join(directory, f".env_{slug}")
-                if os.path.exists(path):
-                    return path
-        return None
-
-    # Helper to copy env file to remote
-    def copy_env_file_to_remote(local_path, remote_ip, app_slug):
-        try:
-            target_path = f"/etc/dokploy/compose/{app_slug}/code/.env"
-            print(f"Ensuring {target_path} on {remote_ip}...")
-            
-            # Check if we're running locally on the target VM
-            is_local = False
-            try:
-                import socket
-                hostname = os.uname()[1] if hasattr(os, 'uname') else socket.gethostname()
-                # Simple check: if ip is reachable on loopback or matches hostname/etc
-                # But safer to just check if the directory exists locally
-                if os.path.exists(f"/etc/dokploy/compose/{app_slug}"):
-                    is_local = True
-            except:
-                pass
-
-            if is_local:
-                print(f"Detected local execution. Copying {local_path} to {target_path}...")
-                subprocess.run(["sudo", "mkdir", "-p", os.path.dirname(target_path)], check=True)
-                subprocess.run(["sudo", "cp", local_path, target_path], check=True)
-                subprocess.run(["sudo", "chown", "root:root", target_path], check=True)
-                subprocess.run(["sudo", "chmod", "644", target_path], check=True)
-            else:
-                # Ensure remote directory exists
-                remote_dir = os.path.dirname(target_path)
-                ssh_mkdir = [
-                    "ssh", "-o", "StrictHostKeyChecking=no", "-i", ssh_private_path,
-                    f"{ssh_user}@{remote_ip}", f"sudo mkdir -p {remote_dir} && sudo chown {ssh_user}:{ssh_user} {remote_dir}"
-                ]
-                subprocess.run(ssh_mkdir, check=True)
-
-                scp_cmd = [
-                    "scp", "-o", "StrictHostKeyChecking=no", "-i", ssh_private_path,
-                    local_path, f"{ssh_user}@{remote_ip}:{target_path}"
-                ]
-                subprocess.run(scp_cmd, check=True)
-                # Fix permissions
-                ssh_cmd = [
-                    "ssh", "-o", "StrictHostKeyChecking=no", "-i", ssh_private_path,
-                    f"{ssh_user}@{remote_ip}",
-                    f"sudo chown root:root {target_path} && sudo chmod 644 {target_path}"
-                ]
-                subprocess.run(ssh_cmd, check=True)
-            print("Env file copied successfully.")
-        except Exception as e:
-            print(f"Error copying env file: {e}")
-    import os
+    return parser
 
-    ssh_private_path = os.path.expanduser(args.ssh_private)
-    ssh_public_path = os.path.expanduser(args.ssh_public)
-    ssh_user = args.ssh_user
 
-    if not os.path.exists(ssh_private_path) or not os.path.exists(ssh_public_path):
-        print(f"Error: SSH keys not found at {ssh_private_path} or {ssh_public_path}")
-        sys.exit(1)
+def bootstrap(args, url, server_ips, ssh_user, ssh_private_path, ssh_public_path, app_configs, state):
+    """Log in and prepare servers, Git key, project and app inputs as a step graph.
 
-    # Load Config
-    try:
-        with open(args.config, "r") as f:
-            app_configs = json.load(f)
-    except Exception as e:
-        print(f"Error loading config file {args.config}: {e}")
-        sys.exit(1)
+    Only configuring the apps needs the deploy servers to be active, so Git key
+    registration, project discovery/cleanup and reading the env and compose
+    files all run while Dokploy is still setting up the servers. The session,
+    organization and Git key ID are reused from `state` when still valid.
+    """
+    from concurrent.futures import ThreadPoolExecutor
 
-    if wait_for_dokploy(url):
+    import requests
+    from dokploy_lib.api import (
+        SERVER_FIELDS,
+        api_request,
+        create_project,
+        delete_all_services,
+        delete_project,
+        find_project,
+        find_ssh_key,
+        get_all_compose_ids,
+        get_all_project_ids,
+        get_environment_id,
+        get_organization_id,
+        list_ssh_keys,
+        login,
+        register_admin,
+        reload_traefik,
+        set_docker_cleanup,
+        setup_ssh_and_server,
+        wait_for_server_ready,
+    )
+    from dokploy_lib.acme import backup_acme, backup_path, configured_domains, restore_acme
+    from dokploy_lib.admission import app_memory_usage
+    from dokploy_lib.buildcache import retain_build_cache
+    from dokploy_lib.dockergc import collect_garbage, describe_gc
+    from dokploy_lib.changes import remote_git_heads
+    from dokploy_lib.pipeline import run_graph
+    from dokploy_lib.ports import build_port_index, cleanup_ports, rendered_composes
+    from dokploy_lib.ssh import force_cleanup_ports
+    from dokploy_lib.trpc import trpc_data
+    from dokploy_lib.volumes import release_volumes
+
+    # Composes removed by the purge/cleanup steps, for volume retention
+    deleted_composes = []
+
+    def do_login(results):
+        cached = state.get("session")
+        if cached and cached["email"] == args.email:
+            # One call both validates the cached session and yields the organization
+            org_id = get_organization_id(url, cached["cookies"])
+            if org_id:
+                print(f"Reusing cached session for {args.email}")
+                state.set("organization", org_id)
+                return cached["cookies"]
+            # Expired, or Dokploy was reinstalled: none of the cached IDs can be trusted
+            state.clear()
         register_admin(url, args.email, args.password)
         cookies = login(url, args.email, args.password)
         if not cookies:
             sys.exit(1)
+        cookies = requests.utils.dict_from_cookiejar(cookies)
+        state.set("session", {"email": args.email, "cookies": cookies})
+        return cookies
 
-        # Organization
-        trpc_url_org_all = f"{url}/api/trpc/organization.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
-        org_data = requests.get(trpc_url_org_all, cookies=cookies).json()
-        try:
-            org_id = org_data[0]["result"]["data"]["json"][0]["id"]
+    def do_organization(results):
+        org_id = state.get("organization")
+        if org_id:
             print(f"Using Organization ID: {org_id}")
-        except (IndexError, KeyError, TypeError):
-            print(f"Error fetching Organization ID. Response: {org_data}")
+            return org_id
+        org_id = get_organization_id(url, results["login"])
+        if not org_id:
             sys.exit(1)
+        print(f"Using Organization ID: {org_id}")
+        state.set("organization", org_id)
+        return org_id
 
-        # Server Management
+    def do_server_setup(results):
+        cookies, org_id = results["login"], results["organization"]
         trpc_url_srv_all = f"{url}/api/trpc/server.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
-        srv_data = requests.get(trpc_url_srv_all, cookies=cookies).json()
-        servers = srv_data[0].get("result", {}).get("data", {}).get("json", [])
+        try:
+            servers = trpc_data(api_request("GET", trpc_url_srv_all, cookies=cookies), SERVER_FIELDS) or []
+        except (ValueError, KeyError, IndexError, TypeError):
+            servers = []
+
+        needs_setup = []
 
-        server_id = None
-        needs_setup = False
-        
         # In clean mode, delete existing servers and start fresh to ensure SSH keys are valid
         if args.clean and servers:
             print("Clean mode: Deleting existing servers to reset SSH keys...")
@@ -1104,7 +252,7 @@ if __name__ == "__main__":
                     try:
                         trpc_url_srv_del = f"{url}/api/trpc/server.remove?batch=1"
                         del_payload = {"0": {"json": {"serverId": sid}}}
-                        resp = requests.post(trpc_url_srv_del, json=del_payload, cookies=cookies, timeout=30)
+                        resp = api_request("POST", trpc_url_srv_del, json=del_payload, cookies=cookies, timeout=30)
                         if resp.status_code == 200:
                             print(f"    Server {sid} deleted.")
                         else:
@@ -1113,125 +261,153 @@ if __name__ == "__main__":
                         print(f"    Warning: Could not delete server {sid}: {e}")
             servers = []  # Force re-creation
             time.sleep(2)
-        
-        if servers:
-            existing_srv = servers[0]
-            # Verify if the existing server is actually setup with root (to avoid permission errors)
-            if existing_srv.get("username") == "root" and existing_srv.get("sshKeyId"):
-                server_id = existing_srv["serverId"]
+
+        # One deploy server per requested IP (primary --ip first, then --extra-ip)
+        valid_servers = [s for s in servers if s.get("username") == "root" and s.get("sshKeyId")]
+        deploy_servers = []
+        for idx, srv_ip in enumerate(server_ips):
+            existing_srv = next((s for s in valid_servers if s.get("ipAddress") == srv_ip), None)
+            if not existing_srv and idx == 0 and servers:
+                # Primary: fall back to the first registered server, if it is usable
+                existing_srv = servers[0] if servers[0] in valid_servers else None
+                if not existing_srv:
+                    print(
+                        f"Existing server {servers[0]['name']} is not root or has no key. Forcing new setup..."
+                    )
+            if existing_srv:
                 print(
-                    f"Using existing root server: {existing_srv['name']} ({server_id})"
+                    f"Using existing root server: {existing_srv['name']} ({existing_srv['serverId']})"
                 )
+                deploy_servers.append(dict(existing_srv, ipAddress=srv_ip))
+                continue
+            new_id = setup_ssh_and_server(url, cookies, srv_ip, org_id, username=ssh_user, key_path=ssh_private_path)
+            if new_id:
+                needs_setup.append(new_id)
+                deploy_servers.append({"serverId": new_id, "name": srv_ip, "ipAddress": srv_ip})
+            elif idx == 0:
+                break  # Without the primary server there is nothing to deploy to
             else:
-                print(
-                    f"Existing server {existing_srv['name']} is not root or has no key. Forcing new setup..."
-                )
-                needs_setup = True
-                server_id = setup_ssh_and_server(url, cookies, ip_address, org_id, username=ssh_user)
-        else:
-            needs_setup = True
-            server_id = setup_ssh_and_server(url, cookies, ip_address, org_id, username=ssh_user)
+                print(f"Warning: Server setup failed for {srv_ip}; leaving it out of placement.")
 
-        if not server_id:
+        if not deploy_servers:
             print("Critical: No server available or server setup failed.")
             sys.exit(1)
+        return deploy_servers, needs_setup
 
-        if needs_setup:
-            wait_for_server_ready(url, cookies, server_id)
+    def do_server_ready(results):
+        deploy_servers, needs_setup = results["server_setup"]
+        cookies = results["login"]
+        for new_id in needs_setup:
+            wait_for_server_ready(url, cookies, new_id, interval=3)
+        return deploy_servers
 
-        print(f"Final Server ID for deployment: {server_id}")
-
-        # Git SSH Key Registration
+    def do_git_ssh_key(results):
+        cookies, org_id = results["login"], results["organization"]
         git_ssh_key_id = None
         try:
             with open(ssh_private_path, "r") as f:
                 user_private_key = f.read()
             with open(ssh_public_path, "r") as f:
                 user_public_key = f.read()
-
-            print("Registering User SSH Key in Dokploy for Git...")
-            trpc_url_key = f"{url}/api/trpc/sshKey.create?batch=1"
-            payload_git_key = {
-                "0": {
-                    "json": {
-                        "name": "UserGitHubKey",
-                        "description": "User's local SSH key for Git",
-                        "privateKey": user_private_key,
-                        "publicKey": user_public_key,
-                        "organizationId": org_id,
+            public_key_hash = hashlib.sha256(user_public_key.strip().encode()).hexdigest()[:16]
+
+            # The listing validates a cached ID: the record may have been deleted since
+            keys = list_ssh_keys(url, cookies)
+            cached = state.get("git_ssh_key")
+            if cached and cached["public_key"] == public_key_hash and keys is not None:
+                if any(k["sshKeyId"] == cached["id"] for k in keys):
+                    print(f"Git SSH Key ID: {cached['id']} (cached)")
+                    return cached["id"]
+                print(f"Cached Git SSH Key {cached['id']} no longer exists; looking it up again")
+                state.invalidate("git_ssh_key")
+
+            # Reuse the record of an earlier run instead of piling up duplicates
+            git_ssh_key_id = find_ssh_key(url, cookies, "UserGitHubKey", user_public_key, keys=keys)
+            if not git_ssh_key_id:
+                print("Registering User SSH Key in Dokploy for Git...")
+                trpc_url_key = f"{url}/api/trpc/sshKey.create?batch=1"
+                payload_git_key = {
+                    "0": {
+                        "json": {
+                            "name": "UserGitHubKey",
+                            "description": "User's local SSH key for Git",
+                            "privateKey": user_private_key,
+                            "publicKey": user_public_key,
+                            "organizationId": org_id,
+                        }
                     }
                 }
-            }
-            requests.post(
-                trpc_url_key, json=payload_git_key, cookies=cookies, timeout=30
-            )
-
-            # Fetch the ID
-            trpc_url_all_keys = f"{url}/api/trpc/sshKey.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
-            resp_all = requests.get(trpc_url_all_keys, cookies=cookies, timeout=30)
-            keys_list = resp_all.json()[0]["result"]["data"]["json"]
-            git_ssh_key_id = next(
-                (k["sshKeyId"] for k in keys_list if k["name"] == "UserGitHubKey"), None
-            )
+                api_request(
+                    "POST", trpc_url_key, json=payload_git_key, cookies=cookies, timeout=30
+                )
+                git_ssh_key_id = find_ssh_key(url, cookies, "UserGitHubKey", user_public_key)
             print(f"Git SSH Key ID: {git_ssh_key_id}")
+            if git_ssh_key_id:
+                state.set("git_ssh_key", {"id": git_ssh_key_id, "public_key": public_key_hash})
         except Exception as e:
             print(f"Warning: Could not register user SSH key for Git: {e}")
+        return git_ssh_key_id
+
+    def do_project_discovery(results):
+        if args.clean:
+            return get_all_project_ids(url, results["login"])  # Every project is purged
+        return find_project(url, results["login"], args.project)
+
+    def do_clean_purge(results):
+        cookies = results["login"]
+        all_projects = results["project_discovery"]
+        if not all_projects:
+            return []
+        print(
+            f"Clean mode: Found {len(all_projects)} total projects. Deleting ALL to ensure fresh state..."
+        )
+        for pid, eids, pname in all_projects:
+            print(f"Purging project: {pname} ({pid})...")
+            for eid in eids:
+                print(f"  Cleaning environment: {eid}")
+                deleted_composes.extend(
+                    delete_all_services(url, cookies, eid, delete_volumes=not args.retain_volumes)
+                )
+                time.sleep(1)  # Small delay between environment cleanups
+
+            # Delete the project with verification
+            success = delete_project(url, cookies, pid)
+            if not success:
+                print(f"WARNING: Project {pname} may not have been deleted. Attempting force cleanup...")
+                # Try one more time after a delay
+                time.sleep(3)
+                delete_project(url, cookies, pid)
+
+            time.sleep(2)  # Wait between project deletions
+
+        # Verify all projects are deleted
+        print("Verifying project deletion...")
+        time.sleep(3)
+        remaining = get_all_project_ids(url, cookies, with_env_ids=False)
+        if remaining:
+            print(f"WARNING: {len(remaining)} projects still exist after cleanup: {[p[2] for p in remaining]}")
+            print("Attempting second pass deletion...")
+            for pid, eids, pname in remaining:
+                print(f"Force deleting: {pname}")
+                delete_project(url, cookies, pid)
+                time.sleep(2)
 
-        all_projects = get_all_project_ids(url, cookies)
+        # Aggressive cleanup via SSH of every host port the apps publish
+        print("Performing NUCLEAR Docker cleanup via SSH for known ports...")
+        ports_to_clean = cleanup_ports(results["port_index"]["claims"])
+        for srv_ip in server_ips:
+            force_cleanup_ports(srv_ip, ssh_user, ssh_private_path, ports_to_clean)
 
+        print("Waiting for Dokploy to stabilize...")
+        time.sleep(10)
+        return []
+
+    def do_project(results):
+        cookies, org_id = results["login"], results["organization"]
+        all_projects = results["clean_purge"] if args.clean else results["project_discovery"]
         project_id = None
         env_id = None
 
-        if args.clean and all_projects:
-            print(
-                f"Clean mode: Found {len(all_projects)} total projects. Deleting ALL to ensure fresh state..."
-            )
-            for pid, eids, pname in all_projects:
-                print(f"Purging project: {pname} ({pid})...")
-                for eid in eids:
-                    print(f"  Cleaning environment: {eid}")
-                    delete_all_services(url, cookies, eid)
-                    time.sleep(1)  # Small delay between environment cleanups
-                
-                # Delete the project with verification
-                success = delete_project(url, cookies, pid)
-                if not success:
-                    print(f"WARNING: Project {pname} may not have been deleted. Attempting force cleanup...")
-                    # Try one more time after a delay
-                    time.sleep(3)
-                    delete_project(url, cookies, pid)
-                
-                time.sleep(2)  # Wait between project deletions
-
-            # Verify all projects are deleted
-            print("Verifying project deletion...")
-            time.sleep(3)
-            remaining = get_all_project_ids(url, cookies)
-            if remaining:
-                print(f"WARNING: {len(remaining)} projects still exist after cleanup: {[p[2] for p in remaining]}")
-                print("Attempting second pass deletion...")
-                for pid, eids, pname in remaining:
-                    print(f"Force deleting: {pname}")
-                    delete_project(url, cookies, pid)
-                    time.sleep(2)
-
-            # Aggressive cleanup via SSH
-            print("Performing NUCLEAR Docker cleanup via SSH for known ports...")
-            ports_to_clean = [
-                3000, 80, 443,      # Dokploy/Traefik
-                5678,               # n8n
-                3020,               # Flowise
-                7860,               # Langflow
-                9000, 6380, 8082,   # Lakera (Web, Redis, Redis-Commander)
-                9090, 8085, 5433,   # Training Portal
-                9482                # Swagger
-            ]
-            force_cleanup_ports(ip_address, ssh_user, ssh_private_path, ports_to_clean)
-
-            print("Waiting for Dokploy to stabilize...")
-            time.sleep(10)
-            all_projects = []
-
         # Find or create our target project
         existing_target = [p for p in all_projects if p[2] == args.project]
         if existing_target:
@@ -1242,7 +418,7 @@ if __name__ == "__main__":
                 env_id = env_ids[0]
             else:
                 env_id = env_ids if env_ids else None
-                
+
             if not env_id:
                 print(f"Warning: env_id is null for project {args.project}. Fetching manually...")
                 env_id = get_environment_id(url, cookies, project_id)
@@ -1253,147 +429,638 @@ if __name__ == "__main__":
             print(f"CRITICAL: Failed to establish project/environment context. project_id={project_id}, env_id={env_id}")
             sys.exit(1)
 
-        if not args.app:
-            print("Cleaning up existing deployments...")
-            delete_all_services(url, cookies, env_id)
+        with history.phase("cleanup_services"):
+            if not args.app and not args.changed_only:
+                print("Cleaning up existing deployments...")
+                deleted_composes.extend(
+                    delete_all_services(url, cookies, env_id, delete_volumes=not args.retain_volumes)
+                )
 
         # Fetch existing apps in the environment
         existing_apps = get_all_compose_ids(url, cookies, env_id)
-        
+        # appNames of deleted composes are of no further use
+        state.prune("compose:", {a["composeId"] for a in existing_apps})
+        # ... and a cached appName the listing contradicts is stale
+        for app in existing_apps:
+            cached = state.get(f"compose:{app['composeId']}")
+            if cached and app.get("appName") and cached["appName"] != app["appName"]:
+                state.invalidate(f"compose:{app['composeId']}")
+        return project_id, env_id, existing_apps
+
+    def do_app_inputs(results):
+        # Env files and the locally rendered compose file, ready before any app is touched
+        inputs = {}
         for cfg_raw in app_configs:
             cfg = replace_domain(cfg_raw)
-            if args.app and args.app.lower() not in cfg["name"].lower():
-                print(f"Skipping {cfg['name']} (filter: {args.app})")
-                continue
+            env_file = detect_env_file(cfg["name"])
+            env_content = None
+            if env_file:
+                print(f"Found environment file for {cfg['name']}: {env_file}")
+                try:
+                    with open(env_file, "r") as f:
+                        env_content = replace_domain(f.read())
+                except Exception as e:
+                    print(f"Warning: Could not read env file {env_file}: {e}")
+
+            compose_content = None
+            if "Agentic" in cfg["name"] or "Playground" in cfg["name"]:
+                local_compose = find_local_compose(cfg["name"])
+                if local_compose:
+                    print(f"Found local compose file at: {local_compose}")
+                    try:
+                        with open(local_compose, "r") as f:
+                            # 1. Replace {{DOMAIN}}
+                            compose_content = replace_domain(f.read())
+                        # 2. Hard-inject environment variables to avoid ports issues
+                        if env_file:
+                            compose_content = hard_inject_env_vars(compose_content, env_file)
+                    except Exception as e:
+                        print(f"Warning: Could not render local compose file {local_compose}: {e}")
+                else:
+                    print(f"Warning: Could not find local compose file for {cfg['name']}. Tried: {LOCAL_COMPOSE_PATHS}")
+
+            inputs[cfg["name"]] = {
+                "env_file": env_file,
+                "env_content": env_content,
+                "compose_content": compose_content,
+            }
+        return inputs
+
+    def do_volume_retention(results):
+        deploy_servers, _ = results["server_setup"]
+        return release_volumes(
+            deleted_composes,
+            [replace_domain(c) for c in app_configs],
+            {srv["serverId"]: srv["ipAddress"] for srv in deploy_servers},
+            server_ips[0], ssh_user, ssh_private_path,
+        )
 
-            # Check if exists
-            target_app = next((a for a in existing_apps if a["name"] == cfg["name"]), None)
-            
-            if target_app:
-                cid = target_app["composeId"]
-                print(f"Using existing compose application: {cfg['name']} ({cid})")
-            else:
-                cid = create_compose(
-                    url, cookies, project_id, env_id, cfg["name"], server_id
-                )
-            if cid:
-                repo_url = cfg["repo"]
-                ssh_key_to_use = git_ssh_key_id
+    def do_acme_backup(results):
+        # Before anything is purged: a clean rebuild recreates Traefik
+        return backup_acme(
+            server_ips, ssh_user, ssh_private_path, backup_path(args.domain, args.acme_backup_dir)
+        )
 
-                if repo_url.startswith("https://"):
-                    print(
-                        f"Detected HTTPS URL for {cfg['name']}, skipping SSH key attachment."
+    def do_acme_restore(results):
+        cookies, deploy_servers = results["login"], results["server_ready"]
+        domains = configured_domains([replace_domain(c) for c in app_configs])
+        written = restore_acme(
+            [s["ipAddress"] for s in deploy_servers], ssh_user, ssh_private_path,
+            results["acme_backup"], domains,
+        )
+        for srv in deploy_servers:
+            if srv["ipAddress"] in written:
+                print(f"Reloading Traefik on {srv['ipAddress']} to pick up restored certificates...")
+                reload_traefik(url, cookies, srv["serverId"])
+        return written
+
+    def do_port_index(results):
+        # Host ports each app's compose (as it will be deployed) and config publish
+        configs = [replace_domain(c) for c in app_configs]
+        composes = rendered_composes(configs, results["app_inputs"])
+        claims, unknown = build_port_index(configs, composes)
+        print(f"Port index: {len({c['port'] for c in claims})} host port(s) claimed by {len({c['app'] for c in claims})} app(s)")
+        if unknown:
+            print(f"Warning: Compose file unavailable, only hostPort known for: {', '.join(unknown)}")
+        # The images the apps will run, which the Docker GC must leave alone (and the pre-pull fetches)
+        images = sorted({
+            image for cfg in configs
+            for image in cfg.get("images", []) + extract_compose_images(composes.get(cfg["name"]) or "", cfg.get("composeCommand"))
+        })
+        return {"claims": claims, "unknown": unknown, "images": images}
+
+    def do_app_footprints(results):
+        # What the running apps use, before any purge: learned footprints for admission control
+        names = [c["name"] for c in app_configs]
+        with ThreadPoolExecutor(max_workers=len(server_ips)) as pool:
+            measured = list(pool.map(lambda ip: app_memory_usage(ip, ssh_user, ssh_private_path, names), server_ips))
+        footprints = {}
+        for usage in measured:
+            for name, memory_mb in usage.items():
+                footprints[name] = max(footprints.get(name, 0.0), memory_mb)
+        recorder = history.active()
+        for name, memory_mb in footprints.items():
+            print(f"Footprint: {name} uses {memory_mb:.0f}MB")
+            if recorder:
+                recorder.record_footprint(name, memory_mb)
+        return footprints
+
+    def do_build_cache(results):
+        # Dokploy's cleanup prunes the whole builder cache; keep it, capped, instead
+        cookies, deploy_servers = results["login"], results["server_ready"]
+        for srv in deploy_servers:
+            set_docker_cleanup(url, cookies, False, srv["serverId"])
+        with ThreadPoolExecutor(max_workers=len(deploy_servers)) as pool:
+            sizes = list(pool.map(
+                lambda srv: retain_build_cache(srv["ipAddress"], ssh_user, ssh_private_path, args.build_cache_cap),
+                deploy_servers,
+            ))
+        for srv, size in zip(deploy_servers, sizes):
+            if size is not None:
+                print(f"Build cache on {srv['ipAddress']}: {size:.0f}MB (cap {args.build_cache_cap})")
+        return dict(zip([srv["serverId"] for srv in deploy_servers], sizes))
+
+    def do_docker_gc(results):
+        # Disk-pressure-aware maintenance before anything is built
+        deploy_servers = results["server_ready"]
+        cache_cap = None if args.no_build_cache else args.build_cache_cap
+        with ThreadPoolExecutor(max_workers=len(deploy_servers)) as pool:
+            reports = list(pool.map(
+                lambda srv: collect_garbage(
+                    srv["ipAddress"], ssh_user, ssh_private_path, args.gc_threshold, args.gc_keep_images, cache_cap,
+                    protected=results["port_index"]["images"],
+                ),
+                deploy_servers,
+            ))
+        gc = {}
+        for srv, report in zip(deploy_servers, reports):
+            if report is not None:
+                print(describe_gc(srv["ipAddress"], report))
+                gc[srv["ipAddress"]] = report
+        recorder = history.active()
+        if recorder and gc:
+            recorder.meta["docker_gc"] = {
+                ip: {"reason": r["reason"], "reclaimed": r["reclaimed"], "seconds": round(r["seconds"], 1)}
+                for ip, r in gc.items()
+            }
+        return gc
+
+    def do_git_heads(results):
+        return remote_git_heads([replace_domain(c) for c in app_configs], key_path=ssh_private_path)
+
+    steps = {
+        "login": ((), do_login),
+        "organization": (("login",), do_organization),
+        "server_setup": (("organization",), do_server_setup),
+        "server_ready": (("server_setup",), do_server_ready),
+        "git_ssh_key": (("organization",), do_git_ssh_key),
+        "project_discovery": (("login",), do_project_discovery),
+        "project": (("organization", "project_discovery"), do_project),
+        "app_inputs": ((), do_app_inputs),
+        "port_index": (("app_inputs",), do_port_index),
+        "git_heads": ((), do_git_heads),
+    }
+    if args.clean:
+        # Servers are reset before projects are purged, as in a sequential run
+        steps["clean_purge"] = (("project_discovery", "server_setup", "port_index"), do_clean_purge)
+        steps["project"] = (("organization", "clean_purge"), do_project)
+    if not args.no_acme_restore:
+        steps["acme_backup"] = ((), do_acme_backup)
+        restore_deps = ("login", "server_ready", "acme_backup")
+        if args.clean:
+            steps["server_setup"] = (("organization", "acme_backup"), do_server_setup)
+            restore_deps += ("clean_purge",)
+        steps["acme_restore"] = (restore_deps, do_acme_restore)
+    if args.retain_volumes:
+        steps["volume_retention"] = (("project", "server_setup"), do_volume_retention)
+    if not args.no_build_cache:
+        steps["build_cache"] = (("login", "server_ready"), do_build_cache)
+    if not args.no_docker_gc:
+        gc_deps = ("server_ready", "port_index")
+        if args.clean:
+            gc_deps += ("clean_purge",)  # Purged apps leave their containers and images behind
+        if "build_cache" in steps:
+            gc_deps += ("build_cache",)
+        steps["docker_gc"] = (gc_deps, do_docker_gc)
+    if not args.no_admission_control:
+        steps["app_footprints"] = ((), do_app_footprints)
+        if args.clean:
+            steps["clean_purge"] = (steps["clean_purge"][0] + ("app_footprints",), do_clean_purge)
+    return run_graph(steps, label="bootstrap")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "history":
+        return history.main(argv[1:])
+    if argv and argv[0] == "fleet":
+        from dokploy_lib import fleet
+
+        return fleet.main(argv[1:])
+    if argv and argv[0] == "logs":
+        from dokploy_lib import logbundle
+
+        return logbundle.main(argv[1:])
+    if argv and argv[0] == "lint":
+        from dokploy_lib import lint
+
+        return lint.main(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.clean and args.changed_only:
+        parser.error("--changed-only cannot be combined with --clean")
+
+    print("DEBUG: Script started...")
+    ensure_requests()
+    from concurrent.futures import ThreadPoolExecutor
+
+    from dokploy_lib.api import (
+        create_compose,
+        deploy_compose,
+        get_compose,
+        sync_domains,
+        update_compose_description,
+        update_compose_env,
+        update_compose_file,
+        update_compose_git,
+        wait_for_dokploy,
+    )
+    from dokploy_lib.buildcache import format_ratio
+    from dokploy_lib.changes import (
+        FAILED_MARKER,
+        FINGERPRINT_PREFIX,
+        PENDING_MARKER,
+        app_fingerprint,
+        redeploy_reason,
+    )
+    from dokploy_lib.deploylogs import compile_failure_patterns, watch_deployments
+    from dokploy_lib.pipeline import run_graph
+    from dokploy_lib.admission import AdmissionController, app_footprint, server_budget
+    from dokploy_lib.mirror import describe_stats, mirror_stats, start_registry_mirrors, stats_delta
+    from dokploy_lib.placement import FALLBACK_CAPACITY, plan_placement
+    from dokploy_lib.ports import find_port_conflicts, port_snapshot
+    from dokploy_lib.prepull import finish_image_prepull, start_image_prepull
+    from dokploy_lib.ssh import (
+        copy_env_file_to_remote,
+        manual_git_clone_and_inject,
+        sample_server_resources,
+    )
+    from dokploy_lib.volumes import reattach_volumes
+
+    url = args.url.rstrip("/")
+    ip_address = args.ip or url.split("//")[-1].split(":")[0]
+    server_ips = [ip_address] + [ip for ip in (args.extra_ip or []) if ip != ip_address]
+    root_domain = args.domain
+
+    # Update environment with domain
+    os.environ["DOMAIN"] = root_domain
+    set_root_domain(root_domain)
+
+    ssh_private_path = os.path.expanduser(args.ssh_private)
+    ssh_public_path = os.path.expanduser(args.ssh_public)
+    ssh_user = args.ssh_user
+
+    if not os.path.exists(ssh_private_path) or not os.path.exists(ssh_public_path):
+        print(f"Error: SSH keys not found at {ssh_private_path} or {ssh_public_path}")
+        sys.exit(1)
+
+    # Load Config
+    try:
+        with open(args.config, "r") as f:
+            app_configs = json.load(f)
+    except Exception as e:
+        print(f"Error loading config file {args.config}: {e}")
+        sys.exit(1)
+
+    if args.lint:
+        # Pre-flight: compose mistakes stop the run before Dokploy is touched
+        from dokploy_lib.lint import lint_apps, print_report
+
+        report = lint_apps(
+            [c for c in app_configs if not args.app or args.app.lower() in c["name"].lower()], root_domain
+        )
+        print_report(report)
+        if report["errors"]:
+            print("Error: Compose lint failed; fix the findings above or run without --lint")
+            sys.exit(1)
+
+    recorder = None
+    if not args.no_history:
+        recorder = history.start_run(
+            "automate", target=url, db_path=args.history_db,
+            meta={"project": args.project, "clean": args.clean, "app": args.app},
+        )
+    state = StateCache(url, path=args.state_file, enabled=not args.no_state_cache)
+    run_outcome = "failed"
+    try:
+        with history.phase("wait_for_dokploy"):
+            dokploy_up = wait_for_dokploy(url)
+        if dokploy_up:
+            selected_configs = [
+                c for c in app_configs
+                if not args.app or args.app.lower() in c["name"].lower()
+            ]
+
+            # Pull-through caches first, so the pre-pull and the builds already go through them
+            mirror_baseline = {}
+            if args.registry_mirror:
+                with history.phase("registry_mirror"):
+                    with ThreadPoolExecutor(max_workers=len(server_ips)) as pool:
+                        ready = list(pool.map(
+                            lambda ip: start_registry_mirrors(ip, ssh_user, ssh_private_path), server_ips
+                        ))
+                mirror_baseline = {ip: stats for ip, stats in zip(server_ips, ready) if stats is not None}
+
+            # Pull images on the VM in the background while the API is configured.
+            # With several servers this waits until placement decides where apps go.
+            prepulls = []
+            if not args.no_prepull and len(server_ips) == 1:
+                prepulls.append(start_image_prepull(
+                    selected_configs, ip_address, ssh_user, ssh_private_path, args.prepull_parallel,
+                    mirrored=ip_address in mirror_baseline,
+                ))
+
+            with history.phase("bootstrap"):
+                boot = bootstrap(
+                    args, url, server_ips, ssh_user, ssh_private_path, ssh_public_path, selected_configs, state
+                )
+            cookies = boot["login"]
+            deploy_servers = boot["server_ready"]
+            server_id = deploy_servers[0]["serverId"]
+            git_ssh_key_id = boot["git_ssh_key"]
+            project_id, env_id, existing_apps = boot["project"]
+            app_inputs = boot["app_inputs"]
+            git_heads = boot["git_heads"]
+            retained_volumes = boot.get("volume_retention", {})
+
+            print(f"Final Server ID for deployment: {server_id}")
+            if len(deploy_servers) > 1:
+                print(f"Deploy servers: {[(s['name'], s['ipAddress']) for s in deploy_servers]}")
+            triggered = {}
+            fingerprints = {}  # app name -> fingerprint of the inputs it was deployed with
+
+            with history.phase("placement"):
+                if len(deploy_servers) > 1:
+                    snapshots = {
+                        srv["serverId"]: sample_server_resources(srv["ipAddress"], ssh_user, ssh_private_path)
+                        for srv in deploy_servers
+                    }
+                    placement_configs = []
+                    for c in (replace_domain(c) for c in selected_configs):
+                        if retained_volumes.get(c["name"]) and not c.get("server"):
+                            # Keep the app next to its retained data
+                            c = dict(c, server=retained_volumes[c["name"]][0]["ip"])
+                        placement_configs.append(c)
+                    placement = plan_placement(placement_configs, deploy_servers, snapshots, existing_apps)
+                else:
+                    placement = {c["name"]: deploy_servers[0] for c in selected_configs}
+
+            if not args.no_port_check:
+                # Reject host-port conflicts now rather than when a built app fails to bind
+                with history.phase("port_preflight"):
+                    with ThreadPoolExecutor(max_workers=len(deploy_servers)) as pool:
+                        live = pool.map(
+                            lambda srv: port_snapshot(srv["ipAddress"], ssh_user, ssh_private_path),
+                            deploy_servers,
+                        )
+                        snapshots = {srv["serverId"]: snap for srv, snap in zip(deploy_servers, live)}
+                    conflicts = find_port_conflicts(boot["port_index"]["claims"], placement, snapshots)
+                if conflicts:
+                    print("Error: Host port conflicts found before deploying (use --no-port-check to skip):")
+                    for conflict in conflicts:
+                        print(f"  {conflict}")
+                    sys.exit(1)
+                print("Port preflight: no host port conflicts.")
+
+            admission = None
+            if not args.no_admission_control:
+                # Footprints: declared, or what the apps were measured using (this or recent runs)
+                learned = history.learned_footprints(args.history_db, target=url) if not args.no_history else {}
+                for name, memory_mb in boot.get("app_footprints", {}).items():
+                    learned[name] = max(learned.get(name, 0.0), memory_mb)
+                needs = {c["name"]: app_footprint(c, learned) for c in (replace_domain(c) for c in selected_configs)}
+                budgets = {
+                    srv["serverId"]: server_budget(
+                        sample_server_resources(srv["ipAddress"], ssh_user, ssh_private_path) or FALLBACK_CAPACITY
                     )
-                    ssh_key_to_use = None
+                    for srv in deploy_servers
+                }
+                for srv in deploy_servers:
+                    budget = budgets[srv["serverId"]]
+                    print(f"Admission budget on {srv['ipAddress']}: {budget['memory']:.0f}MB, {budget['cpu']:.1f} CPU")
+                admission = AdmissionController(
+                    url, cookies, ssh_user, ssh_private_path, needs, budgets, timeout=args.admission_timeout
+                )
 
-                # Detect .env file early to combine with git update
-                env_file = detect_env_file(cfg["name"])
-                env_content = None
-                if env_file:
-                    print(f"Found environment file for {cfg['name']}: {env_file}")
-                    try:
-                        with open(env_file, "r") as f:
-                            env_content = replace_domain(f.read())
-                    except Exception as e:
-                        print(f"Warning: Could not read env file {env_file}: {e}")
-                # Get branch if specified
-                branch = cfg.get("branch", "main")
-                
-                # Get compose command if specified (e.g., "--profile cpu")
-                compose_command = cfg.get("composeCommand", None)
-
-                # Update Git and Environment variables in one go via API
-                update_compose_git(
-                    url,
-                    cookies,
-                    cid,
-                    repo_url,
-                    env_vars=env_content,
-                    ssh_key_id=ssh_key_to_use,
-                    branch=branch,
-                    compose_command=compose_command
+            if not args.no_prepull and len(server_ips) > 1:
+                for srv in deploy_servers:
+                    srv_configs = [c for c in selected_configs if placement[c["name"]] is srv]
+                    if srv_configs:
+                        prepulls.append(start_image_prepull(
+                            srv_configs, srv["ipAddress"], ssh_user, ssh_private_path, args.prepull_parallel,
+                            mirrored=srv["ipAddress"] in mirror_baseline,
+                        ))
+        
+            for cfg_raw in app_configs:
+                cfg = replace_domain(cfg_raw)
+                if args.app and args.app.lower() not in cfg["name"].lower():
+                    print(f"Skipping {cfg['name']} (filter: {args.app})")
+                    continue
+                app_started = time.time()
+                app_server = placement[cfg["name"]]
+                app_ip = app_server["ipAddress"]
+
+                # Check if exists
+                target_app = next((a for a in existing_apps if a["name"] == cfg["name"]), None)
+
+                inputs = app_inputs[cfg["name"]]
+                fingerprint = app_fingerprint(
+                    cfg, inputs["env_content"], inputs["compose_content"], git_heads.get(cfg["name"])
                 )
-                
-                # belts and suspenders: manually inject via API env call too
-                if env_content:
-                    update_compose_env(url, cookies, cid, env_content)
-
-                if "exposures" in cfg:
-                    print(f"Setting up multiple domains for {cfg['name']}...")
-                    for exp in cfg["exposures"]:
-                        create_domain(
+                if args.changed_only:
+                    reason = redeploy_reason(target_app, fingerprint)
+                    if not reason:
+                        print(f"Unchanged and healthy: {cfg['name']} (skipping)")
+                        continue
+                    print(f"Redeploying {cfg['name']}: {reason}")
+
+                if target_app:
+                    cid = target_app["composeId"]
+                    print(f"Using existing compose application: {cfg['name']} ({cid})")
+                else:
+                    cid = create_compose(
+                        url, cookies, project_id, env_id, cfg["name"], app_server["serverId"]
+                    )
+                if cid:
+                    repo_url = cfg["repo"]
+                    ssh_key_to_use = git_ssh_key_id
+
+                    if repo_url.startswith("https://"):
+                        print(
+                            f"Detected HTTPS URL for {cfg['name']}, skipping SSH key attachment."
+                        )
+                        ssh_key_to_use = None
+
+                    # .env file was read during bootstrap to combine with git update
+                    env_file = inputs["env_file"]
+                    env_content = inputs["env_content"]
+
+                    if "exposures" in cfg:
+                        print(f"Setting up multiple domains for {cfg['name']}...")
+                        exposures = cfg["exposures"]
+                    elif "domain" in cfg:
+                        exposures = [cfg]
+                    else:
+                        exposures = []
+
+                    # Independent updates run concurrently; only the deploy waits for all of them.
+                    # The graph finishes within this iteration, so the steps see this app's values.
+                    def do_git(results):
+                        # Update Git and Environment variables in one go via API
+                        update_compose_git(
                             url,
                             cookies,
                             cid,
-                            exp["domain"],
-                            exp["port"],
-                            exp["service"],
+                            repo_url,
+                            env_vars=env_content,
+                            ssh_key_id=ssh_key_to_use,
+                            branch=cfg.get("branch", "main"),
+                            compose_command=cfg.get("composeCommand", None),  # e.g. "--profile cpu"
                         )
-                elif "domain" in cfg:
-                    create_domain(
-                        url, cookies, cid, cfg["domain"], cfg["port"], cfg["service"]
-                    )
 
-                # ROBUSTNESS: Ensure .env file is physically present on the server for Docker Compose
-                full_app_name = get_compose_app_name(url, cookies, cid)
-                if env_file and full_app_name:
-                    print(f"Ensuring .env file for {full_app_name} on server {ip_address}...")
-                    time.sleep(2)  # Wait for Dokploy to create directories
-                    copy_env_file_to_remote(env_file, ip_address, full_app_name)
-
-                # TRIGGER DEPLOYMENT (ONCE)
-                print(f"Triggering final deployment for {cfg['name']}...")
-                
-                # SPECIAL HANDLING: For Agentic Playground, sanitize and push the compose file
-                if "Agentic" in cfg["name"] or "Playground" in cfg["name"]:
-                    try:
-                        app_path = f"/etc/dokploy/compose/{full_app_name}/code"
-                        # Try multiple possible locations for the local compose file
-                        possible_paths = [
-                            os.path.join(os.path.dirname(__file__), "..", "cp-agentic-mcp-playground", "docker-compose.yml"),
-                            os.path.expanduser("~/Desktop/cp-agentic-mcp-playground/docker-compose.yml"),
-                            "C:/Users/admin/Desktop/cp-agentic-mcp-playground/docker-compose.yml",
-                            "/Users/khalid/Desktop/cp-agentic-mcp-playground/docker-compose.yml",
-                        ]
-                        local_compose = None
-                        for p in possible_paths:
-                            if os.path.exists(p):
-                                local_compose = p
-                                print(f"Found local compose file at: {p}")
-                                break
-                        
-                        if not local_compose:
-                            print(f"Warning: Could not find local compose file for {cfg['name']}. Tried: {possible_paths}")
-                        
-                        if local_compose and os.path.exists(local_compose):
-                            with open(local_compose, "r") as f:
-                                orig_content = f.read()
-                                # 1. Replace {{DOMAIN}}
-                                content = replace_domain(orig_content)
-                                # 2. Hard-inject environment variables to avoid ports issues
-                                if env_file:
-                                    content = hard_inject_env_vars(content, env_file)
-                                # 3. Sanitize for Dokploy (Volumes, env_file tags)
-                                compose_content = sanitize_compose_file(content, cfg["name"], app_path=app_path)
-                            
+                    def do_env(results):
+                        # belts and suspenders: manually inject via API env call too
+                        if env_content:
+                            update_compose_env(url, cookies, cid, env_content)
+
+                    def do_domains(results):
+                        sync_domains(url, cookies, cid, [
+                            {"host": exp["domain"], "port": exp["port"], "serviceName": exp["service"]}
+                            for exp in exposures
+                        ])
+
+                    def do_app_name(results):
+                        # One compose.one for the appName (with suffix) and the volume suffix;
+                        # both are fixed for the life of the compose, so later runs use the cache
+                        cached = state.get(f"compose:{cid}")
+                        if cached:
+                            return cached
+                        record = get_compose(url, cookies, cid, fields=("appName", "suffix")) or {}
+                        if record.get("appName"):
+                            cached = {"appName": record["appName"], "suffix": record.get("suffix")}
+                            state.set(f"compose:{cid}", cached)
+                            return cached
+                        return record
+
+                    def do_volumes(results):
+                        compose_record = results["app_name"]
+                        if compose_record.get("appName"):
+                            reattach_volumes(
+                                app_ip, ssh_user, ssh_private_path, compose_record["appName"],
+                                compose_record.get("suffix"), retained_volumes[cfg["name"]],
+                            )
+
+                    def do_env_file(results):
+                        # ROBUSTNESS: Ensure .env file is physically present on the server for Docker Compose
+                        full_app_name = results["app_name"].get("appName")
+                        if full_app_name:
+                            print(f"Ensuring .env file for {full_app_name} on server {app_ip}...")
+                            copy_env_file_to_remote(env_file, app_ip, full_app_name, username=ssh_user, key_path=ssh_private_path)
+
+                    def do_compose_file(results):
+                        # SPECIAL HANDLING: For Agentic Playground, sanitize and push the compose file
+                        try:
+                            app_path = f"/etc/dokploy/compose/{results['app_name'].get('appName')}/code"
+                            # Sanitize for Dokploy (Volumes, env_file tags)
+                            compose_content = sanitize_compose_file(inputs["compose_content"], cfg["name"], app_path=app_path)
                             print(f"Pushing sanitized local compose file for {cfg['name']} (Path: {app_path})...")
                             update_compose_file(url, cookies, cid, compose_content)
-                    except Exception as e:
-                        print(f"Warning: Failed to push sanitized compose file: {e}")
-
-                deploy_compose(url, cookies, cid)
-
-                if "Dev-Hub" in cfg["name"]:
-                    full_app_name = get_compose_app_name(url, cookies, cid)
-                    if full_app_name:
-                        manual_git_clone_and_inject(ip_address, full_app_name, repo_url, ssh_private_path)
-                        
-                        # Read the local compose file
-                        local_compose_path = "automation/dev_hub_compose.yml"
-                        if os.path.exists(local_compose_path):
-                            with open(local_compose_path, "r") as f:
-                                compose_content = f.read()
-                            print(f"Switching {cfg['name']} to sourceType: compose (Local)")
-                            update_compose_file(url, cookies, cid, compose_content, source_type="compose")
-
-        print("\n" + "=" * 60 + "\nDOKPLOY COMPOSE AUTOMATION COMPLETE!\n" + "=" * 60)
+                        except Exception as e:
+                            print(f"Warning: Failed to push sanitized compose file: {e}")
+
+                    def do_description(results):
+                        # Remember what is being deployed, for --changed-only runs; it only
+                        # counts once the deployment is seen to succeed (see changes.py)
+                        update_compose_description(url, cookies, cid, PENDING_MARKER + fingerprint)
+
+                    def do_deploy(results):
+                        if admission:
+                            admission.admit(cfg["name"], app_server)
+                        # TRIGGER DEPLOYMENT (ONCE)
+                        print(f"Triggering final deployment for {cfg['name']}...")
+                        deployed = deploy_compose(url, cookies, cid)
+                        if deployed and admission:
+                            admission.started(cfg["name"], app_server, cid, time.time())
+                        return deployed
+
+                    app_steps = {
+                        "git": ((), do_git),
+                        "env": (("git",), do_env),
+                        "domains": ((), do_domains),
+                        "app_name": ((), do_app_name),
+                        "description": ((), do_description),
+                    }
+                    if retained_volumes.get(cfg["name"]):
+                        app_steps["volumes"] = (("git", "app_name"), do_volumes)
+                    if env_file:
+                        app_steps["env_file"] = (("app_name",), do_env_file)
+                    if inputs["compose_content"]:
+                        app_steps["compose_file"] = (("git", "app_name"), do_compose_file)
+                    app_steps["deploy"] = (tuple(app_steps), do_deploy)
+                    app_results = run_graph(app_steps, label=cfg["name"], record_phases=False)
+
+                    deployed = app_results["deploy"]
+                    if deployed:
+                        triggered[cfg["name"]] = (cid, time.time())
+                        fingerprints[cfg["name"]] = fingerprint
+                    else:
+                        update_compose_description(url, cookies, cid, FAILED_MARKER)
+                    if recorder:
+                        recorder.record_app(
+                            cfg["name"], time.time() - app_started,
+                            outcome="triggered" if deployed else "trigger_failed",
+                        )
+
+                    if cfg.get("catalogHost"):
+                        full_app_name = app_results["app_name"].get("appName")
+                        if full_app_name:
+                            manual_git_clone_and_inject(app_ip, full_app_name, repo_url, ssh_private_path, username=ssh_user)
+
+            if recorder and admission and admission.waits:
+                recorder.record_phase("admission_wait", sum(admission.waits.values()))
+
+            for prepull in prepulls:
+                with history.phase("image_prepull_wait"):
+                    finish_image_prepull(prepull)
+                if recorder and prepull["duration"] is not None:
+                    recorder.record_phase("image_prepull", prepull["duration"])
+
+            if args.wait_deploy and triggered:
+                app_hosts = {} if args.no_log_tail else {
+                    name: placement[name]["ipAddress"] for name in triggered
+                }
+                failure_patterns = {
+                    cfg["name"]: compile_failure_patterns(cfg.get("failurePatterns"), args.failure_pattern)
+                    for cfg in (replace_domain(c) for c in selected_configs)
+                }
+                build_cache = {}
+                deployment_ids = {}
+                with history.phase("wait_deploy"):
+                    results = watch_deployments(
+                        url, cookies, triggered, app_hosts, ssh_user, ssh_private_path,
+                        patterns=failure_patterns, retries=args.deploy_retries, build_cache=build_cache,
+                        deployment_ids=deployment_ids,
+                    )
+                for name, (cached, steps) in build_cache.items():
+                    print(f"Build cache: {name} {format_ratio(cached, steps)}")
+                    if recorder:
+                        recorder.record_build_cache(name, cached, steps)
+                for name, (status, duration) in results.items():
+                    if recorder:
+                        recorder.record_deploy(name, duration, status, deployment_ids.get(name))
+                    update_compose_description(
+                        url, cookies, triggered[name][0],
+                        FINGERPRINT_PREFIX + fingerprints[name] if status == "done" else FAILED_MARKER,
+                    )
+
+            mirror_report = {}
+            for mirror_ip, baseline in mirror_baseline.items():
+                delta = stats_delta(baseline, mirror_stats(mirror_ip, ssh_user, ssh_private_path))
+                for registry, counters in delta.items():
+                    print(f"Registry mirror on {mirror_ip}: {describe_stats(registry, counters)}")
+                mirror_report[mirror_ip] = delta
+            if recorder and mirror_report:
+                recorder.meta["registry_mirror"] = mirror_report
+
+            print("\n" + "=" * 60 + "\nDOKPLOY COMPOSE AUTOMATION COMPLETE!\n" + "=" * 60)
+            run_outcome = "ok"
+    finally:
+        state.save()
+        if recorder:
+            recorder.save(run_outcome)
+    return 0 if run_outcome == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
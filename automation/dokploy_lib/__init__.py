@@ -0,0 +1,128 @@
+"""Reusable pieces of the Dokploy automation.
+
+Submodules are imported on first attribute access, so ``import dokploy_lib``
+(or ``from dokploy_lib.compose import ...``) stays cheap and side-effect free:
+``requests`` is only loaded when the API or pre-pull helpers are used.
+
+    compose    -- {{DOMAIN}} templating, env injection, sanitizing, service parsing
+    envfiles   -- locating/reading automation/envs/.env_* files
+    api        -- Dokploy tRPC calls (url + cookies)
+    trpc       -- lean tRPC response decoding with field projection
+    ssh        -- SSH/SCP operations on the VM
+    remote     -- one-round-trip plans of file/docker operations on the VM
+    prepull    -- background image pre-pull
+    mirror     -- pull-through cache registries on the deploy servers
+    deploylogs -- streaming build logs with fail-fast failure patterns
+    placement  -- resource-aware assignment of apps to deploy servers
+    ports      -- host-port ownership index and pre-deploy conflict checks
+    lint       -- pre-flight checks of every app's rendered compose file
+    admission  -- holding deployments until their server has headroom
+    buildcache -- keeping the BuildKit cache across rebuilds, counting its hits
+    dockergc   -- disk-pressure-aware Docker garbage collection
+    changes    -- input fingerprints for redeploying only changed/failed apps
+    volumes    -- keeping selected Docker volumes across rebuilds
+    state      -- cached session and resource IDs between runs
+    acme       -- backing up and restoring Traefik's ACME certificates
+    pipeline   -- dependency-graph runner for overlapping steps
+    fleet      -- concurrent runs against several Dokploy instances
+    history    -- SQLite run history
+    logbundle  -- troubleshooting bundles of container logs and state
+"""
+import importlib
+
+_SUBMODULES = (
+    "compose", "envfiles", "api", "trpc", "ssh", "remote", "prepull", "mirror",
+    "deploylogs", "placement", "ports", "lint", "admission", "buildcache", "dockergc", "changes",
+    "volumes", "acme", "state", "pipeline", "fleet", "history", "logbundle",
+)
+
+_EXPORTS = {
+    "compose": (
+        "ROOT_DOMAIN", "set_root_domain", "replace_domain", "sanitize_compose_file",
+        "hard_inject_env_vars", "LOCAL_COMPOSE_PATHS", "find_local_compose",
+        "parse_compose_services", "top_level_names", "extract_compose_images", "parse_port",
+        "published_ports",
+    ),
+    "envfiles": ("detect_env_file", "read_env_file"),
+    "api": (
+        "api_request", "request_with_retry", "wait_for_dokploy", "register_admin", "login",
+        "get_organization_id", "list_ssh_keys", "find_ssh_key",
+        "setup_ssh_and_server", "delete_all_services", "list_projects",
+        "project_environment_ids", "get_all_project_ids", "find_project",
+        "get_all_environment_ids", "get_environment_id", "delete_project",
+        "create_project", "create_compose", "get_all_compose_ids", "get_compose",
+        "get_compose_app_name", "update_compose_git", "create_domain", "trpc_batch",
+        "get_compose_domains", "sync_domains",
+        "update_compose_file", "update_compose_env", "update_compose_description",
+        "deploy_compose", "reload_traefik", "set_docker_cleanup",
+        "get_latest_deployment", "wait_for_server_ready",
+    ),
+    "trpc": ("body_preview", "project_fields", "trpc_data", "trpc_batch_data"),
+    "ssh": (
+        "ssh_command", "scp_command", "authorize_public_key", "copy_env_file_to_remote",
+        "force_cleanup_ports", "manual_git_clone_and_inject", "dev_hub_customization_ops",
+        "inject_dev_hub_customizations", "pull_images_remote", "sample_server_resources",
+        "follow_remote_file",
+    ),
+    "remote": ("run_plan", "plan_ok", "plan_errors"),
+    "prepull": (
+        "fetch_repo_compose", "collect_app_images", "start_image_prepull",
+        "finish_image_prepull",
+    ),
+    "mirror": (
+        "MIRRORS", "image_registry", "mirrored_ref", "start_registry_mirrors", "mirror_stats",
+        "stats_delta", "pull_through_mirror",
+    ),
+    "deploylogs": (
+        "DEFAULT_FAILURE_PATTERNS", "compile_failure_patterns", "match_failure",
+        "start_log_follower", "stop_log_follower", "watch_deployments",
+    ),
+    "placement": ("app_resources", "plan_placement"),
+    "ports": (
+        "PLATFORM_PORTS", "rendered_composes", "build_port_index", "cleanup_ports",
+        "port_snapshot", "find_port_conflicts",
+    ),
+    "lint": ("unresolved_variables", "lint_app", "lint_apps"),
+    "admission": (
+        "app_memory_usage", "app_footprint", "server_budget", "admission_decision",
+        "AdmissionController",
+    ),
+    "buildcache": (
+        "DEFAULT_CACHE_CAP", "new_tally", "count_cache_line", "cache_summary",
+        "retain_build_cache",
+    ),
+    "dockergc": (
+        "docker_disk_usage", "superseded_images", "gc_needed", "collect_garbage",
+    ),
+    "changes": (
+        "FINGERPRINT_PREFIX", "FAILED_MARKER", "remote_git_head", "remote_git_heads",
+        "app_fingerprint", "stored_fingerprint", "redeploy_reason",
+    ),
+    "volumes": (
+        "volume_key", "should_keep", "release_volumes", "reattach_volumes",
+    ),
+    "acme": (
+        "ACME_PATH", "backup_path", "configured_domains", "backup_acme", "restore_acme",
+    ),
+    "state": ("DEFAULT_STATE_PATH", "StateCache"),
+    "pipeline": ("run_graph",),
+    "logbundle": ("collect_bundle", "container_problems"),
+}
+
+_NAME_TO_MODULE = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_NAME_TO_MODULE) + list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    module_name = _NAME_TO_MODULE.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f"{__name__}.{module_name}")
+    return getattr(module, name)
+
+
+def __dir__():
+    return __all__
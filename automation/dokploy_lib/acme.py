@@ -0,0 +1,183 @@
+"""Keep Traefik's Let's Encrypt certificates across rebuilds.
+
+Every server's ACME store (acme.json) is merged into a local backup on each
+run. When a server's store lacks certificates for configured domains -- a
+fresh VM, or Traefik recreated by a clean rebuild -- the still-valid ones are
+restored from the backup and Traefik is reloaded, so HTTPS is served right
+away instead of after a new issuance (and without spending Let's Encrypt
+rate limit).
+"""
+import os
+import json
+import base64
+import subprocess
+from datetime import datetime, timezone
+
+from .ssh import ssh_command
+
+ACME_PATH = "/etc/dokploy/traefik/dynamic/acme.json"
+
+DEFAULT_BACKUP_DIR = os.environ.get(
+    "DOKPLOY_ACME_BACKUP_DIR", os.path.expanduser("~/.dokploy_acme")
+)
+
+# Certificates expiring sooner than this are not worth restoring
+MIN_VALID_DAYS = 1
+
+
+def backup_path(root_domain, backup_dir=None):
+    return os.path.join(backup_dir or DEFAULT_BACKUP_DIR, f"acme-{root_domain}.json")
+
+
+def configured_domains(app_configs):
+    """Hosts of all apps and exposures (configs already passed through replace_domain)."""
+    domains = set()
+    for cfg in app_configs:
+        for exposure in cfg.get("exposures", [cfg]):
+            if exposure.get("domain"):
+                domains.add(exposure["domain"])
+    return domains
+
+
+def read_remote_store(ip_address, username, key_path):
+    """The server's acme.json as a dict ({} if missing or unreadable)."""
+    try:
+        proc = subprocess.run(
+            ssh_command(ip_address, username, key_path, f"sudo cat {ACME_PATH} 2>/dev/null"),
+            capture_output=True, text=True, timeout=60,
+        )
+        return json.loads(proc.stdout) if proc.stdout.strip() else {}
+    except Exception as e:
+        print(f"Warning: Could not read ACME store on {ip_address}: {e}")
+        return {}
+
+
+def write_remote_store(ip_address, username, key_path, store):
+    remote_cmd = (
+        f"sudo mkdir -p {os.path.dirname(ACME_PATH)} && "
+        f"sudo tee {ACME_PATH} >/dev/null && sudo chmod 600 {ACME_PATH}"
+    )
+    proc = subprocess.run(
+        ssh_command(ip_address, username, key_path, remote_cmd),
+        input=json.dumps(store, indent=2), capture_output=True, text=True, timeout=60,
+    )
+    if proc.returncode != 0:
+        print(f"Warning: Could not write ACME store on {ip_address}: {proc.stderr.strip()[:200]}")
+    return proc.returncode == 0
+
+
+def certificate_hosts(cert):
+    domain = cert.get("domain") or {}
+    return [domain.get("main")] + list(domain.get("sans") or [])
+
+
+def certificate_expiry(cert):
+    """Expiry of a store entry's certificate (UTC datetime), or None if openssl cannot tell."""
+    try:
+        pem = base64.b64decode(cert["certificate"])
+        proc = subprocess.run(
+            ["openssl", "x509", "-noout", "-enddate"],
+            input=pem, capture_output=True, timeout=10,
+        )
+        value = proc.stdout.decode().strip().split("=", 1)[1]
+        return datetime.strptime(value, "%b %d %H:%M:%S %Y %Z").replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+
+def merge_stores(*stores):
+    """Merge ACME stores resolver by resolver; later stores win per main domain."""
+    merged = {}
+    for store in stores:
+        for resolver, data in (store or {}).items():
+            if not isinstance(data, dict):
+                continue
+            target = merged.setdefault(resolver, {"Account": None, "Certificates": []})
+            if data.get("Account"):
+                target["Account"] = data["Account"]
+            certs = {c["domain"]["main"]: c for c in target["Certificates"] if c.get("domain")}
+            for cert in data.get("Certificates") or []:
+                if cert.get("domain"):
+                    certs[cert["domain"]["main"]] = cert
+            target["Certificates"] = list(certs.values())
+    return merged
+
+
+def covered_domains(store, domains):
+    return {
+        host
+        for data in store.values() if isinstance(data, dict)
+        for cert in data.get("Certificates") or []
+        for host in certificate_hosts(cert) if host in domains
+    }
+
+
+def backup_acme(server_ips, username, key_path, path):
+    """Merge every server's ACME store into the local backup at `path`; returns the merged store."""
+    backup = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                backup = json.load(f)
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable ACME backup {path}: {e}")
+    remote = [read_remote_store(ip, username, key_path) for ip in server_ips]
+    if not any(d.get("Certificates") for s in remote for d in s.values() if isinstance(d, dict)):
+        return backup  # Nothing issued yet (fresh VM): keep the backup as it is
+    merged = merge_stores(backup, *remote)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(merged, f, indent=2)
+    count = sum(len(d["Certificates"]) for d in merged.values())
+    print(f"Backed up {count} ACME certificate(s) to {path}")
+    return merged
+
+
+def restorable_store(backup, domains):
+    """Backup filtered to certificates for configured domains that are still valid."""
+    now = datetime.now(timezone.utc)
+    restored = {}
+    for resolver, data in backup.items():
+        if not isinstance(data, dict):
+            continue
+        certs = []
+        for cert in data.get("Certificates") or []:
+            hosts = [h for h in certificate_hosts(cert) if h in domains]
+            if not hosts:
+                continue
+            expiry = certificate_expiry(cert)
+            if expiry and (expiry - now).days < MIN_VALID_DAYS:
+                print(f"  Not restoring expired certificate for {', '.join(hosts)} ({expiry:%Y-%m-%d})")
+                continue
+            certs.append(cert)
+        if certs:
+            restored[resolver] = {"Account": data.get("Account"), "Certificates": certs}
+    return restored
+
+
+def restore_acme(server_ips, username, key_path, backup, domains):
+    """Restore backed-up certificates on servers whose store misses configured domains.
+
+    Returns the IPs that were written to (Traefik must be reloaded there).
+    Domains the backup cannot cover are reported; Traefik issues those itself.
+    """
+    restorable = None
+    written = []
+    for ip in server_ips:
+        current = read_remote_store(ip, username, key_path)
+        missing = domains - covered_domains(current, domains)
+        if not missing:
+            continue
+        if restorable is None:
+            restorable = restorable_store(backup, domains)
+        gained = missing & covered_domains(restorable, domains)
+        if missing - gained:
+            print(f"No valid backed-up certificate on {ip} for: {', '.join(sorted(missing - gained))} (Traefik will request them)")
+        if not gained:
+            continue
+        print(f"Restoring ACME certificates on {ip} for: {', '.join(sorted(gained))}")
+        # Certificates already on the server (possibly renewed) win over the backup
+        if write_remote_store(ip, username, key_path, merge_stores(restorable, current)):
+            written.append(ip)
+    return written
@@ -0,0 +1,177 @@
+"""Admission control for deployments: only start the next build when the server has room.
+
+Each app's footprint is its declared ``resources`` or, when larger, the memory
+its containers were measured using in recent runs (recorded in the run
+history). A deployment is admitted onto a server when the footprints of the
+deployments still building there plus its own fit the memory budget sampled
+before the first trigger and the CPU count, and the server is not under live
+pressure: swapping, PSI memory stall, load well above its CPUs or low disk.
+A server with nothing in flight always admits, so an app larger than the
+budget still deploys, alone.
+"""
+import re
+import time
+
+from .deploylogs import CLOCK_SKEW, parse_timestamp
+from .placement import MEMORY_RESERVE_MB, app_resources
+from .ports import app_slug
+
+# Concurrent builds may ask for this many times the server's vCPUs
+CPU_OVERCOMMIT = 2.0
+
+# Live pressure above which no further deployment is admitted
+MAX_LOAD_PER_CPU = 2.0
+MAX_MEMORY_PRESSURE = 10.0  # PSI "some" avg10, % of time stalled on memory
+MAX_SWAP_GROWTH_MB = 256
+MIN_DISK_AVAILABLE_MB = 4096
+
+UNITS = {"b": 1 / 2**20, "kib": 1 / 1024, "mib": 1, "gib": 1024, "kb": 1e3 / 2**20, "mb": 1e6 / 2**20, "gb": 1e9 / 2**20}
+
+
+def parse_memory(value):
+    """MB of a `docker stats` amount such as 512.3MiB or 1.2GiB."""
+    match = re.match(r"([\d.]+)\s*([A-Za-z]+)", value.strip())
+    if not match or match.group(2).lower() not in UNITS:
+        return 0.0
+    return float(match.group(1)) * UNITS[match.group(2).lower()]
+
+
+def app_memory_usage(ip_address, username, key_path, app_names):
+    """{app name: MB used by the app's running containers} on a server.
+
+    Containers are attributed through their compose project (the app's
+    appName); when an app has several projects the largest one counts.
+    """
+    from .remote import run_plan
+
+    results = run_plan(ip_address, username, key_path, [
+        {"op": "docker", "group": "ps", "args": ["ps", "--format", '{{.ID}}\t{{.Label "com.docker.compose.project"}}']},
+        {"op": "docker", "group": "stats", "args": ["stats", "--no-stream", "--format", "{{.ID}}\t{{.MemUsage}}"]},
+    ], timeout=120)
+    if results is None or not all(r["ok"] for r in results):
+        return {}
+    projects = dict(line.split("\t", 1) for line in results[0].get("output", "").splitlines() if "\t" in line)
+    by_project = {}
+    for line in results[1].get("output", "").splitlines():
+        container, _, usage = line.partition("\t")
+        project = projects.get(container)
+        if project:
+            by_project[project] = by_project.get(project, 0.0) + parse_memory(usage.split("/")[0])
+    usage = {}
+    for name in app_names:
+        slug = app_slug(name)
+        sizes = [mb for project, mb in by_project.items() if project == slug or project.startswith(f"{slug}-")]
+        if sizes:
+            usage[name] = round(max(sizes), 1)
+    return usage
+
+
+def app_footprint(cfg, learned=None):
+    """{"memory", "cpu"} an app is expected to need: declared, or learned if larger."""
+    need = app_resources(cfg)
+    if learned and cfg["name"] in learned:
+        need["memory"] = max(need["memory"], float(learned[cfg["name"]]))
+    return need
+
+
+def server_budget(snapshot):
+    """Memory (MB) and CPUs deployments may reserve on a server, from a snapshot."""
+    return {
+        "memory": snapshot["memory_available"] - MEMORY_RESERVE_MB,
+        "cpu": snapshot["cpus"] * CPU_OVERCOMMIT,
+        "swap_used": snapshot.get("swap_used") or 0,
+    }
+
+
+def admission_decision(need, in_flight, budget, snapshot=None):
+    """(admit, reason) for a deployment needing `need` next to the `in_flight` footprints."""
+    memory = sum(n["memory"] for n in in_flight) + need["memory"]
+    if memory > budget["memory"]:
+        return False, f"memory budget {memory:.0f}/{budget['memory']:.0f}MB"
+    cpu = sum(n["cpu"] for n in in_flight) + need["cpu"]
+    if cpu > budget["cpu"]:
+        return False, f"CPU budget {cpu:.1f}/{budget['cpu']:.1f}"
+    if snapshot is None:
+        return True, "within budget"
+    if snapshot["memory_available"] - MEMORY_RESERVE_MB < need["memory"]:
+        return False, f"only {snapshot['memory_available']}MB memory available"
+    if (snapshot.get("swap_used") or 0) - budget["swap_used"] > MAX_SWAP_GROWTH_MB:
+        return False, f"swapping ({snapshot['swap_used']}MB swap used)"
+    if snapshot.get("memory_pressure") is not None and snapshot["memory_pressure"] > MAX_MEMORY_PRESSURE:
+        return False, f"memory pressure {snapshot['memory_pressure']:.0f}%"
+    if snapshot["load1"] > snapshot["cpus"] * MAX_LOAD_PER_CPU:
+        return False, f"load {snapshot['load1']:.1f} on {snapshot['cpus']} CPUs"
+    if snapshot.get("disk_available") is not None and snapshot["disk_available"] < MIN_DISK_AVAILABLE_MB:
+        return False, f"only {snapshot['disk_available']}MB disk available"
+    return True, "headroom available"
+
+
+class AdmissionController:
+    """Gates deploy triggers per server and tracks the deployments still building."""
+
+    def __init__(self, url, cookies, username, key_path, needs, budgets, interval=10, timeout=1800):
+        self.url = url
+        self.cookies = cookies
+        self.username = username
+        self.key_path = key_path
+        self.needs = needs
+        self.budgets = budgets
+        self.interval = interval
+        self.timeout = timeout
+        self.in_flight = {}  # serverId -> {app name: {"compose_id", "triggered_at", "deployment_id"}}
+        self.waits = {}
+
+    def _refresh(self, server_id):
+        """Forget deployments on the server that have finished."""
+        from .api import get_latest_deployment
+
+        for name, deploy in list(self.in_flight.get(server_id, {}).items()):
+            deployment = get_latest_deployment(self.url, self.cookies, deploy["compose_id"])
+            if not deployment:
+                continue
+            if deploy["deployment_id"] is None:
+                created = parse_timestamp(deployment.get("createdAt"))
+                if created and created < deploy["triggered_at"] - CLOCK_SKEW:
+                    continue  # Still the previous deployment; ours is queued
+                deploy["deployment_id"] = deployment.get("deploymentId")
+            elif deployment.get("deploymentId") != deploy["deployment_id"]:
+                continue
+            if deployment.get("status") in ("done", "error"):
+                del self.in_flight[server_id][name]
+
+    def admit(self, name, server):
+        """Block until the app may start deploying on `server`; returns the seconds waited."""
+        from .ssh import sample_server_resources
+
+        server_id = server["serverId"]
+        need = self.needs[name]
+        budget = self.budgets.get(server_id)
+        start = time.time()
+        last_reason = None
+        while True:
+            self._refresh(server_id)
+            in_flight = self.in_flight.get(server_id, {})
+            if not in_flight or budget is None:
+                break
+            snapshot = sample_server_resources(server["ipAddress"], self.username, self.key_path)
+            admit, reason = admission_decision(need, [self.needs[n] for n in in_flight], budget, snapshot)
+            if admit:
+                break
+            if time.time() - start > self.timeout:
+                print(f"Admission: {name} waited {self.timeout}s ({reason}); deploying anyway.")
+                break
+            if reason != last_reason:
+                print(f"Admission: holding {name} ({need['memory']:.0f}MB, {need['cpu']} CPU) on "
+                      f"{server['ipAddress']}: {reason}; building: {', '.join(in_flight)}")
+                last_reason = reason
+            time.sleep(self.interval)
+        waited = time.time() - start
+        self.waits[name] = waited
+        if last_reason:
+            print(f"Admission: {name} admitted after {waited:.0f}s")
+        return waited
+
+    def started(self, name, server, compose_id, triggered_at):
+        self.in_flight.setdefault(server["serverId"], {})[name] = {
+            "compose_id": compose_id, "triggered_at": triggered_at, "deployment_id": None,
+        }
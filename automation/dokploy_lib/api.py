@@ -0,0 +1,833 @@
+"""Thin client for Dokploy's tRPC API (url + session cookies in, decoded data out)."""
+import time
+
+import requests
+
+from . import history
+from .ssh import authorize_public_key
+from .trpc import body_preview, decode, trpc_data
+
+# Fields read from the large listings (everything else is dropped on decode)
+PROJECT_FIELDS = ("projectId", "name", {"environments": ("environmentId", "name")})
+ENVIRONMENT_FIELDS = (
+    {"compose": ("composeId", "name", "appName", "serverId", "suffix")},
+    {"applications": ("applicationId", "name")},
+)
+COMPOSE_LIST_FIELDS = ("composeId", "name", "appName", "serverId", "composeStatus", "description")
+SSH_KEY_FIELDS = ("sshKeyId", "name", "publicKey")
+SERVER_FIELDS = ("serverId", "name", "ipAddress", "username", "sshKeyId")
+
+
+def api_request(method, url, session=None, **kwargs):
+    """requests.request (or `session`'s) with its latency recorded in the run history.
+
+    Every Dokploy API call goes through here, so the history covers all of them.
+    """
+    started = time.time()
+    try:
+        response = (session or requests).request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        history.record_call(method, url, None, time.time() - started)
+        raise
+    history.record_call(method, url, response.status_code, time.time() - started)
+    return response
+
+
+def request_with_retry(
+    method, url, max_retries=3, backoff_factor=2, timeout=30, **kwargs
+):
+    """Makes an HTTP request with retry logic for transient failures."""
+    for attempt in range(max_retries):
+        try:
+            print(f"DEBUG: [REQ] {method} {url} (Attempt {attempt + 1})")
+            start_ptr = time.time()
+            response = api_request(method, url, timeout=timeout, **kwargs)
+            duration = time.time() - start_ptr
+            print(f"DEBUG: [RES] {response.status_code} ({duration:.2f}s)")
+
+            if response.status_code < 500:
+                print(f"DEBUG: [BODY] {body_preview(response)}...")
+                return response
+
+            print(f"DEBUG: Server error {response.status_code}, retrying...")
+        except requests.exceptions.RequestException as e:
+            print(f"DEBUG: Request failed: {e}")
+            if attempt == max_retries - 1:
+                raise
+
+        sleep_time = backoff_factor**attempt
+        print(f"DEBUG: Sleeping {sleep_time}s before retry...")
+        time.sleep(sleep_time)
+
+    return api_request(method, url, timeout=timeout, **kwargs)
+
+
+def wait_for_dokploy(url, timeout=300):
+    """Wait for Dokploy service to be accessible."""
+    start_time = time.time()
+    print(f"Waiting for Dokploy at {url}...")
+    while time.time() - start_time < timeout:
+        try:
+            response = requests.get(url, timeout=10)
+            if response.status_code == 200:
+                print("Dokploy is up and running!")
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(5)
+    print("Timeout waiting for Dokploy")
+    return False
+
+
+def register_admin(url, email, password, name="Admin", last_name="User"):
+    """Register admin user via the Better Auth sign-up endpoint."""
+    signup_url = f"{url}/api/auth/sign-up/email"
+    headers = {"Content-Type": "application/json", "Accept": "*/*"}
+    payload = {
+        "email": email,
+        "password": password,
+        "name": name,
+        "lastName": last_name,
+    }
+
+    print(f"Checking/Registering admin with email: {email}")
+    try:
+        response = request_with_retry("POST", signup_url, json=payload, headers=headers)
+        if response.status_code in [200, 201]:
+            print("SUCCESS! Admin account created successfully!")
+            return True
+        elif response.status_code == 422 and "USER_ALREADY_EXISTS" in response.text:
+            print("Admin account already exists, proceeding to login.")
+            return True
+        else:
+            print(f"Registration status: {response.status_code}")
+            print(f"DEBUG: Response Body: {response.text}")
+            return False
+    except requests.exceptions.RequestException as e:
+        print(f"Error during registration: {e}")
+        return False
+
+
+def login(url, email, password):
+    """Log in to Dokploy and return the session token cookie."""
+    login_url = f"{url}/api/auth/sign-in/email"
+    payload = {"email": email, "password": password}
+
+    print(f"Logging in as {email}...")
+    try:
+        response = request_with_retry("POST", login_url, json=payload)
+        if response.status_code == 200:
+            print("Login successful!")
+            return response.cookies
+        else:
+            print(f"Login failed: {response.status_code}")
+            print(f"DEBUG: Response Body: {response.text}")
+            return None
+    except Exception as e:
+        print(f"Error during login: {e}")
+        return None
+
+
+def get_organization_id(url, cookies):
+    """Return the first organization's ID, or None (e.g. 401 for an expired session)."""
+    trpc_url = f"{url}/api/trpc/organization.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
+    try:
+        response = api_request("GET", trpc_url, cookies=cookies, timeout=30)
+        if response.status_code != 200:
+            print(f"Organization lookup returned {response.status_code}")
+            return None
+        return trpc_data(response, ("id",))[0]["id"]
+    except Exception as e:
+        print(f"Error fetching Organization ID: {e}")
+        return None
+
+
+def list_ssh_keys(url, cookies):
+    """The SSH key records ({"sshKeyId", "name", "publicKey"}), or None when they cannot be listed."""
+    trpc_url = f"{url}/api/trpc/sshKey.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
+    try:
+        return trpc_data(api_request("GET", trpc_url, cookies=cookies, timeout=30), SSH_KEY_FIELDS)
+    except Exception as e:
+        print(f"Error listing SSH keys: {e}")
+        return None
+
+
+def find_ssh_key(url, cookies, name, public_key=None, keys=None):
+    """ID of the SSH key record with this name (and public key, when given), or None.
+
+    `keys` is a listing from list_ssh_keys to search instead of fetching one.
+    """
+    if keys is None:
+        keys = list_ssh_keys(url, cookies) or []
+    for key in keys:
+        if key.get("name") != name:
+            continue
+        if public_key and key.get("publicKey") and key["publicKey"].strip() != public_key.strip():
+            continue
+        return key["sshKeyId"]
+    return None
+
+
+def setup_ssh_and_server(
+    url, cookies, ip_address, organization_id, username="adminuser", key_path="~/.ssh/id_rsa"
+):
+    """Generate SSH key, add to authorized_keys, and register server."""
+    # 1. Generate SSH Key in Dokploy
+    trpc_url_gen = f"{url}/api/trpc/sshKey.generate?batch=1"
+    payload_gen = {"0": {"json": {}}}
+
+    timestamp = int(time.time())
+    key_name = f"Key-{timestamp}"
+    server_name = f"Server-{timestamp}"
+
+    print(f"Generating SSH key ({key_name}) in Dokploy...")
+    try:
+        resp_gen = request_with_retry(
+            "POST", trpc_url_gen, json=payload_gen, cookies=cookies
+        )
+        keys = resp_gen.json()[0]["result"]["data"]["json"]
+        private_key = keys["privateKey"]
+        public_key = keys["publicKey"]
+
+        # 2. Add public key to authorized_keys on VM (both adminuser and root)
+        # Purge Azure's restricted root authorized_keys and enable root login
+        print(f"Authorizing public key on VM ({ip_address}) for {username} and root...")
+        authorize_public_key(ip_address, username, key_path, public_key)
+
+        # 3. Create SSH Key record in Dokploy
+        trpc_url_key = f"{url}/api/trpc/sshKey.create?batch=1"
+        payload_key = {
+            "0": {
+                "json": {
+                    "name": key_name,
+                    "description": "Automated key for local deployment",
+                    "privateKey": private_key,
+                    "publicKey": public_key,
+                    "organizationId": organization_id,
+                }
+            }
+        }
+        print(f"Registering SSH key record ({key_name}) in Dokploy...")
+        request_with_retry("POST", trpc_url_key, json=payload_key, cookies=cookies)
+
+        # 4. Fetch the created SSH key ID by name
+        trpc_url_all_keys = f"{url}/api/trpc/sshKey.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
+        resp_all = request_with_retry("GET", trpc_url_all_keys, cookies=cookies)
+        keys_list = trpc_data(resp_all, SSH_KEY_FIELDS)
+        ssh_key_id = next(
+            (k["sshKeyId"] for k in keys_list if k["name"] == key_name), None
+        )
+
+        if not ssh_key_id:
+            print(f"Error: Could not find created SSH key with name {key_name}")
+            return None
+
+        print(f"Found SSH Key ID: {ssh_key_id}")
+
+        # 4. Create Server record in Dokploy (using ROOT)
+        trpc_url_srv = f"{url}/api/trpc/server.create?batch=1"
+        payload_srv = {
+            "0": {
+                "json": {
+                    "name": server_name,
+                    "description": "Primary deployment server",
+                    "ipAddress": ip_address,
+                    "port": 22,
+                    "username": "root",
+                    "sshKeyId": ssh_key_id,
+                    "serverType": "deploy",
+                    "organizationId": organization_id,
+                }
+            }
+        }
+        print(f"Initializing server ({server_name}) in Dokploy...")
+        resp_srv = request_with_retry(
+            "POST", trpc_url_srv, json=payload_srv, cookies=cookies
+        )
+        data_srv = resp_srv.json()
+
+        if isinstance(data_srv, list) and len(data_srv) > 0:
+            res_srv = data_srv[0].get("result", {})
+            if "error" in res_srv:
+                print(f"Server creation error: {res_srv['error']}")
+                return None
+            server_id = res_srv.get("data", {}).get("json", {}).get("serverId")
+        else:
+            print(f"DEBUG: Unexpected server creation response: {data_srv}")
+            return None
+
+        # 5. Start server setup
+        print("Triggering server setup...")
+        trpc_url_setup = f"{url}/api/trpc/server.setup?batch=1"
+        request_with_retry(
+            "POST",
+            trpc_url_setup,
+            json={"0": {"json": {"serverId": server_id}}},
+            cookies=cookies,
+            timeout=60,  # Increased timeout for initial setup trigger
+        )
+
+        return server_id
+    except Exception as e:
+        print(f"Error during SSH/Server setup: {e}")
+        return None
+
+
+def delete_all_services(url, cookies, env_id, delete_volumes=True):
+    """Delete all services (apps and compose) in the environment using environment.one.
+
+    Returns the deleted compose records (name, appName, serverId, suffix, ...);
+    with delete_volumes=False their Docker volumes are left on the server.
+    """
+    deleted = []
+    trpc_url_one = f"{url}/api/trpc/environment.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22environmentId%22%3A%22{env_id}%22%7D%7D%7D"
+    try:
+        resp = request_with_retry("GET", trpc_url_one, cookies=cookies)
+        env_data = trpc_data(resp, ENVIRONMENT_FIELDS)
+
+        # Delete Compose Applications
+        composes = env_data.get("compose", [])
+        for comp in composes:
+            print(f"Deleting compose app: {comp['name']}...")
+            trpc_url_del = f"{url}/api/trpc/compose.delete?batch=1"
+            request_with_retry(
+                "POST",
+                trpc_url_del,
+                json={"0": {"json": {"composeId": comp["composeId"], "deleteVolumes": delete_volumes}}},
+                cookies=cookies,
+            )
+            deleted.append(comp)
+
+        # Delete Single Applications
+        apps = env_data.get("applications", [])
+        for app in apps:
+            print(f"Deleting application: {app['name']}...")
+            trpc_url_del = f"{url}/api/trpc/application.delete?batch=1"
+            request_with_retry(
+                "POST",
+                trpc_url_del,
+                json={"0": {"json": {"applicationId": app["applicationId"]}}},
+                cookies=cookies,
+            )
+    except Exception as e:
+        print(f"DEBUG: Warning - could not cleanup services: {e}")
+    return deleted
+
+
+def list_projects(url, cookies, fields=PROJECT_FIELDS):
+    """Fetch the project.all listing (one request, environments embedded by current Dokploy).
+
+    Projects are reduced to PROJECT_FIELDS; pass fields=None for the full records.
+    """
+    trpc_url = f"{url}/api/trpc/project.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%2C%22meta%22%3A%7B%22values%22%3A%5B%22undefined%22%5D%7D%7D%7D"
+    response = api_request("GET", trpc_url, cookies=cookies, timeout=30)
+    return trpc_data(response, fields)
+
+
+def project_environment_ids(url, cookies, project):
+    """Env IDs of a listed project, production first; project.one only if the listing lacks them."""
+    environments = project.get("environments")
+    if environments is None:
+        return get_all_environment_ids(url, cookies, project["projectId"])
+    ordered = sorted(environments, key=lambda env: env.get("name") != "production")
+    return [env["environmentId"] for env in ordered]
+
+
+def get_all_project_ids(url, cookies, with_env_ids=True):
+    """Find all existing projects and return their IDs and a list of all Env IDs."""
+    matches = []
+    try:
+        for p in list_projects(url, cookies):
+            env_ids = project_environment_ids(url, cookies, p) if with_env_ids else []
+            matches.append((p["projectId"], env_ids, p["name"]))
+    except Exception as e:
+        print(f"DEBUG: Error listing all projects: {e}")
+    return matches
+
+
+def find_project(url, cookies, name):
+    """Resolve only the named project: [(projectId, env_ids, name)] or [] if it does not exist."""
+    try:
+        for p in list_projects(url, cookies):
+            if p["name"] == name:
+                return [(p["projectId"], project_environment_ids(url, cookies, p), p["name"])]
+    except Exception as e:
+        print(f"DEBUG: Error looking up project {name}: {e}")
+    return []
+
+
+def get_all_environment_ids(url, cookies, project_id):
+    """Get all environment IDs for the project."""
+    trpc_url = f"{url}/api/trpc/project.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22projectId%22%3A%22{project_id}%22%7D%7D%7D"
+    ids = []
+    try:
+        response = api_request("GET", trpc_url, cookies=cookies, timeout=30)
+        environments = trpc_data(response, PROJECT_FIELDS)["environments"]
+        for env in environments:
+            ids.append(env["environmentId"])
+    except Exception:
+        pass
+    return ids
+
+
+def get_environment_id(url, cookies, project_id):
+    """Get the production environment ID for the project."""
+    trpc_url = f"{url}/api/trpc/project.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22projectId%22%3A%22{project_id}%22%7D%7D%7D"
+    try:
+        response = api_request("GET", trpc_url, cookies=cookies, timeout=30)
+        environments = trpc_data(response, PROJECT_FIELDS)["environments"]
+        for env in environments:
+            if env["name"] == "production":
+                return env["environmentId"]
+    except Exception:
+        pass
+    return None
+
+
+def delete_project(url, cookies, project_id):
+    """Delete a project and all its resources."""
+    print(f"Deleting project {project_id}...")
+    trpc_url_del = f"{url}/api/trpc/project.delete?batch=1"
+    payload = {"0": {"json": {"projectId": project_id}}}
+    
+    # Retry logic for project deletion
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            resp = api_request("POST", trpc_url_del, json=payload, cookies=cookies, timeout=60)
+            print(f"DEBUG: Delete project response status: {resp.status_code}")
+            
+            if resp.status_code == 200:
+                try:
+                    data = resp.json()
+                    # Check for errors in TRPC response
+                    if data and isinstance(data, list) and len(data) > 0:
+                        result = data[0].get("result", {})
+                        if "error" in result or "error" in data[0]:
+                            error_msg = result.get("error") or data[0].get("error")
+                            print(f"DEBUG: TRPC error in response: {error_msg}")
+                            if attempt < max_retries - 1:
+                                print(f"Retrying delete... (attempt {attempt + 2}/{max_retries})")
+                                time.sleep(2)
+                                continue
+                            return False
+                    print(f"Project {project_id} deleted successfully.")
+                    return True
+                except Exception as parse_err:
+                    print(f"DEBUG: Could not parse response: {parse_err}")
+                    # If we can't parse but got 200, assume success
+                    print(f"Project {project_id} deleted (assumed success).")
+                    return True
+            else:
+                print(f"Failed to delete project: {resp.status_code} - {body_preview(resp)}")
+                if attempt < max_retries - 1:
+                    print(f"Retrying delete... (attempt {attempt + 2}/{max_retries})")
+                    time.sleep(2)
+                    continue
+                return False
+        except Exception as e:
+            print(f"Error deleting project: {e}")
+            if attempt < max_retries - 1:
+                print(f"Retrying delete... (attempt {attempt + 2}/{max_retries})")
+                time.sleep(2)
+                continue
+            return False
+    return False
+
+
+def create_project(url, cookies, organization_id, name="Agentic Demos"):
+    """Create a new project in Dokploy."""
+    trpc_url = f"{url}/api/trpc/project.create?batch=1"
+    payload = {
+        "0": {
+            "json": {
+                "name": name,
+                "description": "Automated Project",
+                "projectId": "",
+                "organizationId": organization_id,
+            }
+        }
+    }
+    print(f"Creating project: {name}...")
+    try:
+        response = api_request("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
+        data = response.json()
+        print(f"DEBUG: Create project response structure: {list(data[0].keys())}")
+        result = data[0].get("result", {})
+        if "error" in result:
+             print(f"Error creating project: {result['error']}")
+             return None, None
+             
+        project_data = result["data"]["json"]["project"]
+        env_data = result["data"]["json"]["environment"]
+        print(f"DEBUG: Created Project ID: {project_data.get('projectId')}, Env ID: {env_data.get('environmentId')}")
+        return project_data["projectId"], env_data["environmentId"]
+    except Exception as e:
+        print(f"Exception creating project: {e}")
+        return None, None
+
+
+def create_compose(url, cookies, project_id, environment_id, name, server_id):
+    """Create a Compose application."""
+    trpc_url = f"{url}/api/trpc/compose.create?batch=1"
+    payload = {
+        "0": {
+            "json": {
+                "name": name,
+                "description": f"Compose deployment of {name}",
+                "environmentId": environment_id,
+                "serverId": server_id,
+                "composeType": "docker-compose",
+                "appName": name.lower().replace(" ", "-"),
+            }
+        }
+    }
+    print(f"Creating compose application: {name}...")
+    try:
+        resp = request_with_retry("POST", trpc_url, json=payload, cookies=cookies)
+        data = resp.json()
+        return data[0]["result"]["data"]["json"]["composeId"]
+    except Exception as e:
+        print(f"Error creating compose: {e}")
+        return None
+
+
+def get_all_compose_ids(url, cookies, environment_id):
+    """Fetch all compose apps for a given environment."""
+    trpc_url = f"{url}/api/trpc/compose.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22environmentId%22%3A%22{environment_id}%22%7D%7D%7D"
+    try:
+        apps = trpc_data(api_request("GET", trpc_url, cookies=cookies, timeout=10), COMPOSE_LIST_FIELDS)
+        return [
+            {
+                "name": a["name"],
+                "composeId": a["composeId"],
+                "appName": a.get("appName"),
+                "serverId": a.get("serverId"),
+                "composeStatus": a.get("composeStatus"),
+                "description": a.get("description"),
+            }
+            for a in apps
+        ]
+    except Exception as e:
+        print(f"Error fetching compose apps: {e}")
+        return []
+
+
+def get_compose(url, cookies, compose_id, fields=None):
+    """Fetch the record of a Compose application (appName, suffix, composeStatus, ...).
+
+    The record is reduced to `fields` when given (see dokploy_lib.trpc).
+    """
+    trpc_url = f"{url}/api/trpc/compose.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22composeId%22%3A%22{compose_id}%22%7D%7D%7D"
+    try:
+        return trpc_data(api_request("GET", trpc_url, cookies=cookies, timeout=10), fields)
+    except Exception as e:
+        print(f"Error fetching compose {compose_id}: {e}")
+        return None
+
+
+def get_compose_app_name(url, cookies, compose_id):
+    """Fetch the full appName (with suffix) for a compose service."""
+    trpc_url = f"{url}/api/trpc/compose.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22composeId%22%3A%22{compose_id}%22%7D%7D%7D"
+    try:
+        return trpc_data(api_request("GET", trpc_url, cookies=cookies, timeout=10), ("appName",))["appName"]
+    except Exception as e:
+        print(f"Error fetching app name: {e}")
+        return None
+
+
+def update_compose_git(
+    url, cookies, compose_id, github_url, env_vars=None, ssh_key_id=None, branch="main", compose_command=None
+):
+    """Connect GitHub repo to Compose app."""
+    trpc_url = f"{url}/api/trpc/compose.update?batch=1"
+
+    json_payload = {
+        "composeId": compose_id,
+        "customGitUrl": github_url,
+        "customGitBranch": branch,
+        "sourceType": "git",
+        "composePath": "./docker-compose.yml",
+        "composeStatus": "idle",
+        "watchPaths": [],
+        "enableSubmodules": False,
+        "randomize": True,
+    }
+
+    if compose_command:
+        json_payload["command"] = compose_command
+        print(f"Setting compose command: {compose_command}")
+
+    if env_vars:
+        json_payload["env"] = env_vars
+        json_payload["envVars"] = env_vars
+    
+    if ssh_key_id:
+        json_payload["customGitSSHKeyId"] = ssh_key_id
+
+    meta_payload = {"values": {}}
+    if ssh_key_id is None:
+        meta_payload["values"]["customGitSSHKeyId"] = ["undefined"]
+
+    payload = {
+        "0": {
+            "json": json_payload,
+            "meta": meta_payload,
+        }
+    }
+    print(f"Connecting GitHub (sourceType: git): {github_url} (branch: {branch})...")
+    try:
+        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
+    except Exception as e:
+        print(f"Error updating compose git: {e}")
+
+
+def create_domain(url, cookies, compose_id, host, port, service_name):
+    """Create a domain for a Compose service."""
+    trpc_url = f"{url}/api/trpc/domain.create?batch=1"
+    payload = {
+        "0": {
+            "json": {
+                "host": host,
+                "path": "/",
+                "port": port,
+                "https": True,
+                "composeId": compose_id,
+                "serviceName": service_name,
+                "certificateType": "letsencrypt",
+                "domainType": "compose",
+            }
+        }
+    }
+    print(f"Setting up domain: {host} (service: {service_name}, port: {port})...")
+    try:
+        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
+    except Exception as e:
+        print(f"Error creating domain: {e}")
+
+
+def trpc_batch(url, cookies, calls, timeout=60):
+    """Send several tRPC mutations in one request.
+
+    `calls` is a list of (procedure, json input). Returns one entry per call:
+    the decoded data, or None for a call that failed.
+    """
+    if not calls:
+        return []
+    procedures = ",".join(proc for proc, _ in calls)
+    trpc_url = f"{url}/api/trpc/{procedures}?batch=1"
+    payload = {str(i): {"json": data} for i, (_, data) in enumerate(calls)}
+    resp = request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=timeout)
+    try:
+        body = decode(resp)
+    except ValueError:
+        body = []
+    results = []
+    for i, (proc, _) in enumerate(calls):
+        entry = body[i] if isinstance(body, list) and i < len(body) else {}
+        if "result" in entry:
+            results.append(entry["result"].get("data", {}).get("json"))
+        else:
+            print(f"Error in batched {proc}: {str(entry.get('error', resp.status_code))[:200]}")
+            results.append(None)
+    return results
+
+
+def get_compose_domains(url, cookies, compose_id):
+    """Fetch the domain records of a Compose application."""
+    trpc_url = f"{url}/api/trpc/domain.byComposeId?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22composeId%22%3A%22{compose_id}%22%7D%7D%7D"
+    try:
+        resp = api_request("GET", trpc_url, cookies=cookies, timeout=10).json()
+        return resp[0]["result"]["data"]["json"] or []
+    except Exception as e:
+        print(f"Error fetching domains: {e}")
+        return None
+
+
+DOMAIN_FIELDS = ("host", "path", "port", "https", "serviceName", "certificateType")
+
+
+def sync_domains(url, cookies, compose_id, desired):
+    """Make a compose's domains match `desired`, writing only the differences.
+
+    `desired` is a list of {"host", "port", "serviceName"} (optionally "path",
+    "https", "certificateType"). Existing records are matched by host:
+    missing ones are created, changed ones updated, and the rest (including
+    duplicates left by earlier runs) removed -- all in one batched request.
+    Returns the number of writes, or None when the existing domains could not
+    be read (nothing is written then, since every domain would be created
+    again) or when any of the writes was rejected.
+    """
+    existing = get_compose_domains(url, cookies, compose_id)
+    if existing is None:
+        print(f"Warning: Could not read the domains of {compose_id}; leaving them unchanged this run")
+        return None
+
+    wanted = {}
+    for d in desired:
+        wanted[d["host"]] = {
+            "host": d["host"],
+            "path": d.get("path", "/"),
+            "port": int(d["port"]),
+            "https": d.get("https", True),
+            "serviceName": d["serviceName"],
+            "certificateType": d.get("certificateType", "letsencrypt"),
+        }
+
+    calls = []
+    seen = set()
+    for record in existing:
+        host = record.get("host")
+        target = wanted.get(host)
+        if target is None or host in seen:
+            print(f"Removing domain: {host}")
+            calls.append(("domain.delete", {"domainId": record["domainId"]}))
+            continue
+        seen.add(host)
+        current = dict(record, path=record.get("path") or "/")
+        if any(current.get(f) != target[f] for f in DOMAIN_FIELDS):
+            print(f"Updating domain: {host} (service: {target['serviceName']}, port: {target['port']})")
+            calls.append(("domain.update", dict(target, domainId=record["domainId"], domainType="compose")))
+    for host, target in wanted.items():
+        if host not in seen:
+            print(f"Setting up domain: {host} (service: {target['serviceName']}, port: {target['port']})...")
+            calls.append(("domain.create", dict(target, composeId=compose_id, domainType="compose")))
+
+    if not calls:
+        print(f"Domains of {compose_id} are up to date ({len(wanted)}).")
+        return 0
+    try:
+        results = trpc_batch(url, cookies, calls)
+    except Exception as e:
+        print(f"Error applying domain changes: {e}")
+        return None
+    failed = [
+        f"{proc} {data.get('host') or data.get('domainId')}"
+        for (proc, data), result in zip(calls, results) if result is None
+    ]
+    if failed:
+        print(f"Warning: {len(failed)} of {len(calls)} domain change(s) of {compose_id} failed: {', '.join(failed)}")
+        return None
+    return len(calls)
+
+
+def update_compose_file(url, cookies, compose_id, compose_content, source_type=None):
+    """Update the docker-compose.yml content for a Compose application."""
+    trpc_url = f"{url}/api/trpc/compose.update?batch=1"
+    json_data = {
+        "composeId": compose_id,
+    }
+    if compose_content is not None:
+        json_data["composeFile"] = compose_content
+    if source_type:
+        json_data["sourceType"] = source_type
+        
+    payload = {
+        "0": {
+            "json": json_data
+        }
+    }
+    print(f"Updating compose file for {compose_id} (sourceType={source_type})...")
+    try:
+        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
+    except Exception as e:
+        print(f"Error updating compose file: {e}")
+
+
+def update_compose_env(url, cookies, compose_id, env_content):
+    """Update environment variables for a Compose application."""
+    trpc_url = f"{url}/api/trpc/compose.update?batch=1"
+    payload = {
+        "0": {
+            "json": {
+                "composeId": compose_id,
+                "envVars": env_content,
+                "env": env_content
+            }
+        }
+    }
+    print(f"Updating environment variables for {compose_id}...")
+    try:
+        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
+    except Exception as e:
+        print(f"Error updating environment variables: {e}")
+
+
+def update_compose_description(url, cookies, compose_id, description):
+    """Set the description of a Compose application."""
+    trpc_url = f"{url}/api/trpc/compose.update?batch=1"
+    payload = {"0": {"json": {"composeId": compose_id, "description": description}}}
+    try:
+        request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=30)
+    except Exception as e:
+        print(f"Error updating compose description: {e}")
+
+
+def deploy_compose(url, cookies, compose_id):
+    """Trigger deployment for Compose app."""
+    trpc_url = f"{url}/api/trpc/compose.deploy?batch=1"
+    payload = {"0": {"json": {"composeId": compose_id, "title": "Automated Setup"}}}
+    print(f"Triggering deployment for compose {compose_id}...")
+    try:
+        resp = request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=60)
+        return resp.status_code == 200
+    except Exception as e:
+        print(f"Error deploying compose: {e}")
+        return False
+
+
+def get_latest_deployment(url, cookies, compose_id):
+    """Return the most recent deployment record of a compose (status, logPath, ...) or None."""
+    trpc_url = f"{url}/api/trpc/deployment.allByCompose?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22composeId%22%3A%22{compose_id}%22%7D%7D%7D"
+    try:
+        resp = api_request("GET", trpc_url, cookies=cookies, timeout=10).json()
+        deployments = resp[0]["result"]["data"]["json"]
+    except Exception as e:
+        print(f"Error fetching deployments of compose {compose_id}: {e}")
+        return None
+    if not deployments:
+        return None
+    return max(deployments, key=lambda d: d.get("createdAt") or "")
+
+
+def wait_for_server_ready(url, cookies, server_id, timeout=300, interval=10):
+    """Wait for server status to become active."""
+    print(f"Waiting for server {server_id} to be active...")
+    start_time = time.time()
+    trpc_url = f"{url}/api/trpc/server.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22serverId%22%3A%22{server_id}%22%7D%7D%7D"
+    while time.time() - start_time < timeout:
+        try:
+            resp = api_request("GET", trpc_url, cookies=cookies, timeout=10)
+            status = trpc_data(resp, ("serverStatus",))["serverStatus"]
+            if status == "active":
+                print("Server is active!")
+                return True
+            print(f"Server status: {status} (waiting...)")
+        except Exception as e:
+            print(f"Error checking server status: {e}")
+        time.sleep(interval)
+    return False
+
+
+def reload_traefik(url, cookies, server_id=None):
+    """Recreate Traefik on a server (or the Dokploy host) so it reloads acme.json and its config."""
+    trpc_url = f"{url}/api/trpc/settings.reloadTraefik?batch=1"
+    payload = {"0": {"json": {"serverId": server_id} if server_id else None}}
+    try:
+        resp = request_with_retry("POST", trpc_url, json=payload, cookies=cookies, timeout=120)
+        return resp.status_code == 200
+    except Exception as e:
+        print(f"Error reloading Traefik: {e}")
+        return False
+
+
+def set_docker_cleanup(url, cookies, enabled, server_id=None):
+    """Turn Dokploy's Docker cleanup (image, container and build-cache prune) on or off for a server."""
+    trpc_url = f"{url}/api/trpc/settings.updateDockerCleanup?batch=1"
+    payload = {"0": {"json": {"enableDockerCleanup": enabled, "serverId": server_id}}}
+    try:
+        resp = request_with_retry("POST", trpc_url, json=payload, cookies=cookies)
+        return resp.status_code == 200
+    except Exception as e:
+        print(f"Warning: Could not update Docker cleanup setting: {e}")
+        return False
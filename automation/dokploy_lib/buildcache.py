@@ -0,0 +1,79 @@
+"""Keeping the BuildKit layer cache across clean rebuilds, and measuring its hits.
+
+Apps built from source (Dockerfiles in their repos) are built by the Docker
+daemon on the deploy server, whose BuildKit cache survives a clean rebuild
+unless something prunes it: Dokploy's Docker cleanup does (``docker builder
+prune --all``). The automation turns that cleanup off on its deploy servers
+and caps the cache itself instead, trimming the least recently used records
+down to the cap before the apps are built.
+
+Cache hits are counted from the streamed build logs: every Dockerfile step
+(``[service 3/7] RUN ...``) is a build step, and the ones BuildKit reports as
+``CACHED`` are hits. Both the plain progress output (``#7 [web 3/7] ...`` then
+``#7 CACHED``) and the TTY one (``=> CACHED [web 3/7] ...``) are understood.
+"""
+import re
+
+DEFAULT_CACHE_CAP = "20GB"
+
+PLAIN_STEP = re.compile(r"^#(\d+) \[([^\]]*\d+/\d+)\]")
+PLAIN_CACHED = re.compile(r"^#(\d+) CACHED\b")
+TTY_STEP = re.compile(r"=> (CACHED )?\[([^\]]*\d+/\d+)\]")
+
+
+def new_tally():
+    """Empty per-build cache tally, filled by count_cache_line."""
+    return {"vertices": {}, "steps": set(), "cached": set()}
+
+
+def count_cache_line(tally, line):
+    """Account one build log line in `tally`."""
+    match = PLAIN_STEP.match(line)
+    if match:
+        tally["vertices"][match.group(1)] = match.group(2)
+        tally["steps"].add(match.group(2))
+        return
+    match = PLAIN_CACHED.match(line)
+    if match:
+        step = tally["vertices"].get(match.group(1))
+        if step:
+            tally["cached"].add(step)
+        return
+    match = TTY_STEP.search(line)
+    if match:
+        tally["steps"].add(match.group(2))
+        if match.group(1):
+            tally["cached"].add(match.group(2))
+
+
+def cache_summary(tally):
+    """(cached steps, build steps) of a tally, or None if nothing was built."""
+    if not tally or not tally["steps"]:
+        return None
+    return len(tally["cached"] & tally["steps"]), len(tally["steps"])
+
+
+def format_ratio(cached, steps):
+    return f"{cached}/{steps} steps cached ({cached / steps * 100:.0f}%)"
+
+
+def retain_build_cache(ip_address, username, key_path, cap=DEFAULT_CACHE_CAP):
+    """Trim the server's build cache to `cap` (LRU) and return its size in MB, or None."""
+    from .admission import parse_memory
+    from .remote import run_plan
+
+    results = run_plan(ip_address, username, key_path, [
+        {"op": "docker", "args": ["builder", "prune", "--force", "--keep-storage", cap]},
+        {"op": "docker", "args": ["system", "df", "--format", "{{.Type}}\t{{.Size}}"]},
+    ], timeout=300)
+    if results is None:
+        print(f"Warning: Could not trim the build cache on {ip_address}")
+        return None
+    prune, usage = results
+    if not prune["ok"]:
+        print(f"Warning: Build cache trim failed on {ip_address}: {prune.get('error')}")
+    for line in (usage.get("output") or "").splitlines():
+        kind, _, size = line.partition("\t")
+        if kind == "Build Cache":
+            return round(parse_memory(size), 1)
+    return None
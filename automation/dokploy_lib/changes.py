@@ -0,0 +1,93 @@
+"""Input fingerprints, for redeploying only the apps that failed or changed.
+
+An app's inputs are its config entry, env file, locally rendered compose file
+and the commit at the tip of its branch. Their hash is stored in the compose's
+description, and compared on the next run. It is stored as pending when the
+deployment is triggered and only counts once that deployment is known to have
+succeeded: confirmed by --wait-deploy, or Dokploy reporting the compose done.
+"""
+import os
+import json
+import shlex
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+FINGERPRINT_PREFIX = "automation-inputs:"
+
+# Stored instead of the fingerprint when a watched deployment did not succeed
+# (fail-fast can end the run before Dokploy itself marks the compose as error)
+FAILED_MARKER = FINGERPRINT_PREFIX + "failed"
+
+# Prefix of a fingerprint whose deployment has not been seen to succeed yet
+PENDING_MARKER = FINGERPRINT_PREFIX + "pending:"
+
+
+def remote_git_head(repo_url, branch="main", key_path=None):
+    """Commit SHA at the tip of a remote branch (git ls-remote), or None."""
+    env = dict(os.environ)
+    if key_path:
+        env["GIT_SSH_COMMAND"] = (
+            f"ssh -i {shlex.quote(os.path.expanduser(key_path))} -o StrictHostKeyChecking=no"
+        )
+    try:
+        proc = subprocess.run(
+            ["git", "ls-remote", repo_url, f"refs/heads/{branch}"],
+            capture_output=True, text=True, timeout=30, env=env,
+        )
+    except Exception as e:
+        print(f"Warning: Could not query {repo_url}: {e}")
+        return None
+    if proc.returncode != 0 or not proc.stdout.strip():
+        print(f"Warning: Could not resolve {branch} of {repo_url}: {proc.stderr.strip()[:200]}")
+        return None
+    return proc.stdout.split()[0]
+
+
+def remote_git_heads(app_configs, key_path=None, parallelism=8):
+    """Resolve the branch tip of every app's repo concurrently -> {app name: sha or None}."""
+    if not app_configs:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(app_configs))) as pool:
+        heads = pool.map(
+            lambda c: remote_git_head(c["repo"], c.get("branch", "main"), key_path), app_configs
+        )
+        return {cfg["name"]: head for cfg, head in zip(app_configs, heads)}
+
+
+def app_fingerprint(cfg, env_content=None, compose_content=None, commit=None):
+    payload = json.dumps(
+        {"config": cfg, "env": env_content, "compose": compose_content, "commit": commit},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def stored_fingerprint(compose):
+    description = (compose or {}).get("description") or ""
+    if description.startswith(FINGERPRINT_PREFIX):
+        return description[len(FINGERPRINT_PREFIX):].strip()
+    return None
+
+
+def redeploy_reason(existing_app, fingerprint):
+    """Why an app has to be (re)deployed, or None if it can stay as it is."""
+    if existing_app is None:
+        return "new app"
+    status = existing_app.get("composeStatus")
+    if status == "error":
+        return "last deployment failed"
+    if status in (None, "idle"):
+        return "not deployed yet"
+    stored = stored_fingerprint(existing_app)
+    if stored is None:
+        return "no recorded inputs"
+    if FINGERPRINT_PREFIX + stored == FAILED_MARKER:
+        return "last deployment failed"
+    if (FINGERPRINT_PREFIX + stored).startswith(PENDING_MARKER):
+        if status != "done":
+            return "last deployment not confirmed"
+        stored = (FINGERPRINT_PREFIX + stored)[len(PENDING_MARKER):]
+    if stored != fingerprint:
+        return "inputs changed"
+    return None
@@ -0,0 +1,362 @@
+"""Compose file transformations: domain templating, env injection, sanitizing and parsing."""
+import os
+import re
+
+from .envfiles import read_env_file
+
+ROOT_DOMAIN = "cpdemo.ca"
+
+
+def set_root_domain(domain):
+    """Set the domain substituted for {{DOMAIN}} by replace_domain."""
+    global ROOT_DOMAIN
+    ROOT_DOMAIN = domain
+
+
+def replace_domain(content, domain=None):
+    domain = domain or ROOT_DOMAIN
+    if content is None: return None
+    if isinstance(content, str):
+        return content.replace("{{DOMAIN}}", domain)
+    if isinstance(content, list):
+        return [replace_domain(i, domain) for i in content]
+    if isinstance(content, dict):
+        return {k: replace_domain(v, domain) for k, v in content.items()}
+    return content
+
+
+def sanitize_compose_file(content, app_name, app_path=None):
+    """Refined sanitization for Dokploy compatibility."""
+    # 0. Expand Tildes and standardize relative paths BEFORE volume regex
+    content = content.replace("~/.flowise", "./flowise_data")
+    content = content.replace("~/.n8n", "./n8n_data")
+    content = content.replace("~/.docker", "./docker_config")
+    content = content.replace("~/", "./")
+
+    # 1. Inject env_file: [".env"] into every service
+    lines = content.splitlines()
+    new_lines = []
+    in_services = False
+    
+    for line in lines:
+        stripped = line.strip()
+        if stripped == "services:":
+            in_services = True
+            new_lines.append(line)
+            continue
+        
+        if in_services and line.startswith("  ") and not line.startswith("    ") and stripped.endswith(":"):
+            new_lines.append(line)
+            # Add env_file right after service definition
+            indent = "    "
+            new_lines.append(f"{indent}env_file:")
+            new_lines.append(f"{indent}  - .env")
+            continue
+        
+        new_lines.append(line)
+    
+    content = "\n".join(new_lines)
+
+    # 2. Fix OLLAMA_HOST warnings (escaped $$ for Dokploy inner parser)
+    content = content.replace("@ $OLLAMA_HOST", "@ $${OLLAMA_HOST}")
+    content = content.replace("@ $$OLLAMA_HOST", "@ $${OLLAMA_HOST}")
+    content = content.replace('OLLAMA_HOST="$OLLAMA_HOST"', 'OLLAMA_HOST="$${OLLAMA_HOST}"')
+    
+    # 3. Handle Volumes and Build Contexts - Convert to Absolute
+    if app_path:
+        # Standardize relative mounts/contexts to absolute paths using regex
+        # This targets anything starting with ./ after a space, hyphen, or colon
+        content = re.sub(r'((?:^|\s+)-\s+("?))\./', rf'\1{app_path}/', content, flags=re.MULTILINE)
+        content = re.sub(r'(:)\./', f':{app_path}/', content)
+        content = re.sub(r'(context:\s+)\./', f'\\1{app_path}/', content)
+        content = re.sub(r'(env_file:\s+)\./', f'\\1{app_path}/', content)
+
+    if "Lakera" in app_name:
+        lines = content.splitlines()
+        new_lines = []
+        for line in lines:
+            if ".:/app" in line: continue
+            new_lines.append(line)
+        content = "\n".join(new_lines)
+
+    return content
+
+
+def hard_inject_env_vars(content, env_file_path):
+    """Replace ${VAR} and ${VAR:-default} with actual values or defaults.
+
+    Preserves $${VAR} docker-compose escape sequences (runtime variables)
+    and bare $VAR references inside shell command blocks.
+    Only replaces ${VAR} (braced form), which is the docker-compose
+    interpolation syntax for build-time substitution.
+    """
+    if not env_file_path or not os.path.exists(env_file_path):
+        return content
+
+    try:
+        env_vars = read_env_file(env_file_path)
+    except Exception as e:
+        print(f"Warning: Could not read env file for hard injection: {e}")
+        return content
+
+    # 0. Protect $${...} and $$VAR escape sequences with placeholders.
+    #    These are docker-compose escapes meant for runtime resolution
+    #    inside containers and must NOT be replaced at build time.
+    _protected = {}
+    _counter = [0]
+
+    def _protect(match):
+        key = f"__DBLDOLLAR_{_counter[0]}__"
+        _protected[key] = match.group(0)
+        _counter[0] += 1
+        return key
+
+    content = re.sub(r'\$\$\{[^}]+\}', _protect, content)
+    content = re.sub(r'\$\$[A-Za-z_][A-Za-z0-9_]*', _protect, content)
+
+    # 1. First pass: Handle ${VAR:-default}
+    def resolve_default(match):
+        var_name = match.group(1)
+        default_val = match.group(2)
+        return env_vars.get(var_name, default_val)
+
+    content = re.sub(r'\$\{([^}:-]+):-([^}]*)\}', resolve_default, content)
+
+    # 2. Second pass: Handle ${VAR} (braced form only)
+    #    We intentionally do NOT replace bare $VAR because those are
+    #    shell variable references inside command: blocks.
+    for k in sorted(env_vars.keys(), key=len, reverse=True):
+        v = env_vars[k]
+        content = content.replace(f"${{{k}}}", v)
+
+    # 3. Third pass: Clean up remaining unresolved ${VAR} patterns
+    def cleanup_unresolved(match):
+        print(f"DEBUG: Resolving empty variable {match.group(0)}")
+        return ""
+
+    content = re.sub(r'\$\{[^}]+\}', cleanup_unresolved, content)
+
+    # 4. Restore protected double-dollar escape sequences
+    for key, original in _protected.items():
+        content = content.replace(key, original)
+
+    return content
+
+
+LOCAL_COMPOSE_PATHS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "cp-agentic-mcp-playground", "docker-compose.yml"),
+    os.path.expanduser("~/Desktop/cp-agentic-mcp-playground/docker-compose.yml"),
+    "C:/Users/admin/Desktop/cp-agentic-mcp-playground/docker-compose.yml",
+    "/Users/khalid/Desktop/cp-agentic-mcp-playground/docker-compose.yml",
+]
+
+
+def find_local_compose(app_name):
+    """Locate the local compose file pushed in place of the repo's (Agentic Playground only)."""
+    if "Agentic" not in app_name and "Playground" not in app_name:
+        return None
+    for p in LOCAL_COMPOSE_PATHS:
+        if os.path.exists(p):
+            return p
+    return None
+
+
+# Keys of the long `ports:` syntax (- target: 80 / published: 8080 ...)
+LONG_PORT_KEYS = ("target", "published", "protocol", "host_ip", "mode", "name", "app_protocol")
+
+# List-valued service keys collected by parse_compose_services -> keys of their long syntax
+LIST_KEYS = {
+    "ports": LONG_PORT_KEYS,
+    "volumes": ("type", "source", "target", "read_only", "bind", "volume", "tmpfs", "consistency"),
+    "env_file": ("path", "required", "format"),
+    "networks": (),
+}
+
+
+def parse_compose_services(content):
+    """Minimal line-based parse of the services: block.
+
+    Returns {service: {"image": str|None, "build": bool, "context": str|None,
+    "profiles": [..], "ports": [..], "volumes": [..], "env_file": [..], "networks": [..]}}.
+    Only the keys needed for image pre-pulling, port checks and linting are
+    extracted; list entries are short-syntax strings or dicts of the long
+    syntax, and networks given as a mapping are listed by name.
+    """
+    services = {}
+    current = None
+    service_indent = None
+    in_services = False
+    in_profiles = False
+    list_key = None
+    list_indent = None
+    item_indent = None
+    list_item = None
+    for line in content.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip())
+        stripped = line.strip()
+        if indent == 0:
+            in_services = stripped == "services:"
+            current = None
+            continue
+        if not in_services:
+            continue
+        if service_indent is None:
+            service_indent = indent
+        if indent == service_indent and stripped.endswith(":"):
+            current = services.setdefault(stripped[:-1].strip("'\""), {
+                "image": None, "build": False, "context": None, "profiles": [],
+                **{key: [] for key in LIST_KEYS},
+            })
+            in_profiles = False
+            list_key = None
+            continue
+        if current is None or indent <= service_indent:
+            continue
+        if list_key is not None:
+            # List items may sit at the key's own indent
+            if indent > list_indent or (indent == list_indent and stripped.startswith("- ")):
+                item = stripped.split(" #")[0].strip()
+                if item_indent is None:
+                    item_indent = indent
+                if item.startswith("- ") and indent == item_indent:
+                    item = item[2:].strip()
+                    item_key, sep, item_value = item.partition(":")
+                    if sep and item_key.strip() in LIST_KEYS[list_key]:
+                        list_item = {item_key.strip(): item_value.strip().strip("'\"")}
+                        current[list_key].append(list_item)
+                    else:
+                        list_item = None
+                        current[list_key].append(item.strip("'\""))
+                elif list_item is not None:
+                    item_key, _, item_value = item.partition(":")
+                    list_item[item_key.strip()] = item_value.strip().strip("'\"")
+                elif list_key == "networks" and indent == item_indent:
+                    # Mapping form: `front:` / `back: {aliases: [..]}`
+                    current["networks"].append(item.partition(":")[0].strip().strip("'\""))
+                continue
+            list_key = None
+        key, _, value = stripped.partition(":")
+        value = value.strip()
+        if in_profiles and stripped.startswith("- "):
+            current["profiles"].append(stripped[2:].strip().strip("'\""))
+            continue
+        in_profiles = False
+        if key == "image" and value:
+            current["image"] = value.strip("'\"")
+        elif key == "build":
+            current["build"] = True
+            current["context"] = value.strip("'\"") or None
+        elif key == "context" and value and current["build"]:
+            current["context"] = value.strip("'\"")
+        elif key == "profiles":
+            if value.startswith("["):
+                current["profiles"] = [p.strip().strip("'\"") for p in value.strip("[]").split(",") if p.strip()]
+            else:
+                in_profiles = True
+        elif key in LIST_KEYS:
+            if value.startswith("["):
+                current[key] += [p.strip().strip("'\"") for p in value.strip("[]").split(",") if p.strip()]
+            elif value:
+                current[key].append(value.strip("'\""))  # env_file: .env
+            else:
+                list_key, list_indent, item_indent, list_item = key, indent, None, None
+    return services
+
+
+def top_level_names(content, section):
+    """Names declared under a top-level section (networks:, volumes:) of a compose file."""
+    names = []
+    in_section = False
+    name_indent = None
+    for line in content.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip())
+        if indent == 0:
+            in_section = line.strip().split(" #")[0].rstrip() == f"{section}:"
+            name_indent = None
+            continue
+        if not in_section:
+            continue
+        if name_indent is None:
+            name_indent = indent
+        if indent == name_indent:
+            names.append(line.strip().partition(":")[0].strip("'\""))
+    return names
+
+
+def _render_for_parse(content, env_file=None):
+    """Resolve ${VAR} from the env file and ${VAR:-default} to its default."""
+    if env_file:
+        content = hard_inject_env_vars(content, env_file)
+    return re.sub(r"\$\{[^}:-]+:-([^}]*)\}", r"\1", content)
+
+
+def _is_started(service, compose_command=None):
+    """False for services behind a profile the compose command does not enable."""
+    active_profiles = set(re.findall(r"--profile[ =](\S+)", compose_command or ""))
+    return not service["profiles"] or bool(active_profiles.intersection(service["profiles"]))
+
+
+def extract_compose_images(content, compose_command=None, env_file=None):
+    """Return the pullable image references a compose file will start.
+
+    Services built from source are skipped (their image tag is produced by
+    the build), as are services hidden behind a profile that the configured
+    compose command does not enable.
+    """
+    content = _render_for_parse(content, env_file)
+    images = []
+    for svc in parse_compose_services(content).values():
+        image = svc["image"]
+        if not image or svc["build"] or "$" in image:
+            continue
+        if not _is_started(svc, compose_command):
+            continue
+        if not re.match(r"^[A-Za-z0-9._/:@-]+$", image):
+            continue
+        if image not in images:
+            images.append(image)
+    return images
+
+
+def _port_range(value):
+    """[ports] of "8080" or "8080-8082"; [] for anything else (unset, unresolved)."""
+    first, _, last = str(value).partition("-")
+    if not first.isdigit() or (last and not last.isdigit()):
+        return []
+    return list(range(int(first), int(last or first) + 1))
+
+
+def parse_port(entry):
+    """Host ports published by one `ports:` entry, as [(port, protocol)].
+
+    Handles "3000" (container port only: nothing published), "8080:80",
+    "127.0.0.1:8080:80", "[::1]:8080:80", "9000-9001:9000-9001/udp" and the
+    long syntax; "127.0.0.1::80" (random host port) publishes nothing fixed.
+    """
+    if isinstance(entry, dict):
+        published, protocol = entry.get("published"), entry.get("protocol") or "tcp"
+    else:
+        spec, _, protocol = entry.partition("/")
+        head, sep, _container = spec.rpartition(":")
+        if not sep:
+            return []
+        published = head.rpartition(":")[2] if not head.endswith("]") else ""
+        protocol = protocol or "tcp"
+    return [(port, protocol) for port in _port_range(published or "")]
+
+
+def published_ports(content, compose_command=None, env_file=None):
+    """{service: [(host port, protocol)]} of the services a compose file will start."""
+    content = _render_for_parse(content, env_file)
+    ports = {}
+    for name, svc in parse_compose_services(content).items():
+        if not _is_started(svc, compose_command):
+            continue
+        claimed = [port for entry in svc["ports"] for port in parse_port(entry)]
+        if claimed:
+            ports[name] = claimed
+    return ports
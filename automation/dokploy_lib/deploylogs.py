@@ -0,0 +1,200 @@
+"""Follow deployment build logs as they are written and fail fast on known errors.
+
+Failure patterns are regexes matched (case-insensitively) against every log
+line. The defaults below can be extended per app in dokploy_config.json::
+
+    "failurePatterns": {"migrations": "alembic.*Error"}    # or a plain list of regexes
+
+and for all apps with ``--failure-pattern``.
+"""
+import re
+import threading
+import time
+from datetime import datetime
+
+from .api import deploy_compose, get_latest_deployment
+from .buildcache import cache_summary, count_cache_line, new_tally
+from .ssh import follow_remote_file
+
+DEFAULT_FAILURE_PATTERNS = {
+    "port_in_use": r"port is already allocated|address already in use",
+    "pull_denied": r"pull access denied|requested access to the resource is denied|manifest unknown",
+    "oom": r"OOMKilled|out of memory|cannot allocate memory|exit code: 137",
+    "disk_full": r"no space left on device",
+    "build_failed": r"failed to solve:|did not complete successfully",
+}
+
+# Tolerated clock difference between this machine and Dokploy when telling
+# the deployment we triggered apart from the previous one
+CLOCK_SKEW = 60
+
+
+def compile_failure_patterns(*extra):
+    """Defaults plus any number of {label: regex} dicts or regex lists -> [(label, compiled)]."""
+    merged = dict(DEFAULT_FAILURE_PATTERNS)
+    for patterns in extra:
+        if isinstance(patterns, dict):
+            merged.update(patterns)
+        else:
+            for pattern in patterns or []:
+                merged[pattern] = pattern
+    return [(label, re.compile(pattern, re.IGNORECASE)) for label, pattern in merged.items()]
+
+
+def match_failure(line, patterns):
+    """Return the label of the first pattern found in the line, or None."""
+    for label, regex in patterns:
+        if regex.search(line):
+            return label
+    return None
+
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def start_log_follower(name, ip_address, username, key_path, log_path, patterns, wake=None, echo=True):
+    """Tail a deployment log in a background thread, remembering the first failure.
+
+    The returned state dict gets "failure" = (label, line) as soon as a
+    pattern matches; `wake` (a threading.Event) is set at that moment.
+    "cache" tallies the build steps BuildKit served from its cache.
+    """
+    state = {"failure": None, "lines": 0, "proc": None, "cache": new_tally()}
+    try:
+        state["proc"] = follow_remote_file(ip_address, username, key_path, log_path)
+    except Exception as e:
+        print(f"Warning: Could not follow deployment log of {name}: {e}")
+        return state
+
+    def reader():
+        for line in state["proc"].stdout:
+            line = line.rstrip()
+            state["lines"] += 1
+            if echo:
+                print(f"  [{name}] {line}")
+            count_cache_line(state["cache"], line)
+            if state["failure"] is None:
+                label = match_failure(line, patterns)
+                if label:
+                    state["failure"] = (label, line)
+                    if wake:
+                        wake.set()
+
+    state["thread"] = threading.Thread(target=reader, name=f"log-{name}", daemon=True)
+    state["thread"].start()
+    return state
+
+
+def stop_log_follower(state, drain=1.0):
+    """Stop tailing; gives the reader `drain` seconds to catch up first."""
+    if not state or not state["proc"]:
+        return
+    state["thread"].join(drain)
+    state["proc"].terminate()
+    try:
+        state["proc"].wait(5)
+    except Exception:
+        state["proc"].kill()
+
+
+def watch_deployments(
+    url, cookies, triggered, app_hosts, username, key_path,
+    patterns=None, retries=0, timeout=1800, interval=5, echo=True, build_cache=None, deployment_ids=None,
+):
+    """Wait for triggered deployments while streaming their build logs.
+
+    `triggered` maps app name -> (compose_id, trigger_time); `app_hosts` maps
+    app name -> IP of the server that builds it (apps without one are only
+    polled); `patterns` maps app name -> compiled failure patterns.
+
+    An app is marked failed as soon as a failure pattern shows up in its log,
+    without waiting for the build to end, and redeployed up to `retries` times.
+    Returns app name -> (status, seconds from trigger to outcome or None),
+    where status is done, error, failed:<pattern label> or timeout.
+    When given, `build_cache` is filled with app name -> (cached steps,
+    build steps) of the last streamed build that built anything, and
+    `deployment_ids` with app name -> ID of the deployment that decided it.
+    """
+    patterns = patterns or {}
+    default_patterns = compile_failure_patterns()
+    wake = threading.Event()
+    apps = {
+        name: {
+            "compose_id": compose_id,
+            "triggered_at": triggered_at,
+            "attempt": 0,
+            "stale_id": None,
+            "deployment_id": None,
+            "follower": None,
+        }
+        for name, (compose_id, triggered_at) in triggered.items()
+    }
+    results = {}
+
+    def finish(name, status):
+        app = apps[name]
+        stop_log_follower(app["follower"], drain=0)
+        summary = app["follower"] and cache_summary(app["follower"]["cache"])
+        if summary and build_cache is not None:
+            build_cache[name] = summary
+        app["follower"] = None
+        if status not in ("done", "timeout") and app["attempt"] < retries:
+            app["attempt"] += 1
+            print(f"Retrying deployment of {name} after {status} (attempt {app['attempt'] + 1}/{retries + 1})...")
+            app["stale_id"] = app["deployment_id"]
+            app["deployment_id"] = None
+            if deploy_compose(url, cookies, app["compose_id"]):
+                return
+        duration = time.time() - app["triggered_at"]
+        if deployment_ids is not None and app["deployment_id"]:
+            deployment_ids[name] = app["deployment_id"]
+        print(f"Deployment of {name} finished: {status} ({duration:.0f}s)")
+        results[name] = (status, duration)
+        del apps[name]
+
+    start_time = time.time()
+    print(f"Waiting for {len(apps)} deployment(s) to finish (streaming build logs)...")
+    while apps and time.time() - start_time < timeout:
+        wake.clear()
+        for name, app in list(apps.items()):
+            follower = app["follower"]
+            if follower and follower["failure"]:
+                label, line = follower["failure"]
+                print(f"FAIL-FAST: {name} log matched '{label}': {line}")
+                finish(name, f"failed:{label}")
+                continue
+
+            deployment = get_latest_deployment(url, cookies, app["compose_id"])
+            if not deployment or deployment.get("deploymentId") == app["stale_id"]:
+                continue
+            created = parse_timestamp(deployment.get("createdAt"))
+            if app["deployment_id"] is None:
+                if created and created < app["triggered_at"] - CLOCK_SKEW:
+                    continue  # Still the previous deployment; ours is queued
+                app["deployment_id"] = deployment.get("deploymentId")
+                log_path = deployment.get("logPath")
+                if log_path and app_hosts.get(name):
+                    app["follower"] = start_log_follower(
+                        name, app_hosts[name], username, key_path, log_path,
+                        patterns.get(name, default_patterns), wake=wake, echo=echo,
+                    )
+
+            status = deployment.get("status")
+            if status in ("done", "error"):
+                stop_log_follower(app["follower"])  # drain, so a late failure line is still seen
+                failure = app["follower"] and app["follower"]["failure"]
+                finish(name, f"failed:{failure[0]}" if failure and status == "error" else status)
+        if apps:
+            wake.wait(interval)
+
+    for name, app in apps.items():
+        stop_log_follower(app["follower"])
+        print(f"Timeout waiting for deployment of {name}")
+        results[name] = ("timeout", None)
+    return results
@@ -0,0 +1,195 @@
+"""Disk-pressure-aware Docker garbage collection on the deploy servers.
+
+Repeated rebuilds leave stopped containers, superseded images and build
+cache behind on the VM's Docker disk. Before the apps are deployed, each
+server's Docker disk usage is measured by category (``docker system df``)
+together with how full its filesystem is. Only when the disk is fuller than
+the threshold, or the build cache is over its cap, is the GC policy applied:
+
+- stopped containers are removed
+- of each image repository, only the `keep_images` most recent images are
+  kept, and dangling images go. Images used by a container are never removed,
+  nor are the images the configured apps' compose files reference: a clean
+  rebuild has stopped their containers but is about to pull them again
+- the build cache is trimmed to its cap, least recently used first
+
+Usage is measured again afterwards, so the report shows what was reclaimed
+per category and how long it took. Volumes are never touched.
+"""
+import time
+from datetime import datetime
+
+from .admission import parse_memory
+
+DEFAULT_GC_THRESHOLD = 80  # % of the Docker filesystem in use
+DEFAULT_KEEP_IMAGES = 2
+
+# `docker system df` types -> category names
+CATEGORIES = {"Images": "images", "Containers": "containers", "Local Volumes": "volumes", "Build Cache": "build_cache"}
+
+IMAGE_FORMAT = "{{.ID}}\t{{.Repository}}\t{{.Tag}}\t{{.CreatedAt}}"
+
+
+def usage_ops():
+    return [
+        {"op": "docker", "group": "df", "args": ["system", "df", "--format", "{{.Type}}\t{{.Size}}\t{{.Reclaimable}}"]},
+        {"op": "run", "group": "fs", "cmd": "df -Pm /var/lib/docker/ | tail -1"},
+        {"op": "docker", "group": "images", "args": ["images", "--no-trunc", "--format", IMAGE_FORMAT]},
+        {"op": "run", "group": "in_use",
+         "cmd": "docker ps -aq --no-trunc | xargs -r docker inspect --format '{{.Image}}'"},
+    ]
+
+
+def parse_usage(results):
+    """Disk usage from the usage_ops results.
+
+    {"categories": {category: {"size", "reclaimable"} (MB)}, "disk_used_pct",
+    "disk_available" (MB), "images": [(id, repository, tag, created)], "in_use": {image id}}
+    """
+    system_df, fs, images, in_use = results
+    usage = {"categories": {}, "disk_used_pct": None, "disk_available": None, "images": [], "in_use": set()}
+    for line in (system_df.get("output") or "").splitlines():
+        kind, _, rest = line.partition("\t")
+        size, _, reclaimable = rest.partition("\t")
+        if kind in CATEGORIES:
+            usage["categories"][CATEGORIES[kind]] = {
+                "size": round(parse_memory(size), 1), "reclaimable": round(parse_memory(reclaimable), 1),
+            }
+    fields = (fs.get("output") or "").split()
+    if len(fields) >= 5 and fields[3].isdigit():
+        usage["disk_available"] = int(fields[3])
+        usage["disk_used_pct"] = int(fields[4].rstrip("%"))
+    for line in (images.get("output") or "").splitlines():
+        fields = line.split("\t")
+        if len(fields) == 4:
+            usage["images"].append(tuple(fields))
+    usage["in_use"] = set((in_use.get("output") or "").split())
+    return usage
+
+
+def docker_disk_usage(ip_address, username, key_path):
+    """Measure a server's Docker disk usage (see parse_usage), or None if it could not be read."""
+    from .remote import run_plan
+
+    results = run_plan(ip_address, username, key_path, usage_ops(), timeout=120)
+    if results is None or not results[0].get("ok"):
+        return None
+    return parse_usage(results)
+
+
+def image_created(value):
+    """Sort key of a `docker images` CreatedAt value (e.g. 2024-05-01 10:00:00 +0000 UTC)."""
+    try:
+        return datetime.strptime(" ".join(value.split()[:3]), "%Y-%m-%d %H:%M:%S %z").timestamp()
+    except ValueError:
+        return 0.0
+
+
+def image_key(ref):
+    """(repository, tag) of an image reference as `docker images` lists it; tag None for a digest."""
+    name, _, digest = ref.partition("@")
+    tag = "latest"
+    if ":" in name.rpartition("/")[2]:
+        name, _, tag = name.rpartition(":")
+    for prefix in ("docker.io/library/", "docker.io/", "library/"):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return name, None if digest else tag
+
+
+def superseded_images(images, in_use, keep=DEFAULT_KEEP_IMAGES, protected=()):
+    """IDs of the images beyond the `keep` most recent of their repository.
+
+    Images in use and images matching a `protected` reference are never included.
+    """
+    protected = [image_key(ref) for ref in protected]
+    by_repo = {}
+    keep_ids = set(in_use)
+    for image_id, repository, tag, created in images:
+        if repository == "<none>":
+            continue  # Dangling: left to `docker image prune`
+        by_repo.setdefault(repository, {})
+        by_repo[repository].setdefault(image_id, image_created(created))
+        if any(repository == r and t in (None, tag) for r, t in protected):
+            keep_ids.add(image_id)
+    remove = []
+    for repository, ids in by_repo.items():
+        newest_first = sorted(ids, key=ids.get, reverse=True)
+        remove.extend(i for i in newest_first[keep:] if i not in keep_ids)
+    return sorted(set(remove))
+
+
+def gc_needed(usage, threshold=DEFAULT_GC_THRESHOLD, cache_cap=None):
+    """Reason to collect garbage on a server, or None when it is below every threshold."""
+    if usage["disk_used_pct"] is not None and usage["disk_used_pct"] >= threshold:
+        return f"disk {usage['disk_used_pct']}% full (threshold {threshold}%)"
+    cache = usage["categories"].get("build_cache", {}).get("size", 0)
+    if cache_cap and cache > parse_memory(cache_cap):
+        return f"build cache {cache / 1024:.1f}GB over its {cache_cap} cap"
+    return None
+
+
+def gc_ops(usage, keep=DEFAULT_KEEP_IMAGES, cache_cap=None, protected=()):
+    """Plan operations applying the GC policy to a server with the given usage."""
+    ops = [
+        {"op": "docker", "group": "containers", "args": ["container", "prune", "--force"]},
+        {"op": "docker", "group": "images", "args": ["image", "prune", "--force"]},
+    ]
+    stale = superseded_images(usage["images"], usage["in_use"], keep, protected)
+    if stale:
+        # Runs after the container prune, so images of removed containers are free too;
+        # an image still in use makes rmi fail for that image only
+        ops.append({"op": "run", "group": "containers", "cmd": "docker rmi " + " ".join(stale) + " || true"})
+    if cache_cap:
+        ops.append({"op": "docker", "group": "cache", "args": ["builder", "prune", "--force", "--keep-storage", cache_cap]})
+    return ops
+
+
+def collect_garbage(ip_address, username, key_path, threshold=DEFAULT_GC_THRESHOLD,
+                    keep=DEFAULT_KEEP_IMAGES, cache_cap=None, protected=()):
+    """Measure a server and, if over a threshold, apply the GC policy.
+
+    `protected` lists image references (the apps' compose images) kept even
+    when no container uses them.
+
+    Returns {"reason", "before", "after", "reclaimed" ({category: MB}), "seconds"};
+    reason is None (and nothing was removed) when no threshold was exceeded.
+    None when the server could not be measured.
+    """
+    from .remote import plan_errors, run_plan
+
+    before = docker_disk_usage(ip_address, username, key_path)
+    if before is None:
+        print(f"Warning: Could not measure Docker disk usage on {ip_address}")
+        return None
+    report = {"reason": gc_needed(before, threshold, cache_cap), "before": before["categories"],
+              "after": before["categories"], "reclaimed": {}, "seconds": 0.0}
+    if report["reason"] is None:
+        return report
+
+    started = time.time()
+    results = run_plan(ip_address, username, key_path, gc_ops(before, keep, cache_cap, protected), timeout=1800)
+    for error in plan_errors(results):
+        print(f"Warning: Docker GC on {ip_address}: {error}")
+    after = docker_disk_usage(ip_address, username, key_path)
+    report["seconds"] = time.time() - started
+    if after is not None:
+        report["after"] = after["categories"]
+        report["reclaimed"] = {
+            category: round(sizes["size"] - after["categories"].get(category, {}).get("size", 0), 1)
+            for category, sizes in before["categories"].items()
+        }
+    return report
+
+
+def describe_gc(ip_address, report):
+    if report["reason"] is None:
+        total = sum(c["size"] for c in report["before"].values())
+        return f"Docker GC on {ip_address}: not needed ({total / 1024:.1f}GB in use)"
+    reclaimed = {c: mb for c, mb in report["reclaimed"].items() if mb > 0}
+    details = ", ".join(f"{c} {mb / 1024:.2f}GB" for c, mb in reclaimed.items()) or "nothing"
+    return (
+        f"Docker GC on {ip_address} ({report['reason']}): reclaimed "
+        f"{sum(reclaimed.values()) / 1024:.2f}GB in {report['seconds']:.0f}s ({details})"
+    )
@@ -0,0 +1,58 @@
+"""Locating and reading the per-app .env files under automation/envs."""
+import os
+
+
+def detect_env_file(app_name):
+    # 1. Try exact slugs
+    slugs = [
+        app_name.lower().replace(" ", "-"),
+        app_name.lower().replace(" ", "_"),
+        app_name.lower().replace("-", "_"),
+        app_name.lower(),
+    ]
+
+    # The automation directory (parent of this package)
+    script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    search_dirs = [
+        ".",
+        "envs",
+        os.path.join(script_dir, "envs"),
+        "automation",
+        os.path.join("automation", "envs"),
+    ]
+
+    for directory in search_dirs:
+        for slug in slugs:
+            # Check for .env_<slug>
+            path = os.path.join(directory, f".env_{slug}")
+            if os.path.exists(path):
+                return path
+
+    # 2. Try keyword matching if no exact slug matches
+    # For "CP Agentic MCP Playground", keywords might be ["agentic", "mcp"]
+    keywords = [w.lower() for w in app_name.split() if len(w) > 3]
+    for directory in search_dirs:
+        try:
+            files = os.listdir(directory)
+            for f in files:
+                if f.startswith(".env_"):
+                    # Check if any keyword is in the filename
+                    for kw in keywords:
+                        if kw in f.lower():
+                            return os.path.join(directory, f)
+        except Exception:
+            continue
+
+    return None
+
+
+def read_env_file(env_file_path):
+    """Parse KEY=VALUE lines of an env file into a dict (comments skipped)."""
+    env_vars = {}
+    with open(env_file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if "=" in line and not line.startswith("#"):
+                k, v = line.split("=", 1)
+                env_vars[k.strip()] = v.strip()
+    return env_vars
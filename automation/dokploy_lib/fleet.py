@@ -0,0 +1,177 @@
+"""Fleet mode: run the full automation against several Dokploy instances at once.
+
+Each target runs as its own ``dokploy_automate.py`` process, so module-level
+state (domain, run history) never leaks between targets and every target gets
+an isolated log file. The fleet file looks like::
+
+    {
+        "defaults": {"email": "admin@example.com", "password_env": "DOKPLOY_PASSWORD",
+                     "config": "dokploy_config.json", "args": ["--wait-deploy"]},
+        "targets": [
+            {"name": "event-east", "url": "http://1.2.3.4:3000", "domain": "east.example.com"},
+            {"name": "event-west", "url": "http://5.6.7.8:3000", "domain": "west.example.com",
+             "ip": "5.6.7.8", "args": ["--clean"]}
+        ]
+    }
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+AUTOMATE_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dokploy_automate.py")
+
+# target key -> CLI flag of dokploy_automate.py
+TARGET_FLAGS = {
+    "url": "--url",
+    "email": "--email",
+    "domain": "--domain",
+    "ip": "--ip",
+    "config": "--config",
+    "project": "--project",
+    "ssh_private": "--ssh-private",
+    "ssh_public": "--ssh-public",
+    "ssh_user": "--ssh-user",
+    "app": "--app",
+}
+
+
+def load_targets(path):
+    """Read a fleet file and merge each target with the shared defaults."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"targets": data}
+    defaults = data.get("defaults", {})
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    targets = []
+    for idx, raw in enumerate(data.get("targets", [])):
+        target = dict(defaults)
+        target.update(raw)
+        target["args"] = list(defaults.get("args", [])) + list(raw.get("args", []))
+        target.setdefault("name", target.get("domain") or target.get("url") or f"target-{idx + 1}")
+        if "password_env" in target and "password" not in target:
+            target["password"] = os.environ.get(target["password_env"])
+        config = target.get("config")
+        if config and not os.path.isabs(config) and os.path.exists(os.path.join(base_dir, config)):
+            target["config"] = os.path.join(base_dir, config)
+        missing = [k for k in ("url", "email", "password") if not target.get(k)]
+        if missing:
+            raise ValueError(f"Fleet target {target['name']} is missing {', '.join(missing)}")
+        targets.append(target)
+    return targets
+
+
+def target_command(target, extra_args=None):
+    cmd = [sys.executable, "-u", AUTOMATE_SCRIPT]
+    for key, flag in TARGET_FLAGS.items():
+        if target.get(key):
+            cmd += [flag, str(target[key])]
+    cmd += ["--password", target["password"]]
+    for extra_ip in target.get("extra_ips", []):
+        cmd += ["--extra-ip", extra_ip]
+    return cmd + target["args"] + list(extra_args or [])
+
+
+def run_target(target, log_dir, extra_args=None, timeout=None):
+    """Run one target to completion with output captured in its own log file."""
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in target["name"])
+    log_path = os.path.join(log_dir, f"{safe_name}.log")
+    started = time.time()
+    print(f"[fleet] {target['name']}: started (log: {log_path})")
+    try:
+        with open(log_path, "w") as log:
+            proc = subprocess.run(
+                target_command(target, extra_args),
+                stdout=log, stderr=subprocess.STDOUT, timeout=timeout,
+            )
+        returncode = proc.returncode
+    except subprocess.TimeoutExpired:
+        returncode = "timeout"
+    except Exception as e:
+        print(f"[fleet] {target['name']}: could not start: {e}")
+        returncode = "error"
+    duration = time.time() - started
+
+    tail = []
+    try:
+        with open(log_path, "r", errors="replace") as log:
+            tail = [line.rstrip() for line in log.readlines()[-5:]]
+    except OSError:
+        pass
+    ok = returncode == 0
+    print(f"[fleet] {target['name']}: {'OK' if ok else 'FAILED'} in {duration:.0f}s")
+    return {
+        "name": target["name"],
+        "url": target["url"],
+        "ok": ok,
+        "returncode": returncode,
+        "duration": duration,
+        "log": log_path,
+        "tail": tail,
+    }
+
+
+def print_report(results, wall_time):
+    print("\n" + "=" * 72)
+    print("FLEET REPORT")
+    print("=" * 72)
+    for r in sorted(results, key=lambda r: r["name"]):
+        status = "OK" if r["ok"] else f"FAILED ({r['returncode']})"
+        print(f"  {r['name']:<24} {status:<14} {r['duration']:7.0f}s  {r['url']}")
+        if not r["ok"]:
+            for line in r["tail"]:
+                print(f"      | {line}")
+    serial = sum(r["duration"] for r in results)
+    succeeded = sum(1 for r in results if r["ok"])
+    print("-" * 72)
+    print(f"  {succeeded}/{len(results)} succeeded | wall time {wall_time:.0f}s | serial equivalent {serial:.0f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="dokploy_automate.py fleet",
+        description="Run the automation against several Dokploy instances concurrently",
+    )
+    parser.add_argument("--targets", required=True, help="Fleet JSON file (see dokploy_lib/fleet.py)")
+    parser.add_argument("--max-parallel", type=int, default=0, help="Concurrent targets (default: all)")
+    parser.add_argument("--log-dir", default="fleet_logs", help="Directory for per-target logs (default: fleet_logs)")
+    parser.add_argument("--timeout", type=int, default=None, help="Per-target timeout in seconds")
+    parser.add_argument("--only", action="append", help="Run only the named target(s) (repeatable)")
+    parser.add_argument("--report", help="Also write the aggregated report as JSON to this file")
+    args, extra_args = parser.parse_known_args(argv)
+    if extra_args[:1] == ["--"]:
+        extra_args = extra_args[1:]
+
+    try:
+        targets = load_targets(args.targets)
+    except (OSError, ValueError) as e:
+        print(f"Error loading fleet file {args.targets}: {e}")
+        return 1
+    if args.only:
+        targets = [t for t in targets if t["name"] in args.only]
+    if not targets:
+        print("No fleet targets to run.")
+        return 1
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    workers = args.max_parallel or len(targets)
+    print(f"[fleet] Running {len(targets)} target(s), {workers} at a time...")
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda t: run_target(t, args.log_dir, extra_args, args.timeout), targets))
+    wall_time = time.time() - started
+
+    print_report(results, wall_time)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"wall_time": wall_time, "targets": results}, f, indent=2)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
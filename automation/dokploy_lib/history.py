@@ -0,0 +1,424 @@
+"""Local SQLite store of run timings (phases, API calls, per-app durations) and the history report."""
+import os
+import sys
+import time
+import json
+import argparse
+from contextlib import contextmanager
+
+DEFAULT_DB_PATH = os.environ.get(
+    "DOKPLOY_HISTORY_DB", os.path.expanduser("~/.dokploy_history.db")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    target TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    outcome TEXT,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    duration REAL NOT NULL,
+    outcome TEXT
+);
+CREATE TABLE IF NOT EXISTS calls (
+    run_id INTEGER NOT NULL,
+    method TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    status INTEGER,
+    duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS apps (
+    run_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    setup_duration REAL,
+    deploy_duration REAL,
+    outcome TEXT,
+    memory_mb REAL,
+    build_steps INTEGER,
+    cached_steps INTEGER,
+    deployment_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_phases_name ON phases(name);
+CREATE INDEX IF NOT EXISTS idx_apps_name ON apps(name);
+"""
+
+# Columns added to `apps` after its first release, added to older databases on connect
+APP_COLUMN_MIGRATIONS = (
+    ("memory_mb", "REAL"), ("build_steps", "INTEGER"), ("cached_steps", "INTEGER"), ("deployment_id", "TEXT"),
+)
+
+# Recorder of the run in progress; request_with_retry and friends report into it
+_active = None
+
+
+def endpoint_from_url(url):
+    """Reduce a Dokploy URL to its procedure name (e.g. compose.update)."""
+    path = url.split("?", 1)[0]
+    if "/api/trpc/" in path:
+        return path.split("/api/trpc/", 1)[1]
+    if "/api/" in path:
+        return path.split("/api/", 1)[1]
+    return path
+
+
+class RunRecorder:
+    """Collects timings for one automation/verify run and writes them to SQLite."""
+
+    def __init__(self, kind, target=None, db_path=None, meta=None):
+        self.kind = kind
+        self.target = target
+        self.db_path = db_path or DEFAULT_DB_PATH
+        self.started_at = time.time()
+        self.meta = meta or {}
+        self.phases = []
+        self.calls = []
+        self.apps = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.phases.append((name, time.time() - start, outcome))
+
+    def record_phase(self, name, duration, outcome="ok"):
+        self.phases.append((name, duration, outcome))
+
+    def record_call(self, method, url, status, duration):
+        self.calls.append((method, endpoint_from_url(url), status, duration))
+
+    def record_app(self, name, setup_duration, outcome):
+        """Record the time spent configuring an app up to its deploy trigger."""
+        entry = self.apps.setdefault(name, [None] * 7)
+        entry[0] = setup_duration
+        entry[2] = outcome
+
+    def record_deploy(self, name, deploy_duration, outcome, deployment_id=None):
+        """Record how long the triggered deployment took and how it ended."""
+        entry = self.apps.setdefault(name, [None] * 7)
+        entry[1] = deploy_duration
+        entry[2] = outcome
+        entry[6] = deployment_id
+
+    def record_footprint(self, name, memory_mb):
+        """Record the memory an app's running containers used (learned footprint)."""
+        entry = self.apps.setdefault(name, [None] * 7)
+        entry[3] = memory_mb
+
+    def record_build_cache(self, name, cached_steps, build_steps):
+        """Record how many of the app's build steps BuildKit served from its cache."""
+        entry = self.apps.setdefault(name, [None] * 7)
+        entry[4] = build_steps
+        entry[5] = cached_steps
+
+    def save(self, outcome="ok"):
+        """Persist the run. Failures here must never break a deployment."""
+        try:
+            conn = connect(self.db_path)
+            with conn:
+                cur = conn.execute(
+                    "INSERT INTO runs (kind, target, started_at, finished_at, outcome, meta) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.kind, self.target, self.started_at, time.time(), outcome,
+                     json.dumps(self.meta)),
+                )
+                run_id = cur.lastrowid
+                conn.executemany(
+                    "INSERT INTO phases (run_id, name, duration, outcome) VALUES (?, ?, ?, ?)",
+                    [(run_id,) + p for p in self.phases],
+                )
+                conn.executemany(
+                    "INSERT INTO calls (run_id, method, endpoint, status, duration) VALUES (?, ?, ?, ?, ?)",
+                    [(run_id,) + c for c in self.calls],
+                )
+                conn.executemany(
+                    "INSERT INTO apps (run_id, name, setup_duration, deploy_duration, outcome, memory_mb, "
+                    "build_steps, cached_steps, deployment_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, name, *entry) for name, entry in self.apps.items()],
+                )
+            conn.close()
+            print(f"Run history saved to {self.db_path} (run #{run_id})")
+            return run_id
+        except Exception as e:
+            print(f"Warning: Could not save run history: {e}")
+            return None
+
+
+def start_run(kind, target=None, db_path=None, meta=None):
+    """Create the recorder for this process and make it the active one."""
+    global _active
+    _active = RunRecorder(kind, target=target, db_path=db_path, meta=meta)
+    return _active
+
+
+def active():
+    return _active
+
+
+def record_call(method, url, status, duration):
+    if _active is not None:
+        _active.record_call(method, url, status, duration)
+
+
+@contextmanager
+def phase(name):
+    """Time a phase on the active recorder (no-op when history is disabled)."""
+    if _active is None:
+        yield
+        return
+    with _active.phase(name):
+        yield
+
+
+def connect(db_path=None):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path or DEFAULT_DB_PATH)
+    conn.executescript(SCHEMA)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(apps)")}
+    for column, kind in APP_COLUMN_MIGRATIONS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE apps ADD COLUMN {column} {kind}")
+    return conn
+
+
+def recent_runs(kind=None, target=None, limit_runs=50):
+    """(subquery, params) selecting the IDs of the last `limit_runs` runs of this kind and target."""
+    clauses, params = [], []
+    if kind:
+        clauses.append("kind = ?")
+        params.append(kind)
+    if target:
+        clauses.append("target = ?")
+        params.append(target)
+    query = "SELECT run_id FROM runs"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    return f"{query} ORDER BY run_id DESC LIMIT ?", params + [limit_runs]
+
+
+def learned_footprints(db_path=None, target=None, limit_runs=10):
+    """{app name: largest memory (MB) its containers used in the last runs}."""
+    if not os.path.exists(db_path or DEFAULT_DB_PATH):
+        return {}
+    try:
+        conn = connect(db_path)
+        # The last runs of this target's automation, not of fleet/verify runs or other targets
+        runs, params = recent_runs("automate", target, limit_runs)
+        query = (
+            "SELECT name, MAX(memory_mb) FROM apps "
+            f"WHERE memory_mb IS NOT NULL AND run_id IN ({runs}) GROUP BY name"
+        )
+        footprints = dict(conn.execute(query, params))
+        conn.close()
+        return footprints
+    except Exception as e:
+        print(f"Warning: Could not read learned footprints: {e}")
+        return {}
+
+
+def last_deployment_ids(db_path=None, target=None):
+    """{app name: ID of the last deployment recorded for it}, so a deployment is recorded once."""
+    if not os.path.exists(db_path or DEFAULT_DB_PATH):
+        return {}
+    try:
+        conn = connect(db_path)
+        query = (
+            "SELECT a.name, a.deployment_id FROM apps a JOIN runs r ON r.run_id = a.run_id "
+            "WHERE a.deployment_id IS NOT NULL"
+        )
+        params = []
+        if target:
+            query += " AND r.target = ?"
+            params.append(target)
+        ids = dict(conn.execute(query + " ORDER BY r.run_id", params))  # The latest run wins
+        conn.close()
+        return ids
+    except Exception as e:
+        print(f"Warning: Could not read recorded deployments: {e}")
+        return {}
+
+
+def load_series(conn, table, column="duration", kind=None, target=None, limit_runs=50):
+    """Return {name: [(run_id, duration), ...]} oldest first, for phases or apps.
+
+    Only the last `limit_runs` runs matching `kind` and `target` are read.
+    Failed entries are left out so an early abort does not look like a speed-up.
+    """
+    runs, params = recent_runs(kind, target, limit_runs)
+    query = (
+        f"SELECT t.name, r.run_id, t.{column} FROM {table} t "
+        "JOIN runs r ON r.run_id = t.run_id "
+        f"WHERE t.{column} IS NOT NULL "
+        "AND (t.outcome IS NULL OR (t.outcome NOT IN ('error', 'trigger_failed', 'timeout') "
+        "AND t.outcome NOT LIKE 'failed:%'))"
+        f" AND r.run_id IN ({runs}) ORDER BY r.run_id"
+    )
+    series = {}
+    for name, run_id, duration in conn.execute(query, params):
+        series.setdefault(name, []).append((run_id, duration))
+    return series
+
+
+def find_regressions(series, threshold_pct=25.0, window=5):
+    """Compare each series' latest value against the median of the preceding window.
+
+    Returns a list of (name, latest, median, pct_slower) for series that got
+    more than threshold_pct slower.
+    """
+    import statistics
+
+    flagged = []
+    for name, points in series.items():
+        if len(points) < 2:
+            continue
+        latest = points[-1][1]
+        baseline = [d for _, d in points[-(window + 1):-1]]
+        median = statistics.median(baseline)
+        if median <= 0:
+            continue
+        pct = (latest - median) / median * 100.0
+        if pct > threshold_pct:
+            flagged.append((name, latest, median, pct))
+    return sorted(flagged, key=lambda f: f[3], reverse=True)
+
+
+def print_trends(title, series, window):
+    import statistics
+
+    print(f"\n{title}")
+    print("-" * 60)
+    if not series:
+        print("  (no data)")
+        return
+    for name in sorted(series):
+        durations = [d for _, d in series[name]]
+        recent = " ".join(f"{d:.1f}" for d in durations[-window:])
+        median = statistics.median(durations[-window:])
+        print(f"  {name:<40} median {median:7.1f}s | last: {recent}")
+
+
+def print_call_latency(conn, kind=None, target=None, limit_runs=10):
+    runs, params = recent_runs(kind, target, limit_runs)
+    query = (
+        "SELECT c.endpoint, COUNT(*), AVG(c.duration), MAX(c.duration) FROM calls c "
+        f"WHERE c.run_id IN ({runs}) "
+        "GROUP BY c.endpoint ORDER BY AVG(c.duration) DESC"
+    )
+    rows = conn.execute(query, params).fetchall()
+    print(f"\nAPI latency (last {limit_runs} runs)")
+    print("-" * 60)
+    if not rows:
+        print("  (no data)")
+    for endpoint, count, avg, worst in rows:
+        print(f"  {endpoint:<40} {count:5d} calls | avg {avg:.2f}s | max {worst:.2f}s")
+
+
+def print_cache_hits(conn, kind=None, target=None, window=5):
+    """Build-cache hit ratio of each app's last builds."""
+    query = (
+        "SELECT a.name, a.cached_steps, a.build_steps FROM apps a JOIN runs r ON r.run_id = a.run_id "
+        "WHERE a.build_steps > 0"
+    )
+    params = []
+    if kind:
+        query += " AND r.kind = ?"
+        params.append(kind)
+    if target:
+        query += " AND r.target = ?"
+        params.append(target)
+    query += " ORDER BY r.run_id"
+    series = {}
+    for name, cached, steps in conn.execute(query, params):
+        series.setdefault(name, []).append(cached / steps * 100.0)
+    print("\nBuild cache hits (% of build steps cached)")
+    print("-" * 60)
+    if not series:
+        print("  (no data)")
+    for name in sorted(series):
+        recent = " ".join(f"{pct:.0f}" for pct in series[name][-window:])
+        print(f"  {name:<40} last: {recent}")
+
+
+def show_history(db_path=None, kind=None, target=None, threshold_pct=25.0, window=5, limit_runs=50):
+    """Print recent runs, duration trends and regressions. Returns the number of regressions."""
+    db_path = db_path or DEFAULT_DB_PATH
+    if not os.path.exists(db_path):
+        print(f"No run history found at {db_path}")
+        return 0
+    conn = connect(db_path)
+
+    query = "SELECT run_id, kind, target, started_at, finished_at, outcome FROM runs"
+    params = []
+    clauses = []
+    if kind:
+        clauses.append("kind = ?")
+        params.append(kind)
+    if target:
+        clauses.append("target = ?")
+        params.append(target)
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY run_id DESC LIMIT ?"
+    params.append(window * 2)
+
+    print("=" * 60)
+    print("RUN HISTORY")
+    print("=" * 60)
+    for run_id, rkind, rtarget, started, finished, outcome in conn.execute(query, params):
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(started))
+        total = f"{finished - started:.1f}s" if finished else "?"
+        print(f"  #{run_id:<5} {when} {rkind:<9} {total:>9} {outcome or '?':<8} {rtarget or ''}")
+
+    phases = load_series(conn, "phases", "duration", kind, target, limit_runs)
+    app_setup = load_series(conn, "apps", "setup_duration", kind, target, limit_runs)
+    app_deploy = load_series(conn, "apps", "deploy_duration", kind, target, limit_runs)
+    print_trends("Phase durations (seconds)", phases, window)
+    print_trends("App setup durations (seconds)", app_setup, window)
+    print_trends("App deploy durations (seconds)", app_deploy, window)
+    print_cache_hits(conn, kind, target, window)
+    print_call_latency(conn, kind, target)
+
+    regressions = [("phase", *r) for r in find_regressions(phases, threshold_pct, window)]
+    regressions += [("app setup", *r) for r in find_regressions(app_setup, threshold_pct, window)]
+    regressions += [("app deploy", *r) for r in find_regressions(app_deploy, threshold_pct, window)]
+    print(f"\nRegressions (> {threshold_pct:.0f}% slower than rolling median of {window} runs)")
+    print("-" * 60)
+    if not regressions:
+        print("  None")
+    for what, name, latest, median, pct in regressions:
+        print(f"  SLOWER [{what}] {name}: {latest:.1f}s vs median {median:.1f}s (+{pct:.0f}%)")
+    conn.close()
+    return len(regressions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="dokploy_automate.py history",
+        description="Show deployment timing trends and regressions from the local run history",
+    )
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help=f"History database (default: {DEFAULT_DB_PATH})")
+    parser.add_argument("--kind", choices=["automate", "verify"], help="Only show runs of this kind")
+    parser.add_argument("--target", help="Only show runs against this Dokploy URL")
+    parser.add_argument("--threshold", type=float, default=25.0, help="Flag items more than this %% slower than the rolling median (default: 25)")
+    parser.add_argument("--window", type=int, default=5, help="Rolling median window in runs (default: 5)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit non-zero when a regression is flagged")
+    args = parser.parse_args(argv)
+
+    count = show_history(args.db, args.kind, args.target, args.threshold, args.window)
+    return 1 if (count and args.fail_on_regression) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""Pre-flight lint of every configured app's compose file, as it will be deployed.
+
+``dokploy_automate.py lint`` (or ``--lint`` before a run) renders each app's
+compose the way the automation does: ``{{DOMAIN}}`` replaced, the app's env
+file injected and, for the local compose pushed in place of the repo's,
+sanitized for Dokploy. The compose files are read (or fetched from GitHub)
+concurrently, then rendered and checked in worker processes:
+
+- unresolved_variable: ``${VAR}`` with no value in the env file and no default
+- relative_mount: a ``./`` bind mount left in the compose Dokploy runs
+- host_port: a host port published twice, or one the platform holds
+- missing_env_file: variables or a pushed compose, but no env file for the app
+- undefined_network: a service network without a top-level ``networks:`` entry
+
+Each finding is {"app", "check", "severity" (error/warning), "message"} plus
+"service" or "line" where it applies. Errors fail the lint.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .compose import (
+    find_local_compose,
+    hard_inject_env_vars,
+    parse_compose_services,
+    replace_domain,
+    sanitize_compose_file,
+    top_level_names,
+)
+from .envfiles import detect_env_file, read_env_file
+from .ports import PLATFORM_PORTS, app_slug, build_port_index
+
+# ${VAR}, ${VAR:-default}, ${VAR?error} ...; $${VAR} is a compose escape, not a variable
+VARIABLE = re.compile(r"(?<!\$)\$\{([A-Za-z_][A-Za-z0-9_]*)(:?[-?+])?[^}]*\}")
+
+
+def finding(app, check, severity, message, **where):
+    return {"app": app, "check": check, "severity": severity, "message": message, **where}
+
+
+def unresolved_variables(content, env_vars):
+    """[(line number, variable, required)] of the variables compose cannot resolve."""
+    unresolved = []
+    for number, line in enumerate(content.splitlines(), 1):
+        if line.lstrip().startswith("#"):
+            continue
+        for match in VARIABLE.finditer(line):
+            name, operator = match.groups()
+            if name in env_vars or (operator and "?" not in operator):
+                continue  # Set, or has a default / alternate value
+            unresolved.append((number, name, bool(operator)))
+    return unresolved
+
+
+def mount_source(entry):
+    """Host path of a bind mount entry, or None for named and anonymous volumes."""
+    if isinstance(entry, dict):
+        return entry.get("source") if entry.get("type", "bind") == "bind" else None
+    source, sep, _ = entry.partition(":")
+    return source if sep else None
+
+
+def read_composes(app_configs):
+    """{app name: (compose content, "local"|"repo")}; content is None when unavailable.
+
+    Same choice as the automation: the local compose when there is one, else
+    the repo's compose file fetched from GitHub (concurrently).
+    """
+    from .prepull import fetch_repo_compose
+
+    def read(cfg):
+        local_compose = find_local_compose(cfg["name"])
+        if local_compose:
+            try:
+                with open(local_compose, "r") as f:
+                    return f.read(), "local"
+            except Exception as e:
+                print(f"Warning: Could not read local compose file {local_compose}: {e}")
+                return None, "local"
+        if not cfg.get("repo", "").startswith("https://"):
+            return None, "repo"
+        return fetch_repo_compose(
+            cfg["repo"], cfg.get("branch", "main"), cfg.get("composePath", "docker-compose.yml")
+        ), "repo"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(app_configs)))) as pool:
+        return dict(zip([c["name"] for c in app_configs], pool.map(read, app_configs)))
+
+
+def lint_app(cfg, content, source, env_file, domain):
+    """Render one app's compose as it will be deployed and check it.
+
+    Runs in a worker process. Returns (findings, rendered compose).
+    """
+    name = cfg["name"]
+    findings = []
+    env_vars = {}
+    if env_file:
+        try:
+            env_vars = read_env_file(env_file)
+        except Exception as e:
+            findings.append(finding(name, "missing_env_file", "error", f"Could not read {env_file}: {e}"))
+        if env_file.endswith(".example"):
+            findings.append(finding(name, "missing_env_file", "warning",
+                                    f"Only the template {env_file} was found; its values are placeholders"))
+
+    content = replace_domain(content, domain)
+    unresolved = unresolved_variables(content, env_vars)
+    for number, variable, required in unresolved:
+        findings.append(finding(
+            name, "unresolved_variable", "error",
+            f"${{{variable}}} is {'required but ' if required else ''}not set in the env file and has no default",
+            line=number,
+        ))
+    if not env_file and (unresolved or source == "local"):
+        reason = ("the pushed compose loads .env in every service" if source == "local"
+                  else f"{len(unresolved)} variable(s) have no default")
+        findings.append(finding(name, "missing_env_file", "error",
+                                f"No env file (envs/.env_{app_slug(name)}) but {reason}"))
+
+    # hard_inject_env_vars reports every blanked variable; they are findings above already
+    with contextlib.redirect_stdout(io.StringIO()):
+        rendered = hard_inject_env_vars(content, env_file) if env_file else content
+        if source == "local":
+            rendered = sanitize_compose_file(rendered, name, app_path=f"/etc/dokploy/compose/{app_slug(name)}/code")
+
+    networks = set(top_level_names(rendered, "networks")) | {"default"}
+    for service, svc in parse_compose_services(rendered).items():
+        for entry in svc["volumes"]:
+            path = mount_source(entry)
+            if not path or not path.startswith("."):
+                continue
+            if source == "local":
+                findings.append(finding(name, "relative_mount", "error",
+                                        f"Relative mount {path} left after sanitizing", service=service))
+            else:
+                findings.append(finding(name, "relative_mount", "warning",
+                                        f"Bind mount {path} lives in the cloned repo, which a clean rebuild wipes",
+                                        service=service))
+        for network in svc["networks"]:
+            if network not in networks:
+                findings.append(finding(name, "undefined_network", "error",
+                                        f"Network {network} is not defined under the top-level networks:",
+                                        service=service))
+    return findings, rendered
+
+
+def port_findings(app_configs, composes):
+    """host_port findings of the ports the apps publish (see ports.build_port_index).
+
+    Apps pinned to different servers ("server") may share a port; unpinned apps
+    may land on the same server, so their ports must not collide.
+    """
+    claims, _ = build_port_index(app_configs, composes)
+    servers = {cfg["name"]: cfg.get("server") for cfg in app_configs}
+    findings = []
+    seen = {}
+    for claim in claims:
+        key = (claim["port"], claim["protocol"])
+        where = f"{claim['port']}/{claim['protocol']}"
+        if claim["port"] in PLATFORM_PORTS:
+            findings.append(finding(claim["app"], "host_port", "error",
+                                    f"Publishes port {where}, held by {PLATFORM_PORTS[claim['port']]}",
+                                    service=claim["service"]))
+            continue
+        for other in seen.get(key, []):
+            if (other["app"], other["service"]) == (claim["app"], claim["service"]):
+                continue
+            a, b = servers[claim["app"]], servers[other["app"]]
+            if a and b and a != b:
+                continue
+            findings.append(finding(claim["app"], "host_port", "error",
+                                    f"Publishes port {where}, also published by {other['app']}/{other['service']}",
+                                    service=claim["service"]))
+        seen.setdefault(key, []).append(claim)
+    return findings
+
+
+def lint_apps(app_configs, domain, workers=None):
+    """Lint the compose file of every app.
+
+    Returns the report: {"domain", "seconds", "apps" ({name: {"source",
+    "env_file", "checked"}}), "findings", "errors", "warnings"}.
+    """
+    started = time.time()
+    configs = [replace_domain(c, domain) for c in app_configs]
+    sources = read_composes(configs)
+    env_files = {cfg["name"]: detect_env_file(cfg["name"]) for cfg in configs}
+    findings = {cfg["name"]: [] for cfg in configs}
+    composes = {}
+
+    jobs = [cfg for cfg in configs if sources[cfg["name"]][0] is not None]
+    for cfg in configs:
+        if cfg not in jobs:
+            findings[cfg["name"]].append(finding(cfg["name"], "compose_unavailable", "warning",
+                                                 "Compose file could not be read; only hostPort was checked"))
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count() or 1)) as pool:
+            futures = {
+                cfg["name"]: pool.submit(lint_app, cfg, *sources[cfg["name"]], env_files[cfg["name"]], domain)
+                for cfg in jobs
+            }
+            for name, future in futures.items():
+                app_findings, composes[name] = future.result()
+                findings[name] += app_findings
+    for item in port_findings(configs, composes):
+        findings[item["app"]].append(item)
+
+    flat = [item for cfg in configs for item in findings[cfg["name"]]]
+    return {
+        "domain": domain,
+        "seconds": round(time.time() - started, 2),
+        "apps": {
+            cfg["name"]: {"source": sources[cfg["name"]][1], "env_file": env_files[cfg["name"]],
+                          "checked": cfg["name"] in composes}
+            for cfg in configs
+        },
+        "findings": flat,
+        "errors": sum(1 for item in flat if item["severity"] == "error"),
+        "warnings": sum(1 for item in flat if item["severity"] == "warning"),
+    }
+
+
+def print_report(report):
+    print(f"Compose lint: {len(report['apps'])} app(s) in {report['seconds']:.1f}s, "
+          f"{report['errors']} error(s), {report['warnings']} warning(s)")
+    for item in report["findings"]:
+        where = item.get("service") or (f"line {item['line']}" if item.get("line") else None)
+        print(f"  {item['severity'].upper():<7} {item['app']} [{item['check']}]"
+              f"{f' {where}:' if where else ''} {item['message']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="dokploy_automate.py lint",
+        description="Check every app's compose file, rendered as it will be deployed",
+    )
+    parser.add_argument("--config", default="dokploy_config.json", help="Path to apps config JSON")
+    parser.add_argument("--domain", default="cpdemo.ca", help="Root domain for apps (default: cpdemo.ca)")
+    parser.add_argument("--app", help="Only lint this app")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per app, up to the CPU count)")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON instead of text")
+    parser.add_argument("--report", help="Also write the JSON report to this file")
+    parser.add_argument("--strict", action="store_true", help="Exit non-zero on warnings too")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.config, "r") as f:
+            app_configs = json.load(f)
+    except Exception as e:
+        print(f"Error loading config file {args.config}: {e}")
+        return 1
+    app_configs = [c for c in app_configs if not args.app or args.app.lower() in c["name"].lower()]
+    if not app_configs:
+        print(f"No configured app matches {args.app}")
+        return 1
+
+    # Keep stdout to the report itself with --json
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        report = lint_apps(app_configs, args.domain, args.workers)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["errors"] or (args.strict and report["warnings"]) else 0
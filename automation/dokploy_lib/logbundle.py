@@ -0,0 +1,157 @@
+"""Troubleshooting bundles: logs and state of every app container, gathered in one go.
+
+``dokploy_automate.py logs`` runs logbundle_agent.py on each server (all
+servers concurrently, one SSH session each). The agent collects ``docker
+inspect`` and the last ``--tail`` log lines of every container of the
+configured compose apps, several containers at a time, and streams them back
+as a gzipped tar that is written straight to ``<output>/<ip>.tar.gz``.
+
+The summary lists the services that need attention: crash-looping (restarting,
+or restarted CRASH_LOOP_RESTARTS times or more), unhealthy, OOM-killed or
+exited with an error.
+"""
+import os
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .ports import app_slug
+from .ssh import ssh_command
+
+AGENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logbundle_agent.py")
+SUMMARY_MARKER = "__BUNDLE_SUMMARY__"
+
+# Restarts from which a container counts as crash-looping
+CRASH_LOOP_RESTARTS = 3
+
+
+def build_program(options):
+    """Agent source plus the call that collects with `options`, for `python3 -`."""
+    with open(AGENT_PATH, "r") as f:
+        source = f.read()
+    return f"{source}\nmain({json.dumps(json.dumps(options))})\n"
+
+
+def collect_bundle(ip_address, username, key_path, path, projects, tail=500, since=None,
+                   parallel=8, local=False, timeout=900):
+    """Write the server's bundle to `path`; returns its container records, or None on failure.
+
+    The archive goes from the SSH process straight into the file, never
+    through this process's memory.
+    """
+    options = {"projects": projects, "tail": tail, "since": since, "parallel": parallel}
+    cmd = ["sudo", "python3", "-"] if local else ssh_command(ip_address, username, key_path, "sudo python3 -")
+    try:
+        with open(path, "wb") as out:
+            proc = subprocess.run(
+                cmd, input=build_program(options).encode(), stdout=out, stderr=subprocess.PIPE,
+                timeout=timeout,
+            )
+    except Exception as e:
+        print(f"Warning: Could not collect logs on {ip_address}: {e}")
+        return None
+    stderr = proc.stderr.decode("utf-8", "replace")
+    for line in reversed(stderr.splitlines()):
+        if line.startswith(SUMMARY_MARKER):
+            return json.loads(line[len(SUMMARY_MARKER):])
+    print(f"Warning: Log collection on {ip_address} failed (exit {proc.returncode}): {stderr.strip()[-300:]}")
+    return None
+
+
+def container_problems(record):
+    """Labels of what is wrong with a container (empty when it looks fine)."""
+    problems = []
+    if record.get("status") == "restarting" or (record.get("restarts") or 0) >= CRASH_LOOP_RESTARTS:
+        problems.append(f"crash-looping ({record.get('restarts') or 0} restarts)")
+    if record.get("health") == "unhealthy":
+        problems.append("unhealthy")
+    if record.get("oom_killed"):
+        problems.append("OOM-killed")
+    if record.get("status") in ("exited", "dead") and record.get("exit_code"):
+        problems.append(f"exited with code {record['exit_code']}")
+    if record.get("error"):
+        problems.append(record["error"])
+    return problems
+
+
+def print_summary(bundles):
+    """Print per-server container counts and the containers needing attention; returns their count."""
+    flagged = 0
+    print("\n" + "=" * 60 + "\nCONTAINER SUMMARY\n" + "=" * 60)
+    for ip_address, (path, records) in bundles.items():
+        if records is None:
+            print(f"{ip_address}: collection failed")
+            continue
+        running = sum(1 for r in records if r.get("status") == "running")
+        print(f"{ip_address}: {len(records)} container(s), {running} running -> {path}")
+        for record in sorted(records, key=lambda r: (r["project"], r["service"] or r["name"])):
+            problems = container_problems(record)
+            if not problems:
+                continue
+            flagged += 1
+            print(f"  {record['project'] or '-'}/{record['service'] or record['name']}: {', '.join(problems)}")
+            if record.get("health_output"):
+                print(f"      last health check: {record['health_output']}")
+    if not flagged:
+        print("No crash-looping or unhealthy containers.")
+    return flagged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="dokploy_automate.py logs",
+        description="Collect logs and state of every app container into local bundles",
+    )
+    parser.add_argument("--ip", action="append", required=True, help="Server to collect from (repeatable)")
+    parser.add_argument("--config", default="dokploy_config.json", help="Path to apps config JSON")
+    parser.add_argument("--app", help="Only collect this app's containers")
+    parser.add_argument("--all-containers", action="store_true", help="Collect every container, not only the apps'")
+    parser.add_argument("--ssh-user", default="adminuser", help="SSH Username (default: adminuser)")
+    parser.add_argument("--ssh-private", default="~/.ssh/id_rsa", help="Path to private SSH key (default: ~/.ssh/id_rsa)")
+    parser.add_argument("--tail", type=int, default=500, help="Log lines per container (default: 500)")
+    parser.add_argument("--since", help="Only logs newer than this (e.g. 2h, 2024-01-01T10:00:00)")
+    parser.add_argument("--parallel", type=int, default=8, help="Containers collected at a time per server (default: 8)")
+    parser.add_argument("--output", help="Bundle directory (default: dokploy_logs_<timestamp>)")
+    parser.add_argument("--fail-on-problems", action="store_true", help="Exit non-zero when a container needs attention")
+    args = parser.parse_args(argv)
+
+    projects = []
+    if not args.all_containers:
+        try:
+            with open(args.config, "r") as f:
+                app_configs = json.load(f)
+        except Exception as e:
+            print(f"Error loading config file {args.config}: {e}")
+            return 1
+        projects = [
+            app_slug(c["name"]) for c in app_configs
+            if not args.app or args.app.lower() in c["name"].lower()
+        ]
+        if not projects:
+            print(f"No configured app matches {args.app}")
+            return 1
+
+    output = args.output or time.strftime("dokploy_logs_%Y%m%d-%H%M%S")
+    os.makedirs(output, exist_ok=True)
+    key_path = os.path.expanduser(args.ssh_private)
+
+    def collect(ip_address):
+        path = os.path.join(output, f"{ip_address}.tar.gz")
+        print(f"Collecting container logs on {ip_address}...")
+        records = collect_bundle(
+            ip_address, args.ssh_user, key_path, path, projects, args.tail, args.since, args.parallel,
+            local=ip_address in ("localhost", "127.0.0.1"),
+        )
+        return path, records
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=len(args.ip)) as pool:
+        bundles = dict(zip(args.ip, pool.map(collect, args.ip)))
+    print(f"Collected in {time.time() - started:.1f}s")
+
+    flagged = print_summary(bundles)
+    if any(records is None for _, records in bundles.values()):
+        return 1
+    return 1 if (flagged and args.fail_on_problems) else 0
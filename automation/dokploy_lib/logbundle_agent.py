@@ -0,0 +1,118 @@
+"""Collects container state and logs on the VM into a gzipped tar written to stdout.
+
+Like remote_agent.py, this file is not imported by the automation:
+logbundle.collect_bundle sends its source, followed by a call to ``main``, to
+``sudo python3 -`` over one SSH session, so it must only use the standard
+library of the VM's system Python.
+
+Containers are inspected and their logs read concurrently. Every log goes to
+a temporary file first and is streamed into the archive from there, so memory
+stays bounded however much the containers logged. The bundle holds::
+
+    <project>/<container>/inspect.json
+    <project>/<container>/logs.txt
+    summary.json
+
+and the summary (one record per container) is also printed to stderr after
+SUMMARY_MARKER.
+"""
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+SUMMARY_MARKER = "__BUNDLE_SUMMARY__"
+
+CONTAINER_FORMAT = '{{.ID}}\t{{.Names}}\t{{.Label "com.docker.compose.project"}}\t{{.Label "com.docker.compose.service"}}'
+
+
+def list_containers(projects):
+    """Containers (running or not) of the given compose project prefixes; all when empty."""
+    output = subprocess.run(
+        ["docker", "ps", "-a", "--format", CONTAINER_FORMAT],
+        stdout=subprocess.PIPE, universal_newlines=True, check=True,
+    ).stdout
+    containers = []
+    for line in output.splitlines():
+        fields = (line.split("\t") + ["", "", ""])[:4]
+        container_id, name, project, service = fields
+        if projects and not any(project == p or project.startswith(p + "-") for p in projects):
+            continue
+        containers.append({"id": container_id, "name": name, "project": project, "service": service})
+    return containers
+
+
+def collect(container, workdir, tail, since):
+    """(summary record, inspect document, path of the spooled log) of one container."""
+    record = dict(container)
+    inspect = {}
+    try:
+        output = subprocess.run(
+            ["docker", "inspect", container["id"]],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True,
+        ).stdout
+        inspect = json.loads(output)[0]
+    except Exception as e:
+        record["error"] = "inspect: {}".format(e)
+    state = inspect.get("State") or {}
+    health = state.get("Health") or {}
+    failing = [entry for entry in health.get("Log") or [] if entry.get("ExitCode")]
+    record.update({
+        "status": state.get("Status"),
+        "restarts": inspect.get("RestartCount", 0),
+        "exit_code": state.get("ExitCode"),
+        "oom_killed": bool(state.get("OOMKilled")),
+        "health": health.get("Status"),
+        "health_output": (failing[-1].get("Output") or "").strip()[-300:] if failing else None,
+        "started_at": state.get("StartedAt"),
+        "finished_at": state.get("FinishedAt"),
+    })
+
+    log_path = os.path.join(workdir, container["id"] + ".log")
+    argv = ["docker", "logs", "--timestamps", "--tail", str(tail)]
+    if since:
+        argv += ["--since", since]
+    with open(log_path, "wb") as f:
+        subprocess.run(argv + [container["id"]], stdout=f, stderr=subprocess.STDOUT)
+    record["log_bytes"] = os.path.getsize(log_path)
+    return record, inspect, log_path
+
+
+def add_bytes(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = time.time()
+    archive.addfile(info, io.BytesIO(data))
+
+
+def main(options_json):
+    options = json.loads(options_json)
+    workdir = tempfile.mkdtemp(prefix="dokploy-logs-")
+    archive = tarfile.open(fileobj=sys.stdout.buffer, mode="w|gz")
+    records = []
+    try:
+        containers = list_containers(options.get("projects") or [])
+        with ThreadPoolExecutor(max_workers=max(1, options.get("parallel", 8))) as pool:
+            futures = [
+                pool.submit(collect, c, workdir, options.get("tail", 500), options.get("since"))
+                for c in containers
+            ]
+            # The archive is written from this thread only, as each container finishes
+            for future in as_completed(futures):
+                record, inspect, log_path = future.result()
+                base = "{}/{}".format(record["project"] or "no-project", record["name"])
+                add_bytes(archive, base + "/inspect.json", json.dumps(inspect, indent=2).encode())
+                archive.add(log_path, arcname=base + "/logs.txt")
+                os.remove(log_path)
+                records.append(record)
+        add_bytes(archive, "summary.json", json.dumps(records, indent=2).encode())
+    finally:
+        archive.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.stderr.write(SUMMARY_MARKER + json.dumps(records) + "\n")
@@ -0,0 +1,160 @@
+"""Pull-through cache registries on the deploy servers, so repeat pulls stay local.
+
+One ``registry:2`` proxy per upstream (Docker Hub and GHCR) runs on each
+server, storing what it fetched on the VM's persistent data disk
+(/dokploy-data, see main.tf; /var/lib elsewhere). Docker Hub pulls go through
+it transparently once the daemon lists it in ``registry-mirrors``, including
+the pulls of Dokploy's own builds. The daemon cannot mirror other registries,
+so GHCR images are pulled by the pre-pull through their proxy and tagged with
+their original name, which compose then finds locally.
+
+Each proxy publishes its counters (requests, cache hits, bytes fetched
+upstream and bytes served) on a loopback debug port; the difference between
+two snapshots is the run's hit rate.
+"""
+import json
+import shlex
+
+MIRROR_IMAGE = "registry:2"
+
+# Upstream registry -> proxy container, its loopback port and its debug (metrics) port
+MIRRORS = {
+    "docker.io": {"container": "dokploy-mirror-dockerhub", "remote": "https://registry-1.docker.io",
+                  "port": 5480, "debug_port": 5490},
+    "ghcr.io": {"container": "dokploy-mirror-ghcr", "remote": "https://ghcr.io",
+                "port": 5481, "debug_port": 5491},
+}
+
+DAEMON_CONFIG = "/etc/docker/daemon.json"
+
+
+def image_registry(image):
+    """Registry host of an image reference (docker.io when it has none)."""
+    first, sep, _ = image.partition("/")
+    if sep and ("." in first or ":" in first or first == "localhost"):
+        return first
+    return "docker.io"
+
+
+def mirrored_ref(image):
+    """The reference pulling `image` through its local proxy, or None if the daemon handles it."""
+    registry = image_registry(image)
+    if registry == "docker.io" or registry not in MIRRORS:
+        return None
+    return f"127.0.0.1:{MIRRORS[registry]['port']}/{image.partition('/')[2]}"
+
+
+def mirror_ops():
+    """Plan operations starting the proxies (unless running) and registering the Hub mirror."""
+    ops = []
+    for registry, mirror in MIRRORS.items():
+        name = mirror["container"]
+        storage = f"$root/registry-mirror/{registry}"
+        ops.append({"op": "run", "group": registry, "timeout": 300, "cmd": (
+            f"docker inspect -f '{{{{.State.Running}}}}' {name} 2>/dev/null | grep -q true || {{ "
+            f"docker rm -f {name} >/dev/null 2>&1; "
+            "root=/dokploy-data; [ -d $root ] || root=/var/lib; "
+            f"mkdir -p {storage} && docker run -d --name {name} --restart always "
+            f"-p 127.0.0.1:{mirror['port']}:5000 -p 127.0.0.1:{mirror['debug_port']}:5001 "
+            f"-e REGISTRY_PROXY_REMOTEURL={mirror['remote']} -e REGISTRY_HTTP_DEBUG_ADDR=0.0.0.0:5001 "
+            f"-v {storage}:/var/lib/registry {MIRROR_IMAGE}; }}"
+        )})
+    hub = f"http://127.0.0.1:{MIRRORS['docker.io']['port']}"
+    ops += [
+        {"op": "json_merge", "group": "daemon", "path": DAEMON_CONFIG, "values": {"registry-mirrors": [hub]}},
+        # registry-mirrors is reloadable: SIGHUP, no container restarts
+        {"op": "run", "group": "daemon", "cmd": "systemctl reload docker || kill -HUP $(pidof dockerd)"},
+    ]
+    return ops
+
+
+def stats_ops():
+    return [
+        {"op": "run", "group": f"stats-{registry}",
+         "cmd": f"curl -sf --max-time 5 http://127.0.0.1:{mirror['debug_port']}/debug/vars"}
+        for registry, mirror in MIRRORS.items()
+    ]
+
+
+def parse_stats(results):
+    """{registry: {"requests", "hits", "fetched", "served"}} of the stats_ops results."""
+    stats = {}
+    for registry, result in zip(MIRRORS, results):
+        if not result.get("ok"):
+            continue
+        try:
+            proxy = json.loads(result["output"])["registry"]["proxy"]
+        except (KeyError, TypeError, ValueError):
+            continue
+        stats[registry] = {"requests": 0, "hits": 0, "fetched": 0, "served": 0}
+        for kind in ("blobs", "manifests"):
+            metrics = proxy.get(kind) or {}
+            stats[registry]["requests"] += metrics.get("Requests", 0)
+            stats[registry]["hits"] += metrics.get("Hits", 0)
+            stats[registry]["fetched"] += metrics.get("BytesPulled", 0)
+            stats[registry]["served"] += metrics.get("BytesPushed", 0)
+    return stats
+
+
+def start_registry_mirrors(ip_address, username, key_path):
+    """Make sure the proxies run on a server; returns their counters so far, or None on failure."""
+    from .remote import plan_errors, plan_ok, run_plan
+
+    results = run_plan(ip_address, username, key_path, mirror_ops(), timeout=600)
+    if not plan_ok(results):
+        print(f"Warning: Registry mirror setup failed on {ip_address}: {'; '.join(plan_errors(results))}")
+        return None
+    print(f"Registry mirror ready on {ip_address} ({', '.join(MIRRORS)})")
+    return mirror_stats(ip_address, username, key_path) or {}
+
+
+def mirror_stats(ip_address, username, key_path):
+    """Current proxy counters on a server, or None if they could not be read."""
+    from .remote import run_plan
+
+    results = run_plan(ip_address, username, key_path, stats_ops(), timeout=60)
+    return None if results is None else parse_stats(results)
+
+
+def stats_delta(before, after):
+    """Counters accumulated between two snapshots (a restarted proxy starts from zero)."""
+    delta = {}
+    for registry, counters in (after or {}).items():
+        base = (before or {}).get(registry, {})
+        if any(counters[key] < base.get(key, 0) for key in counters):
+            base = {}
+        delta[registry] = {key: counters[key] - base.get(key, 0) for key in counters}
+    return delta
+
+
+def describe_stats(registry, counters):
+    if not counters["requests"]:
+        return f"{registry}: no pulls"
+    gb = 1024 ** 3
+    return (
+        f"{registry}: {counters['hits']}/{counters['requests']} requests served from cache "
+        f"({counters['hits'] / counters['requests'] * 100:.0f}%), "
+        f"{counters['served'] / gb:.2f}GB served, {counters['fetched'] / gb:.2f}GB fetched upstream"
+    )
+
+
+def pull_through_mirror(ip_address, username, key_path, images, parallelism=4):
+    """Pull images on a server, through their local proxy where the daemon does not.
+
+    Returns {image: True/False}, like ssh.pull_images_remote.
+    """
+    from .remote import run_plan
+
+    ops = []
+    for image in images:
+        direct = f"docker pull -q {shlex.quote(image)} >/dev/null"
+        via = mirrored_ref(image)
+        cmd = direct if via is None else (
+            f"{{ docker pull -q {shlex.quote(via)} >/dev/null && "
+            f"docker tag {shlex.quote(via)} {shlex.quote(image)}; }} || {direct}"
+        )
+        ops.append({"op": "run", "group": image, "cmd": cmd, "timeout": 3600})
+    results = run_plan(ip_address, username, key_path, ops, parallel=parallelism, timeout=3600)
+    if results is None:
+        return {image: False for image in images}
+    return {image: result["ok"] for image, result in zip(images, results)}
@@ -0,0 +1,66 @@
+"""Run interdependent steps concurrently, each as soon as its dependencies are done.
+
+A step graph is a dict ``{name: (deps, fn)}``; ``fn(results)`` gets the results
+of all steps finished so far and its return value becomes ``results[name]``.
+Every step is timed as a history phase under its own name unless disabled.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import history
+
+
+def _run_step(label, name, fn, results, record_phases):
+    started = time.time()
+    print(f"[{label}] {name}: started")
+    if record_phases:
+        with history.phase(name):
+            value = fn(results)
+    else:
+        value = fn(results)
+    print(f"[{label}] {name}: done in {time.time() - started:.1f}s")
+    return value
+
+
+def run_graph(steps, label="pipeline", max_workers=None, record_phases=True):
+    """Run a step graph and return {name: result}.
+
+    With record_phases=False the steps are not timed in the run history, for
+    graphs that are run many times per run (one per app).
+
+    The first failing step (including sys.exit) stops new steps from being
+    started; steps already running are allowed to finish, then the failure is
+    re-raised in the caller.
+    """
+    for name, (deps, _) in steps.items():
+        unknown = [d for d in deps if d not in steps]
+        if unknown:
+            raise ValueError(f"Step {name} depends on unknown step(s): {', '.join(unknown)}")
+
+    results = {}
+    pending = dict(steps)
+    running = {}
+    failure = None
+    with ThreadPoolExecutor(max_workers=max_workers or len(steps) or 1) as pool:
+        while pending or running:
+            if failure is None:
+                for name, (deps, fn) in list(pending.items()):
+                    if all(d in results for d in deps):
+                        del pending[name]
+                        running[pool.submit(_run_step, label, name, fn, results, record_phases)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except BaseException as e:
+                    print(f"[{label}] {name}: failed ({e!r})")
+                    if failure is None:
+                        failure = e
+    if failure is not None:
+        raise failure
+    if pending:
+        raise ValueError(f"Dependency cycle between steps: {', '.join(pending)}")
+    return results
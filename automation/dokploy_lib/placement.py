@@ -0,0 +1,101 @@
+"""Placement of compose apps onto registered Dokploy deploy servers.
+
+Each app declares what it needs in dokploy_config.json::
+
+    "resources": {"memory": 8192, "cpu": 2}    # MB, vCPUs
+
+and may pin itself with ``"server": "<ip or server name>"``. Servers report
+their capacity and current load over SSH; apps are then placed largest-first
+on the server with the most headroom left after the placement.
+"""
+
+DEFAULT_RESOURCES = {"memory": 1024, "cpu": 0.5}
+
+# Memory (MB) kept free on every server for Docker, Traefik and the OS
+MEMORY_RESERVE_MB = 1024
+
+# Assumed capacity when a server cannot be sampled (Standard_B4ms)
+FALLBACK_CAPACITY = {"cpus": 4, "memory_total": 16384, "memory_available": 14336, "load1": 0.0}
+
+
+def app_resources(cfg):
+    """Declared resource needs of an app, with defaults for anything missing."""
+    declared = cfg.get("resources", {})
+    return {
+        "memory": float(declared.get("memory", DEFAULT_RESOURCES["memory"])),
+        "cpu": float(declared.get("cpu", DEFAULT_RESOURCES["cpu"])),
+    }
+
+
+def server_matches(server, ref):
+    return ref in (server.get("serverId"), server.get("name"), server.get("ipAddress"))
+
+
+def plan_placement(app_configs, servers, snapshots, existing_apps=None):
+    """Assign every app to a server.
+
+    `servers` are Dokploy server records (serverId, name, ipAddress);
+    `snapshots` maps serverId -> resource snapshot (see ssh.sample_server_resources);
+    `existing_apps` are compose records ({name, composeId, serverId}) that stay
+    where they are -- their usage is already part of the live snapshot.
+
+    Returns {app name: server record}.
+    """
+    existing_apps = existing_apps or []
+    headroom = {}
+    for srv in servers:
+        snap = snapshots.get(srv["serverId"]) or FALLBACK_CAPACITY
+        headroom[srv["serverId"]] = {
+            "memory": snap["memory_available"] - MEMORY_RESERVE_MB,
+            "cpu": snap["cpus"] - snap["load1"],
+        }
+
+    placement = {}
+    pending = []
+    for cfg in app_configs:
+        existing = next((a for a in existing_apps if a["name"] == cfg["name"]), None)
+        if existing and existing.get("serverId"):
+            srv = next((s for s in servers if s["serverId"] == existing["serverId"]), None)
+            if srv:
+                placement[cfg["name"]] = srv
+                continue
+        if cfg.get("server"):
+            srv = next((s for s in servers if server_matches(s, cfg["server"])), None)
+            if srv:
+                need = app_resources(cfg)
+                headroom[srv["serverId"]]["memory"] -= need["memory"]
+                headroom[srv["serverId"]]["cpu"] -= need["cpu"]
+                placement[cfg["name"]] = srv
+                continue
+            print(f"Warning: {cfg['name']} is pinned to unknown server {cfg['server']}; placing automatically.")
+        pending.append(cfg)
+
+    # Largest memory consumers first so they get the emptiest servers
+    pending.sort(key=lambda c: (app_resources(c)["memory"], app_resources(c)["cpu"]), reverse=True)
+    for cfg in pending:
+        need = app_resources(cfg)
+        fitting = [
+            s for s in servers
+            if headroom[s["serverId"]]["memory"] >= need["memory"]
+            and headroom[s["serverId"]]["cpu"] >= need["cpu"]
+        ]
+        if not fitting:
+            print(f"Warning: No server has headroom for {cfg['name']} ({need['memory']:.0f}MB, {need['cpu']} CPU); overcommitting.")
+        srv = max(
+            fitting or servers,
+            key=lambda s: (
+                headroom[s["serverId"]]["memory"] - need["memory"],
+                headroom[s["serverId"]]["cpu"] - need["cpu"],
+            ),
+        )
+        headroom[srv["serverId"]]["memory"] -= need["memory"]
+        headroom[srv["serverId"]]["cpu"] -= need["cpu"]
+        placement[cfg["name"]] = srv
+
+    print("Placement plan:")
+    for name, srv in placement.items():
+        print(f"  {name:<32} -> {srv.get('name')} ({srv.get('ipAddress')})")
+    for srv in servers:
+        left = headroom[srv["serverId"]]
+        print(f"  [{srv.get('name')}] headroom after placement: {left['memory']:.0f}MB, {left['cpu']:.1f} CPU")
+    return placement
@@ -0,0 +1,205 @@
+"""Host-port ownership checks before anything is deployed.
+
+Every app's rendered compose file (plus any ``hostPort`` in dokploy_config.json)
+is reduced to the host ports it publishes. Those claims are checked against each
+other, against the ports the platform itself holds, and against a live snapshot
+of each server (``ss`` listeners and published Docker ports). A conflict then
+stops the run up front instead of after a build, when ``docker compose up``
+fails to bind. The same index tells ``--clean`` which ports to free.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from .compose import find_local_compose, hard_inject_env_vars, published_ports, replace_domain
+
+# Host ports held by the platform on every server
+PLATFORM_PORTS = {22: "sshd", 80: "traefik", 443: "traefik", 3000: "dokploy"}
+
+# Of those, the ports a clean rebuild frees as well (Traefik and Dokploy are recreated)
+CLEANUP_PLATFORM_PORTS = (80, 443, 3000)
+
+# Containers belonging to the platform rather than to an app
+PLATFORM_CONTAINER_PREFIX = "dokploy"
+
+
+def app_slug(name):
+    """Prefix of the appName (and compose project) Dokploy gives an app's compose."""
+    return name.lower().replace(" ", "-")
+
+
+def rendered_composes(app_configs, app_inputs):
+    """{app name: compose content as it will be deployed, or None if unavailable}.
+
+    Uses the locally rendered compose when there is one, otherwise the repo's
+    compose file fetched from GitHub (concurrently), with the app's env file applied.
+    """
+    from .prepull import fetch_repo_compose
+
+    def render(cfg):
+        inputs = app_inputs.get(cfg["name"], {})
+        if inputs.get("compose_content"):
+            return inputs["compose_content"]
+        if find_local_compose(cfg["name"]) or not cfg.get("repo", "").startswith("https://"):
+            return None
+        content = fetch_repo_compose(
+            cfg["repo"], cfg.get("branch", "main"), cfg.get("composePath", "docker-compose.yml")
+        )
+        if content is None:
+            return None
+        content = replace_domain(content)
+        if inputs.get("env_file"):
+            content = hard_inject_env_vars(content, inputs["env_file"])
+        return content
+
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(app_configs)))) as pool:
+        return dict(zip([c["name"] for c in app_configs], pool.map(render, app_configs)))
+
+
+def build_port_index(app_configs, composes):
+    """Host ports claimed by each app.
+
+    Returns (claims, unknown): claims are {"app", "service", "port", "protocol",
+    "source"} dicts; unknown lists the apps whose compose could not be read
+    (only their configured hostPort is known).
+    """
+    claims = []
+    unknown = []
+    for cfg in app_configs:
+        content = composes.get(cfg["name"])
+        if content is None:
+            unknown.append(cfg["name"])
+            compose_ports = {}
+        else:
+            compose_ports = published_ports(content, cfg.get("composeCommand"))
+        for service, ports in compose_ports.items():
+            for port, protocol in ports:
+                claims.append({"app": cfg["name"], "service": service, "port": port,
+                               "protocol": protocol, "source": "compose"})
+        for exposure in [cfg] + cfg.get("exposures", []):
+            port = exposure.get("hostPort")
+            if not port:
+                continue
+            service = exposure.get("service") or cfg.get("service")
+            if any(c["app"] == cfg["name"] and c["port"] == int(port) and c["protocol"] == "tcp" for c in claims):
+                continue
+            claims.append({"app": cfg["name"], "service": service, "port": int(port),
+                           "protocol": "tcp", "source": "hostPort"})
+    return claims, unknown
+
+
+def cleanup_ports(claims):
+    """Ports a clean rebuild frees on every server (claimed ports plus Traefik/Dokploy's)."""
+    return sorted(set(CLEANUP_PLATFORM_PORTS) | {c["port"] for c in claims})
+
+
+def parse_docker_ports(value):
+    """[(host port, protocol)] published in a `docker ps` Ports column."""
+    ports = set()
+    for match in re.finditer(r":(\d+)(?:-(\d+))?->\d+(?:-\d+)?/(\w+)", value or ""):
+        first, last, protocol = match.groups()
+        for port in range(int(first), int(last or first) + 1):
+            ports.add((port, protocol))
+    return sorted(ports)
+
+
+def parse_ss_listeners(output):
+    """[(port, protocol, process)] of `ss -Htlnup` output; process is None if not shown."""
+    listeners = []
+    for line in (output or "").splitlines():
+        fields = line.split()
+        if len(fields) < 5 or fields[0] not in ("tcp", "udp"):
+            continue
+        port = fields[4].rpartition(":")[2]
+        if not port.isdigit():
+            continue
+        process = re.search(r'users:\(\("([^"]+)"', line)
+        listeners.append((int(port), fields[0], process.group(1) if process else None))
+    return listeners
+
+
+def port_snapshot(ip_address, username, key_path):
+    """Live owners of the host ports on a server: {(port, protocol): owner}.
+
+    An owner is {"container", "project"} for published Docker ports, else
+    {"process"}. Returns None when the server could not be inspected.
+    """
+    from .remote import run_plan
+
+    results = run_plan(ip_address, username, key_path, [
+        {"op": "docker", "group": "docker", "args": [
+            "ps", "--format", '{{.Names}}\t{{.Label "com.docker.compose.project"}}\t{{.Ports}}',
+        ]},
+        {"op": "run", "group": "ss", "cmd": "ss -Htlnup"},
+    ], timeout=60)
+    if results is None:
+        return None
+    owners = {}
+    docker, ss = results
+    if docker.get("ok"):
+        for line in (docker.get("output") or "").splitlines():
+            name, _, rest = line.partition("\t")
+            project, _, published = rest.partition("\t")
+            for key in parse_docker_ports(published):
+                owners[key] = {"container": name, "project": project}
+    else:
+        print(f"Warning: Could not list containers on {ip_address}: {docker.get('error')}")
+    if ss.get("ok"):
+        for port, protocol, process in parse_ss_listeners(ss.get("output")):
+            if process in ("docker-proxy", "dockerd") or (port, protocol) in owners:
+                continue  # Published by a container (already attributed above)
+            owners[(port, protocol)] = {"process": process or "unknown"}
+    else:
+        print(f"Warning: Could not list listening sockets on {ip_address}: {ss.get('error')}")
+    return owners
+
+
+def describe_owner(owner):
+    if "container" in owner:
+        return f"container {owner['container']}" + (f" (project {owner['project']})" if owner["project"] else "")
+    return f"process {owner['process']}"
+
+
+def owned_by(owner, app_name):
+    """True if a live owner is the app's own container (a redeploy replaces it)."""
+    project = owner.get("project") or ""
+    slug = app_slug(app_name)
+    return project == slug or project.startswith(f"{slug}-")
+
+
+def find_port_conflicts(claims, placement, snapshots):
+    """Conflicts of the claimed ports on the servers the apps are placed on.
+
+    `placement` maps app name -> server dict (serverId, ipAddress); `snapshots`
+    maps serverId -> port_snapshot result (None: live check skipped). Returns
+    readable conflict descriptions (empty when the ports are free).
+    """
+    conflicts = []
+    by_server = {}
+    for claim in claims:
+        server = placement.get(claim["app"])
+        if server is not None:
+            by_server.setdefault(server["serverId"], (server, []))[1].append(claim)
+
+    for server_id, (server, server_claims) in by_server.items():
+        where = server["ipAddress"]
+        owners = {}
+        for claim in server_claims:
+            key = (claim["port"], claim["protocol"])
+            owner = f"{claim['app']}/{claim['service']}"
+            if claim["port"] in PLATFORM_PORTS:
+                conflicts.append(f"{where} port {claim['port']}/{claim['protocol']}: {owner} "
+                                 f"collides with {PLATFORM_PORTS[claim['port']]}")
+            elif key in owners and owners[key] != owner:
+                conflicts.append(f"{where} port {claim['port']}/{claim['protocol']}: claimed by "
+                                 f"both {owners[key]} and {owner}")
+            owners.setdefault(key, owner)
+
+        live = snapshots.get(server_id)
+        for claim in server_claims:
+            key = (claim["port"], claim["protocol"])
+            holder = (live or {}).get(key)
+            if holder is None or claim["port"] in PLATFORM_PORTS or owned_by(holder, claim["app"]):
+                continue
+            conflicts.append(f"{where} port {claim['port']}/{claim['protocol']}: "
+                             f"{claim['app']}/{claim['service']} needs it but it is held by {describe_owner(holder)}")
+    return conflicts
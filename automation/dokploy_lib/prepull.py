@@ -0,0 +1,95 @@
+"""Background image pre-pull: compose files -> image list -> parallel docker pull on the VM."""
+import re
+import threading
+import time
+
+import requests
+
+from .compose import extract_compose_images, find_local_compose, replace_domain
+from .envfiles import detect_env_file
+from .ssh import pull_images_remote
+
+
+def fetch_repo_compose(repo_url, branch="main", compose_path="docker-compose.yml"):
+    """Download a compose file straight from GitHub without cloning the repo."""
+    match = re.match(r"https://github\.com/([^/]+)/([^/]+?)(?:\.git)?/?$", repo_url)
+    if not match:
+        print(f"DEBUG: Cannot fetch compose for non-GitHub HTTPS repo {repo_url}")
+        return None
+    owner, repo = match.groups()
+    raw_url = f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{compose_path[2:] if compose_path.startswith('./') else compose_path}"
+    try:
+        resp = requests.get(raw_url, timeout=15)
+        if resp.status_code == 200:
+            return resp.text
+        print(f"DEBUG: {raw_url} returned {resp.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"DEBUG: Could not fetch {raw_url}: {e}")
+    return None
+
+
+def collect_app_images(app_configs):
+    """Resolve the image list for every configured app (local override, then GitHub)."""
+    images = []
+    for cfg in app_configs:
+        env_file = detect_env_file(cfg["name"])
+        content = None
+        local_compose = find_local_compose(cfg["name"])
+        if local_compose:
+            with open(local_compose, "r") as f:
+                content = f.read()
+        elif cfg.get("repo", "").startswith("https://"):
+            content = fetch_repo_compose(
+                cfg["repo"], cfg.get("branch", "main"), cfg.get("composePath", "docker-compose.yml")
+            )
+        app_images = list(cfg.get("images", []))
+        if content:
+            app_images += extract_compose_images(replace_domain(content), cfg.get("composeCommand"), env_file)
+        print(f"Pre-pull: {cfg['name']} -> {app_images or 'no pullable images'}")
+        for image in app_images:
+            if image not in images:
+                images.append(image)
+    return images
+
+
+def start_image_prepull(app_configs, ip_address, username, key_path, parallelism=4, mirrored=False):
+    """Kick off image collection + pulling in a background thread.
+
+    With `mirrored`, images are pulled through the server's registry mirror
+    (see mirror.py). The returned state dict is filled in by the worker; pass
+    it to finish_image_prepull once the API configuration is done.
+    """
+    state = {"images": [], "results": {}, "duration": None}
+
+    def worker():
+        started = time.time()
+        try:
+            state["images"] = collect_app_images(app_configs)
+            print(f"Pre-pulling {len(state['images'])} image(s) on {ip_address} (parallelism {parallelism})...")
+            if mirrored:
+                from .mirror import pull_through_mirror
+
+                state["results"] = pull_through_mirror(ip_address, username, key_path, state["images"], parallelism)
+            else:
+                state["results"] = pull_images_remote(ip_address, username, key_path, state["images"], parallelism)
+        except Exception as e:
+            print(f"Warning: Image pre-pull worker failed: {e}")
+        state["duration"] = time.time() - started
+
+    state["thread"] = threading.Thread(target=worker, name="image-prepull", daemon=True)
+    state["thread"].start()
+    return state
+
+
+def finish_image_prepull(state, timeout=1800):
+    """Wait for the pre-pull worker and print a summary."""
+    state["thread"].join(timeout)
+    if state["thread"].is_alive():
+        print("Warning: Image pre-pull still running; continuing without it.")
+        return state
+    pulled = [i for i, ok in state["results"].items() if ok]
+    failed = [i for i, ok in state["results"].items() if not ok]
+    print(f"Image pre-pull finished in {state['duration']:.0f}s: {len(pulled)} pulled, {len(failed)} failed")
+    for image in failed:
+        print(f"  FAILED: {image}")
+    return state
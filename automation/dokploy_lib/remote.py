@@ -0,0 +1,56 @@
+"""Run a plan of file and docker operations on the VM in one round trip.
+
+The plan is executed by remote_agent.py on the VM (see there for the
+operations). run_plan returns one result dict per operation, in plan order::
+
+    {"op", "group", "ok", "output"?, "error"?, "skipped"?, "seconds"}
+"""
+import os
+import json
+import subprocess
+
+from .ssh import ssh_command
+
+AGENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "remote_agent.py")
+RESULT_MARKER = "__PLAN_RESULTS__"
+
+
+def build_program(ops, parallel=4):
+    """Agent source plus the call that executes `ops`, for `python3 -`."""
+    with open(AGENT_PATH, "r") as f:
+        source = f.read()
+    return f"{source}\nmain({json.dumps(json.dumps(ops))}, {int(parallel)})\n"
+
+
+def run_plan(ip_address, username, key_path, ops, parallel=4, local=False, timeout=600):
+    """Execute `ops` as root on the VM (or here, when `local`); None if the plan could not run.
+
+    Operation payloads (e.g. file contents) travel on stdin, never on a command line.
+    """
+    if not ops:
+        return []
+    cmd = ["sudo", "python3", "-"] if local else ssh_command(ip_address, username, key_path, "sudo python3 -")
+    try:
+        proc = subprocess.run(
+            cmd, input=build_program(ops, parallel), capture_output=True, text=True, timeout=timeout,
+        )
+    except Exception as e:
+        print(f"Warning: Could not run remote plan on {ip_address}: {e}")
+        return None
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    print(f"Warning: Remote plan on {ip_address} failed (exit {proc.returncode}): {proc.stderr.strip()[-300:]}")
+    return None
+
+
+def plan_ok(results):
+    """True when the plan ran and every operation succeeded."""
+    return results is not None and all(r and r["ok"] for r in results)
+
+
+def plan_errors(results):
+    """'op: error' lines of the failed operations."""
+    if results is None:
+        return ["plan did not run"]
+    return [f"{r['op']}: {r['error']}" for r in results if r and r.get("error")]
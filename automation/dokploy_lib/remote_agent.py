@@ -0,0 +1,155 @@
+"""Executes a plan of file and docker operations on the VM.
+
+This file is not imported by the automation: remote.run_plan sends its source,
+followed by a call to ``main``, to ``sudo python3 -`` over one SSH session. It
+must therefore only use the standard library of the VM's system Python.
+
+A plan is a list of operations such as::
+
+    {"op": "write", "path": "/etc/x/.env", "content": "...", "mode": "644", "owner": "root:root", "group": "app1"}
+
+Operations sharing a ``group`` run in order and a group stops at its first
+failure; different groups run in parallel. The results (one per operation,
+in plan order) are printed as JSON after RESULT_MARKER.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RESULT_MARKER = "__PLAN_RESULTS__"
+
+
+def _apply_owner_mode(path, owner=None, mode=None, recursive=False):
+    paths = [path]
+    if recursive and os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            paths.extend(os.path.join(root, name) for name in dirs + files)
+    for p in paths:
+        if owner:
+            user, _, group = owner.partition(":")
+            shutil.chown(p, user or None, group or None)
+        if mode:
+            os.chmod(p, int(str(mode), 8))
+
+
+def _run(argv, shell=False, timeout=None):
+    proc = subprocess.run(
+        argv, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, timeout=timeout,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError("exit {}: {}".format(proc.returncode, proc.stdout.strip()[-500:]))
+    return proc.stdout
+
+
+def op_mkdir(op):
+    os.makedirs(op["path"], exist_ok=True)
+    _apply_owner_mode(op["path"], op.get("owner"), op.get("mode"))
+
+
+def op_write(op):
+    if op.get("parents", True):
+        os.makedirs(os.path.dirname(op["path"]), exist_ok=True)
+    with open(op["path"], "a" if op.get("append") else "w") as f:
+        f.write(op["content"])
+    _apply_owner_mode(op["path"], op.get("owner"), op.get("mode"))
+
+
+def op_copy(op):
+    shutil.copy2(op["src"], op["dest"])
+    _apply_owner_mode(op["dest"], op.get("owner"), op.get("mode"))
+
+
+def op_chown(op):
+    _apply_owner_mode(op["path"], owner=op["owner"], recursive=op.get("recursive", False))
+
+
+def op_chmod(op):
+    _apply_owner_mode(op["path"], mode=op["mode"], recursive=op.get("recursive", False))
+
+
+def op_rm(op):
+    if os.path.isdir(op["path"]) and not os.path.islink(op["path"]):
+        if not op.get("recursive"):
+            raise RuntimeError("{} is a directory".format(op["path"]))
+        shutil.rmtree(op["path"])
+    elif os.path.lexists(op["path"]):
+        os.remove(op["path"])
+
+
+def op_mv(op):
+    shutil.move(op["src"], op["dest"])
+
+
+def op_run(op):
+    return _run(op["cmd"], shell=True, timeout=op.get("timeout"))
+
+
+def op_docker(op):
+    return _run(["docker"] + list(op["args"]), timeout=op.get("timeout"))
+
+
+def op_json_merge(op):
+    """Merge op["values"] into a JSON object file; lists are extended, not replaced."""
+    try:
+        with open(op["path"]) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    merged = dict(data)
+    for key, value in op["values"].items():
+        if isinstance(value, list) and isinstance(merged.get(key), list):
+            value = merged[key] + [v for v in value if v not in merged[key]]
+        merged[key] = value
+    if merged == data:
+        return "unchanged"
+    os.makedirs(os.path.dirname(op["path"]), exist_ok=True)
+    with open(op["path"], "w") as f:
+        json.dump(merged, f, indent=2)
+    return "changed"
+
+
+OPS = {
+    "mkdir": op_mkdir, "write": op_write, "copy": op_copy, "chown": op_chown,
+    "chmod": op_chmod, "rm": op_rm, "mv": op_mv, "run": op_run, "docker": op_docker,
+    "json_merge": op_json_merge,
+}
+
+
+def run_group(indexed_ops, results):
+    failed = False
+    for index, op in indexed_ops:
+        result = {"op": op.get("op"), "group": op.get("group"), "ok": False}
+        if failed:
+            result["skipped"] = True
+            results[index] = result
+            continue
+        start = time.time()
+        try:
+            if op.get("op") not in OPS:
+                raise ValueError("unknown operation {!r}".format(op.get("op")))
+            output = OPS[op["op"]](op)
+            result["ok"] = True
+            if output:
+                result["output"] = output
+        except Exception as e:
+            result["error"] = "{}: {}".format(type(e).__name__, e)
+            failed = True
+        result["seconds"] = round(time.time() - start, 3)
+        results[index] = result
+
+
+def main(plan_json, parallel=4):
+    plan = json.loads(plan_json)
+    groups = {}
+    for index, op in enumerate(plan):
+        groups.setdefault(op.get("group", ""), []).append((index, op))
+    results = [None] * len(plan)
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(groups)))) as pool:
+        for indexed_ops in groups.values():
+            pool.submit(run_group, indexed_ops, results)
+    sys.stdout.write(RESULT_MARKER + json.dumps(results) + "\n")
@@ -0,0 +1,260 @@
+"""SSH/SCP helpers for work that has to happen on the Dokploy VM itself."""
+import os
+import re
+import shlex
+import subprocess
+import time
+
+
+def ssh_command(ip_address, username, key_path, remote_cmd):
+    """Build the argv for running one shell command on the VM."""
+    return [
+        "ssh", "-o", "StrictHostKeyChecking=no", "-i", os.path.expanduser(key_path),
+        f"{username}@{ip_address}", remote_cmd,
+    ]
+
+
+def scp_command(ip_address, username, key_path, local_path, remote_path):
+    """Build the argv for copying one local file to the VM."""
+    return [
+        "scp", "-o", "StrictHostKeyChecking=no", "-i", os.path.expanduser(key_path),
+        local_path, f"{username}@{ip_address}:{remote_path}",
+    ]
+
+
+def authorize_public_key(ip_address, username, key_path, public_key):
+    """Add a public key for the SSH user and root, and allow key-based root login.
+
+    Purges Azure's restricted root authorized_keys in the process.
+    """
+    remote_cmd = (
+        f"echo '{public_key}' | tee -a /home/{username}/.ssh/authorized_keys > /dev/null && "
+        f"sudo sed -i 's/#PermitRootLogin prohibit-password/PermitRootLogin prohibit-password/' /etc/ssh/sshd_config && "
+        f"sudo sed -i 's/PermitRootLogin no/PermitRootLogin prohibit-password/' /etc/ssh/sshd_config && "
+        f"sudo systemctl reload ssh && "
+        f"sudo mkdir -p /root/.ssh && "
+        f"echo '{public_key}' | sudo tee /root/.ssh/authorized_keys > /dev/null"
+    )
+    subprocess.run(ssh_command(ip_address, username, key_path, remote_cmd), check=True)
+
+
+def copy_env_file_to_remote(local_path, remote_ip, app_slug, username="adminuser", key_path="~/.ssh/id_rsa"):
+    """Place an app's .env file in its Dokploy compose code directory (one remote plan)."""
+    from .remote import plan_errors, plan_ok, run_plan
+
+    try:
+        target_path = f"/etc/dokploy/compose/{app_slug}/code/.env"
+        print(f"Ensuring {target_path} on {remote_ip}...")
+
+        # If the compose directory exists here we are running on the target VM
+        is_local = os.path.exists(f"/etc/dokploy/compose/{app_slug}")
+        if is_local:
+            print(f"Detected local execution. Copying {local_path} to {target_path}...")
+
+        with open(local_path, "r") as f:
+            content = f.read()
+        results = run_plan(remote_ip, username, key_path, [
+            {"op": "write", "path": target_path, "content": content, "owner": "root:root", "mode": "644"},
+        ], local=is_local)
+        if not plan_ok(results):
+            print(f"Error copying env file: {'; '.join(plan_errors(results))}")
+            return False
+        print("Env file copied successfully.")
+        return True
+    except Exception as e:
+        print(f"Error copying env file: {e}")
+        return False
+
+
+def force_cleanup_ports(ip_address, username, key_path, ports):
+    """Forcefully remove docker containers binding specific ports via SSH."""
+    print(f"Force-cleaning ports {ports} on {ip_address}...")
+
+    # Construct command to find and kill containers mapping these ports
+    # We loop through each port to be safe
+    commands = []
+
+    # Check for docker ps filtering for published ports
+    for port in ports:
+        # Docker formatting: 0.0.0.0:9000->... or :::9000->...
+        # We look for containers publishing this port
+        cmd = f"docker ps -a --format '{{{{.ID}}}} {{{{.Ports}}}}' | grep ':{port}->' | awk '{{print $1}}' | xargs -r docker rm -f"
+        commands.append(cmd)
+
+    full_command = " && ".join(commands)
+
+    ssh_cmd = ssh_command(ip_address, username, key_path, full_command)
+
+    try:
+        subprocess.run(
+            ssh_cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        print("Port cleanup commands executed successfully.")
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"Warning: Port cleanup failed (may be harmless if empty): {e}")
+        return False
+
+
+def manual_git_clone_and_inject(ip_address, full_app_name, repo_url, ssh_private_path, username="adminuser"):
+    """Manually clone the repo and inject customizations, in one remote plan."""
+    from .remote import plan_errors, plan_ok, run_plan
+
+    print(f"Manually cloning {repo_url} for {full_app_name}...")
+    code_dir = f"/etc/dokploy/compose/{full_app_name}/code"
+
+    ops = [
+        {"op": "rm", "path": code_dir, "recursive": True},
+        {"op": "mkdir", "path": code_dir},
+        {"op": "run", "cmd": f"git clone {shlex.quote(repo_url)} {code_dir}"},
+        {"op": "chown", "path": code_dir, "owner": f"{username}:{username}", "recursive": True},
+    ] + dev_hub_customization_ops(full_app_name, username)
+    results = run_plan(ip_address, username, ssh_private_path, ops)
+    if not plan_ok(results):
+        print(f"Error during manual clone and inject: {'; '.join(plan_errors(results))}")
+        return False
+    print("UI customizations injected successfully.")
+    return True
+
+
+def dev_hub_customization_ops(full_app_name, username="adminuser"):
+    """Remote plan operations that put the custom UI files into a Dev-Hub checkout.
+
+    The plan runs as root; the files are handed to `username`, who owns the
+    checkout, as they were when uploaded with scp.
+    """
+    code_dir = f"/etc/dokploy/compose/{full_app_name}/code/frontend/src"
+    backend_dir = f"/etc/dokploy/compose/{full_app_name}/code/backend"
+    local_files = {
+        "automation/LandingPage_new.tsx": (f"{code_dir}/pages/LandingPage.tsx", False),
+        "automation/AppCard_new.tsx": (f"{code_dir}/components/AppCard.tsx", False),
+        "automation/index_update.css": (f"{code_dir}/index.css", True),  # Appended
+        # The catalog seeder reads dokploy_config.json from its own directory
+        "automation/seed_expanded.py": (f"{backend_dir}/seed_expanded.py", False),
+        "automation/dokploy_config.json": (f"{backend_dir}/dokploy_config.json", False),
+    }
+    ops = []
+    for local, (remote, append) in local_files.items():
+        if os.path.exists(local):
+            print(f"Uploading {local} to {remote}...")
+            with open(local, "r") as f:
+                ops.append({
+                    "op": "write", "path": remote, "content": f.read(), "append": append,
+                    "owner": f"{username}:{username}", "mode": "644",
+                })
+    return ops
+
+
+def inject_dev_hub_customizations(ip_address, full_app_name, ssh_private_path, wait=True, username="adminuser"):
+    """Inject custom UI files into the Dev-Hub deployment."""
+    from .remote import plan_errors, plan_ok, run_plan
+
+    print(f"Injecting Dev-Hub UI customizations for {full_app_name}...")
+    
+    directory = f"/etc/dokploy/compose/{full_app_name}/code/frontend/src/pages"
+    
+    if wait:
+        print(f"Waiting for target directory to be created: {directory}")
+        max_retries = 12
+        for i in range(max_retries):
+            check_cmd = ssh_command(ip_address, username, ssh_private_path, f"test -d {directory} && echo 'exists'")
+            try:
+                result = subprocess.run(check_cmd, capture_output=True, text=True)
+                if "exists" in result.stdout:
+                    print("Directory found!")
+                    break
+            except:
+                pass
+            print(f"Waiting... ({i+1}/{max_retries})")
+            time.sleep(5)
+        else:
+            print("Timeout waiting for directory creation. Skipping injection.")
+            return
+
+    results = run_plan(ip_address, username, ssh_private_path, dev_hub_customization_ops(full_app_name, username))
+    if plan_ok(results):
+        print("UI customizations injected successfully.")
+    else:
+        print(f"Warning: Failed to inject UI customizations: {'; '.join(plan_errors(results))}")
+
+
+def pull_images_remote(ip_address, username, key_path, images, parallelism=4):
+    """Pull images on the VM in one SSH session with at most `parallelism` concurrent pulls.
+
+    Returns {image: True/False}.
+    """
+    if not images:
+        return {}
+    image_list = " ".join(shlex.quote(i) for i in images)
+    remote_cmd = (
+        f"printf '%s\\n' {image_list} | xargs -r -P {int(parallelism)} -I{{}} "
+        "sh -c 'if sudo docker pull -q \"{}\" >/dev/null 2>&1; then echo \"PULLED {}\"; else echo \"FAILED {}\"; fi'"
+    )
+    ssh_cmd = ssh_command(ip_address, username, key_path, remote_cmd)
+    results = {image: False for image in images}
+    try:
+        proc = subprocess.run(ssh_cmd, capture_output=True, text=True, timeout=3600)
+        for line in proc.stdout.splitlines():
+            status, _, image = line.partition(" ")
+            if image in results:
+                results[image] = status == "PULLED"
+    except Exception as e:
+        print(f"Warning: Image pre-pull failed: {e}")
+    return results
+
+
+def sample_server_resources(ip_address, username, key_path):
+    """Read CPU count, memory, load average and disk/memory pressure from a server.
+
+    Returns {"cpus", "memory_total", "memory_available", "swap_used",
+    "disk_available" (MB), "load1", "memory_pressure" (PSI some avg10, %, None
+    where the kernel lacks PSI)} or None.
+    """
+    remote_cmd = (
+        "nproc; echo ---; grep -E '^(MemTotal|MemAvailable|SwapTotal|SwapFree):' /proc/meminfo; "
+        "echo ---; cat /proc/loadavg; echo ---; "
+        "{ df -Pm /var/lib/docker 2>/dev/null || df -Pm /; } | tail -1; echo ---; "
+        "head -1 /proc/pressure/memory 2>/dev/null"
+    )
+    try:
+        proc = subprocess.run(
+            ssh_command(ip_address, username, key_path, remote_cmd),
+            capture_output=True, text=True, timeout=30,
+        )
+        cpus, meminfo_lines, loadavg, df_line, pressure = (
+            section.strip() for section in proc.stdout.split("---\n")
+        )
+        meminfo = {}
+        for line in meminfo_lines.splitlines():
+            key, _, value = line.partition(":")
+            meminfo[key] = int(value.split()[0]) // 1024
+        avg10 = re.search(r"avg10=([\d.]+)", pressure)
+        return {
+            "cpus": int(cpus),
+            "memory_total": meminfo["MemTotal"],
+            "memory_available": meminfo["MemAvailable"],
+            "swap_used": meminfo.get("SwapTotal", 0) - meminfo.get("SwapFree", 0),
+            "disk_available": int(df_line.split()[3]) if df_line else None,
+            "load1": float(loadavg.split()[0]),
+            "memory_pressure": float(avg10.group(1)) if avg10 else None,
+        }
+    except Exception as e:
+        print(f"Warning: Could not sample resources on {ip_address}: {e}")
+        return None
+
+
+def follow_remote_file(ip_address, username, key_path, path):
+    """Start `tail -F` on a file of the VM and return the process.
+
+    Its stdout yields the file's lines as they are written (from the start).
+    Runs locally when the file's directory exists here, i.e. on the VM itself.
+    """
+    tail_cmd = f"exec sudo tail -n +1 -F {shlex.quote(path)} 2>/dev/null"
+    if os.path.isdir(os.path.dirname(path)):
+        cmd = ["sh", "-c", tail_cmd]
+    else:
+        cmd = ssh_command(ip_address, username, key_path, tail_cmd)
+    return subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+        text=True, errors="replace", bufsize=1,
+    )
@@ -0,0 +1,125 @@
+"""Local cache of the Dokploy session and resource IDs between runs.
+
+Entries are kept per Dokploy URL in a JSON file (``~/.dokploy_state.json`` or
+``$DOKPLOY_STATE_PATH``) with the time they were stored; ``get`` ignores
+entries older than their TTL. Callers validate what they use and invalidate
+entries the API rejects (401, not found), so a stale cache only costs the
+lookups it was meant to save.
+
+Server IDs are not cached: confirming one takes a server lookup per IP, while
+the single server.all call it would replace also reports each server's user
+and key, which decide whether the server must be set up again.
+"""
+import os
+import json
+import time
+import threading
+
+DEFAULT_STATE_PATH = os.environ.get(
+    "DOKPLOY_STATE_PATH", os.path.expanduser("~/.dokploy_state.json")
+)
+
+# Seconds an entry is trusted, by key prefix
+TTLS = {
+    "session": 12 * 3600,
+    "organization": 7 * 86400,
+    "git_ssh_key": 24 * 3600,
+    "compose:": 30 * 86400,
+}
+
+
+def lock_exclusive(lock_file):
+    """Hold an exclusive lock on an open file until it is closed (best effort off POSIX)."""
+    try:
+        import fcntl
+    except ImportError:
+        try:
+            import msvcrt
+        except ImportError:
+            return  # Neither available: save without the cross-process lock
+        # Locks the first byte; LK_LOCK retries for about 10 seconds before giving up
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        return
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+
+class StateCache:
+    """Cached values of one Dokploy instance; a disabled cache never hits."""
+
+    def __init__(self, target, path=None, enabled=True):
+        self.target = target
+        self.path = path or DEFAULT_STATE_PATH
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = False
+        if enabled and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f).get(target, {})
+            except Exception as e:
+                print(f"Warning: Ignoring unreadable state cache {self.path}: {e}")
+
+    def _ttl(self, key):
+        return next((ttl for prefix, ttl in TTLS.items() if key.startswith(prefix)), 3600)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+        if not entry or time.time() - entry["at"] > self._ttl(key):
+            return None
+        return entry["value"]
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.entries[key] = {"value": value, "at": time.time()}
+            self.dirty = True
+
+    def invalidate(self, key):
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.dirty = True
+
+    def clear(self):
+        """Forget everything about this instance (e.g. its session was rejected: it may be a new install)."""
+        with self.lock:
+            self.dirty = self.dirty or bool(self.entries)
+            self.entries = {}
+
+    def prune(self, prefix, keep):
+        """Drop entries under `prefix` whose remaining key is not in `keep`."""
+        with self.lock:
+            stale = [k for k in self.entries if k.startswith(prefix) and k[len(prefix):] not in keep]
+            for key in stale:
+                del self.entries[key]
+            self.dirty = self.dirty or bool(stale)
+
+    def save(self):
+        """Write back this instance's entries (file mode 600: it holds a session cookie).
+
+        The file is shared by all instances (fleet runs save concurrently), so
+        it is re-read and replaced under an exclusive lock.
+        """
+        if not self.enabled or not self.dirty:
+            return
+        try:
+            with open(f"{self.path}.lock", "w") as lock_file:
+                lock_exclusive(lock_file)
+                data = {}
+                if os.path.exists(self.path):
+                    with open(self.path) as f:
+                        data = json.load(f)
+                with self.lock:
+                    data[self.target] = self.entries
+                tmp_path = f"{self.path}.tmp"
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp_path, self.path)
+            self.dirty = False
+        except Exception as e:
+            print(f"Warning: Could not save state cache: {e}")
@@ -0,0 +1,80 @@
+"""Lean decoding of tRPC responses.
+
+Dokploy's listings (project.all, environment.one, compose.all) embed whole
+records -- compose files, env blobs, mounts, deployments -- of which callers
+read a few IDs and names. trpc_data parses the raw body once (bytes in, no
+text copy of it) and keeps only the fields the caller declares, so the bulk of
+the payload is released as soon as the call returns. body_preview logs the head
+of a body without decoding the rest.
+
+Field specs are tuples of names, with a dict for the fields of nested records::
+
+    ("projectId", "name", {"environments": ("environmentId", "name")})
+
+Lists are projected element by element; ``None`` keeps everything. The body
+is still parsed completely before the projection, so what the projection saves
+is memory held after the call, not parse time. Bodies are parsed with orjson
+when it is installed (an optional dependency, about twice as fast on large
+listings), otherwise with the standard library.
+"""
+import json
+
+try:
+    import orjson as fast_json
+except ImportError:
+    fast_json = None
+
+
+def body_preview(response, limit=200):
+    """The first `limit` bytes of a response body, for logging."""
+    return response.content[:limit].decode("utf-8", "replace")
+
+
+def project_fields(value, fields):
+    """`value` reduced to `fields` (see the module docstring)."""
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [project_fields(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    projected = {}
+    for field in fields:
+        if isinstance(field, dict):
+            for key, nested in field.items():
+                if key in value:
+                    projected[key] = project_fields(value[key], nested)
+        elif field in value:
+            projected[field] = value[field]
+    return projected
+
+
+def decode(response):
+    """The batched tRPC body as a list of entries."""
+    return (fast_json or json).loads(response.content)
+
+
+def trpc_data(response, fields=None, index=0):
+    """Data of the `index`-th call of a tRPC response, reduced to `fields`.
+
+    Raises (ValueError, KeyError, IndexError, TypeError) when the body is not
+    JSON or the call returned an error, like indexing ``response.json()`` would.
+    """
+    return project_fields(decode(response)[index]["result"]["data"]["json"], fields)
+
+
+def trpc_batch_data(response, fields=None):
+    """One entry per batched call: its data reduced to `fields`, or None if it failed."""
+    try:
+        body = decode(response)
+    except ValueError:
+        return []
+    if not isinstance(body, list):
+        return []
+    results = []
+    for entry in body:
+        try:
+            results.append(project_fields(entry["result"]["data"]["json"], fields))
+        except (KeyError, TypeError):
+            results.append(None)
+    return results
@@ -0,0 +1,126 @@
+"""Volume retention for rebuilds: keep selected Docker volumes across compose re-creation.
+
+Rules live per app in dokploy_config.json::
+
+    "volumes": {"keep": ["*ollama*", "*n8n*"], "wipe": ["*postgres*"]}
+
+Patterns (fnmatch) are matched against the compose-level volume name, i.e.
+without Dokploy's ``<appName>_`` project prefix and randomize suffix. Wipe wins
+over keep; volumes matching neither are wiped, as in a normal rebuild. Only
+named volumes can be retained -- bind mounts live in the compose code
+directory, which Dokploy removes with the app.
+"""
+import fnmatch
+
+from .remote import plan_errors, plan_ok, run_plan
+
+
+def volume_key(volume, app_name, suffix=None):
+    """Compose-level name of a project volume: <appName>_<key>[-<suffix>] -> (key, randomized)."""
+    key = volume[len(app_name) + 1:] if volume.startswith(f"{app_name}_") else volume
+    if suffix and key.endswith(f"-{suffix}"):
+        return key[: -len(suffix) - 1], True
+    return key, False
+
+
+def should_keep(key, rules):
+    rules = rules or {}
+    if any(fnmatch.fnmatch(key, p) for p in rules.get("wipe", [])):
+        return False
+    return any(fnmatch.fnmatch(key, p) for p in rules.get("keep", []))
+
+
+def release_volumes(deleted_composes, app_configs, server_ips, default_ip, username, key_path):
+    """Apply the retention rules to composes that were deleted with their volumes left in place.
+
+    `server_ips` maps serverId -> IP (unknown servers fall back to `default_ip`).
+    Volumes not kept by the rules are removed. Listing and removal take one
+    remote plan each per server, however many apps were deleted. Returns the
+    retained ones as {app name: [{"volume", "key", "randomized", "ip"}]} for
+    reattach_volumes.
+    """
+    rules_by_app = {cfg["name"]: cfg.get("volumes") for cfg in app_configs}
+    by_ip = {}
+    for comp in deleted_composes:
+        if comp.get("appName"):
+            by_ip.setdefault(server_ips.get(comp.get("serverId"), default_ip), []).append(comp)
+
+    retained = {}
+    for ip, composes in by_ip.items():
+        results = run_plan(ip, username, key_path, [
+            {"op": "docker", "group": comp["appName"],
+             "args": ["volume", "ls", "-q", "--filter", f"label=com.docker.compose.project={comp['appName']}"]}
+            for comp in composes
+        ])
+        if results is None:
+            print(f"Warning: Could not list volumes on {ip}; leaving them in place.")
+            continue
+        wipe = []
+        for comp, result in zip(composes, results):
+            rules = rules_by_app.get(comp["name"])
+            for volume in (result.get("output") or "").split():
+                key, randomized = volume_key(volume, comp["appName"], comp.get("suffix"))
+                if should_keep(key, rules):
+                    print(f"Retaining volume {volume} of {comp['name']}")
+                    retained.setdefault(comp["name"], []).append(
+                        {"volume": volume, "key": key, "randomized": randomized, "ip": ip}
+                    )
+                else:
+                    wipe.append(volume)
+        if wipe:
+            print(f"Wiping volumes on {ip}: {', '.join(wipe)}")
+            # One group per volume: removals are independent and run in parallel
+            results = run_plan(ip, username, key_path, [
+                {"op": "docker", "group": volume, "args": ["volume", "rm", volume]} for volume in wipe
+            ])
+            errors = plan_errors(results)
+            if errors:
+                print(f"Warning: Could not remove all volumes on {ip}: {'; '.join(errors)[:300]}")
+    return retained
+
+
+def reattach_volumes(ip_address, username, key_path, app_name, suffix, retained):
+    """Hand retained volumes to a freshly created compose project before its first deploy.
+
+    Creates each volume under the new project's name (with the compose labels,
+    so docker compose adopts it) and moves the old volume's data directory into
+    it -- a rename on the same filesystem, no copying. Takes two remote plans:
+    one to find Docker's data root, one to move the volumes.
+    """
+    moved = []
+    for entry in retained:
+        if entry["ip"] != ip_address:
+            print(f"Warning: Volume {entry['volume']} is on {entry['ip']}, not {ip_address}; not reattached.")
+            continue
+        key = f"{entry['key']}-{suffix}" if entry["randomized"] and suffix else entry["key"]
+        new = f"{app_name}_{key}"
+        if new == entry["volume"]:
+            continue  # Same project name: docker compose picks the volume up as it is
+        moved.append((entry["volume"], new, key))
+    if not moved:
+        return False
+
+    info = run_plan(ip_address, username, key_path, [{"op": "docker", "args": ["info", "-f", "{{.DockerRootDir}}"]}])
+    if not plan_ok(info) or not (info[0].get("output") or "").strip():
+        print(f"Warning: Could not locate the Docker volumes of {ip_address}: {'; '.join(plan_errors(info))[:200]}")
+        return False
+    root = f"{info[0]['output'].strip()}/volumes"
+
+    # One group per volume: each is created, filled and its old volume removed in order
+    ops = []
+    for old, new, key in moved:
+        ops += [
+            {"op": "docker", "group": new, "args": [
+                "volume", "create", "--label", f"com.docker.compose.project={app_name}",
+                "--label", f"com.docker.compose.volume={key}", new,
+            ]},
+            {"op": "rm", "group": new, "path": f"{root}/{new}/_data", "recursive": True},
+            {"op": "mv", "group": new, "src": f"{root}/{old}/_data", "dest": f"{root}/{new}/_data"},
+            {"op": "docker", "group": new, "args": ["volume", "rm", old]},
+        ]
+    print(f"Reattaching retained volumes for {app_name}: {'; '.join(f'{old} -> {new}' for old, new, _ in moved)}")
+    results = run_plan(ip_address, username, key_path, ops)
+    if not plan_ok(results):
+        print(f"Warning: Reattaching volumes for {app_name} failed: {'; '.join(plan_errors(results))[:200]}")
+        return False
+    return True
@@ -2,22 +2,95 @@ from db.database import SessionLocal
 from db import models
 from passlib.context import CryptContext
 import os
+import json
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Columns of models.Application managed by the seeder
+CATALOG_FIELDS = ("name", "description", "url", "github_url", "category", "icon", "is_live")
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def find_catalog_config():
+    """dokploy_config.json from $CATALOG_CONFIG, next to this script, or the working directory."""
+    candidates = [
+        os.getenv("CATALOG_CONFIG"),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "dokploy_config.json"),
+        "dokploy_config.json",
+    ]
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+def catalog_entries(app_configs, domain):
+    """Build the application catalog from the `catalog` blocks of dokploy_config.json.
+
+    An app (or each of its exposures) is listed when it carries a block like
+    {"name", "description", "category", "icon"}; its URL comes from the domain.
+    """
+    entries = []
+    for cfg in app_configs:
+        github_url = cfg.get("repo", "")
+        if github_url.endswith(".git"):
+            github_url = github_url[:-4]
+        for exposure in cfg.get("exposures", [cfg]):
+            catalog = exposure.get("catalog")
+            if not catalog or not exposure.get("domain"):
+                continue
+            entries.append({
+                "name": catalog["name"],
+                "description": catalog.get("description", ""),
+                "url": f"https://{exposure['domain'].replace('{{DOMAIN}}', domain)}",
+                "github_url": catalog.get("github_url", github_url),
+                "category": catalog.get("category", ""),
+                "icon": catalog.get("icon", ""),
+                "is_live": catalog.get("is_live", True),
+            })
+    return entries
+
+def sync_applications(db, entries):
+    """Upsert the catalog by name/URL in one transaction; returns (added, updated, removed)."""
+    existing = sorted(db.query(models.Application).all(), key=lambda a: a.id)
+    # Oldest row wins when there are duplicates, so surviving IDs stay stable
+    by_name, by_url = {}, {}
+    for a in existing:
+        by_name.setdefault(a.name, a)
+        by_url.setdefault(a.url, a)
+
+    inserts, updates, keep = [], [], set()
+    for entry in entries:
+        row = by_name.get(entry["name"]) or by_url.get(entry["url"])
+        if row is None or row.id in keep:
+            inserts.append(entry)
+            continue
+        keep.add(row.id)
+        changed = {f: entry[f] for f in CATALOG_FIELDS if getattr(row, f) != entry[f]}
+        if changed:
+            updates.append(dict(changed, id=row.id))
+    removed = [a.id for a in existing if a.id not in keep]
+
+    if inserts:
+        db.bulk_insert_mappings(models.Application, inserts)
+    if updates:
+        db.bulk_update_mappings(models.Application, updates)
+    if removed:
+        db.query(models.Application).filter(models.Application.id.in_(removed)).delete(synchronize_session=False)
+    if inserts or updates or removed:
+        db.commit()
+    return len(inserts), len(updates), len(removed)
+
 def seed():
     db = SessionLocal()
     try:
         # 0. Basic Configuration
         DOMAIN = os.getenv("DOMAIN", "example.com")
-        
+
         # 1. Seed Superadmin
         admin_email = os.getenv("SUPERADMIN_EMAIL", f"admin@{DOMAIN}")
         admin_password = os.getenv("SUPERADMIN_PASSWORD", "ChangeThisPassword123!")
-        
+
         user = db.query(models.User).filter(models.User.email == admin_email).first()
         if not user:
             print(f"Seeding superadmin user: {admin_email}")
@@ -31,83 +104,22 @@ def seed():
             print("Superadmin seeded successfully.")
         else:
             print("Superadmin already exists.")
-            
-        # 2. Clear existing applications
-        print("Clearing existing applications...")
-        db.query(models.Application).delete()
-        db.commit()
 
-        # 3. Seed expanded applications with project groupings
-        print("Seeding applications with groupings...")
-        apps = [
-            models.Application(
-                name="Lakera Guard Demo",
-                description="AI security guardrails",
-                url=f"https://lakera.{DOMAIN}",
-                github_url="https://github.com/alshawwaf/Lakera-Demo",
-                category="AI Security",
-                icon="security",
-                is_live=True
-            ),
-            models.Application(
-                name="Training Portal",
-                description="AI development training platform",
-                url=f"https://training.{DOMAIN}",
-                github_url="https://github.com/alshawwaf/training-portal",
-                category="Training",
-                icon="training",
-                is_live=True
-            ),
-            models.Application(
-                name="Docs to Swagger",
-                description="Convert API docs to OpenAPI",
-                url=f"https://swagger.{DOMAIN}",
-                github_url="https://github.com/alshawwaf/cp-docs-to-swagger",
-                category="Developer Tools",
-                icon="swagger",
-                is_live=True
-            ),
-            models.Application(
-                name="n8n Workflow",
-                description="AI workflow automation platform",
-                url=f"https://workflow.{DOMAIN}",
-                github_url="https://github.com/alshawwaf/cp-agentic-mcp-playground",
-                category="Automation",
-                icon="n8n",
-                is_live=True
-            ),
-            models.Application(
-                name="Open WebUI",
-                description="Chat interface for AI models",
-                url=f"https://chat.{DOMAIN}",
-                github_url="https://github.com/alshawwaf/cp-agentic-mcp-playground",
-                category="AI Chat",
-                icon="chat",
-                is_live=True
-            ),
-            models.Application(
-                name="Flowise",
-                description="Visual LLM flow builder",
-                url=f"https://flowise.{DOMAIN}",
-                github_url="https://github.com/alshawwaf/cp-agentic-mcp-playground",
-                category="AI Development",
-                icon="flowise",
-                is_live=True
-            ),
-            models.Application(
-                name="Langflow",
-                description="Visual AI pipeline designer",
-                url=f"https://langflow.{DOMAIN}",
-                github_url="https://github.com/alshawwaf/cp-agentic-mcp-playground",
-                category="AI Development",
-                icon="langflow",
-                is_live=True
-            ),
-        ]
-        db.add_all(apps)
-        db.commit()
-        print("Grouped applications seeded successfully.")
-            
+        # 2. Sync applications with the catalog in dokploy_config.json
+        config_path = find_catalog_config()
+        if not config_path:
+            # An empty catalog would look like a working seed; fail loudly instead
+            raise FileNotFoundError(
+                "dokploy_config.json not found next to seed_expanded.py or in the working directory "
+                "(set CATALOG_CONFIG); applications were not synced"
+            )
+        with open(config_path, "r") as f:
+            entries = catalog_entries(json.load(f), DOMAIN)
+        print(f"Syncing {len(entries)} catalog applications from {config_path}...")
+        added, updated, removed = sync_applications(db, entries)
+        print(f"Applications synced: {added} added, {updated} updated, {removed} removed, "
+              f"{len(entries) - added - updated} unchanged.")
+
     finally:
         db.close()
 
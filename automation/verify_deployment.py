@@ -3,9 +3,92 @@ import json
 import time
 import argparse
 import sys
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dokploy_lib import history
+from dokploy_lib.api import PROJECT_FIELDS, api_request
+from dokploy_lib.deploylogs import parse_timestamp
+from dokploy_lib.trpc import trpc_batch_data, trpc_data
+
+# Fields read from the listings; the rest of each record is dropped on decode
+# (project fields as in the automation, environments with their status fields)
+ENVIRONMENT_FIELDS = (
+    {"compose": ("composeId", "name", "composeStatus", "createdAt")},
+    {"applications": ("applicationId", "name", "applicationStatus", "createdAt")},
+)
+DEPLOYMENT_FIELDS = ("deploymentId", "status", "createdAt", "startedAt", "finishedAt")
+
+
+def timed_get(session, url, timeout=30):
+    """GET via the session, recorded in the run history like every API call."""
+    return api_request("GET", url, session=session, timeout=timeout)
+
+
+def fetch_projects(session, url):
+    """Return [(project, [environment details with compose/applications])]."""
+    trpc_url_proj = f"{url}/api/trpc/project.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
+    resp_proj = timed_get(session, trpc_url_proj)
+
+    # Handle empty/error responses
+    if resp_proj.status_code != 200:
+        raise RuntimeError(f"Error fetching projects: {resp_proj.status_code}")
+    try:
+        projects_data = trpc_data(resp_proj, PROJECT_FIELDS)
+    except (ValueError, KeyError, IndexError, TypeError):
+        raise RuntimeError(f"Error in project response: {resp_proj.content[:200]!r}")
+
+    result = []
+    for project in projects_data:
+        # Re-fetch project one to get environments if not present
+        trpc_url_one = f"{url}/api/trpc/project.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22projectId%22%3A%22{project['projectId']}%22%7D%7D%7D"
+        project_details = trpc_data(timed_get(session, trpc_url_one), PROJECT_FIELDS)
+
+        environments = []
+        for env in project_details.get("environments", []):
+            # Fetch full environment details to get apps/compose
+            trpc_env_one = f"{url}/api/trpc/environment.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22environmentId%22%3A%22{env['environmentId']}%22%7D%7D%7D"
+            env_details = trpc_data(timed_get(session, trpc_env_one), ENVIRONMENT_FIELDS)
+            environments.append(dict(env_details, name=env["name"], environmentId=env["environmentId"]))
+        result.append((project, environments))
+    return result
+
+
+def latest_deployments(session, url, compose_ids):
+    """Latest deployment of each compose, fetched in one batched query.
+
+    Returns {compose_id: (status, duration_seconds, finished_timestamp, deployment_id)}.
+    """
+    if not compose_ids:
+        return {}
+    procedures = ",".join("deployment.allByCompose" for _ in compose_ids)
+    inputs = {str(i): {"json": {"composeId": cid}} for i, cid in enumerate(compose_ids)}
+    trpc_url = f"{url}/api/trpc/{procedures}?batch=1&input={urllib.parse.quote(json.dumps(inputs))}"
+    try:
+        body = trpc_batch_data(timed_get(session, trpc_url), DEPLOYMENT_FIELDS)
+    except Exception:
+        body = []
+
+    results = {}
+    for i, cid in enumerate(compose_ids):
+        deployments = body[i] if i < len(body) else None
+        if not deployments:
+            results[cid] = (None, None, None, None)
+            continue
+        latest = max(deployments, key=lambda d: d.get("createdAt") or "")
+        started = parse_timestamp(latest.get("startedAt") or latest.get("createdAt"))
+        finished = parse_timestamp(latest.get("finishedAt"))
+        duration = finished - started if started and finished else None
+        results[cid] = (latest.get("status"), duration, finished, latest.get("deploymentId"))
+    return results
 
 
 def verify(url, email, password):
+    """Print the status of every project's services; returns False if login or the fetch failed."""
+    recorder = history.active()
+
     # Login
     login_url = f"{url}/api/auth/sign-in/email"
     payload = {"email": email, "password": password}
@@ -15,64 +98,50 @@ def verify(url, email, password):
 
     try:
         print(f"Logging in to {url} as {email}...")
-        resp = s.post(login_url, json=payload, timeout=30)
+        resp = api_request("POST", login_url, session=s, json=payload, timeout=30)
         if resp.status_code != 200:
             print(f"Login failed: {resp.status_code} - {resp.text}")
-            return
+            return False
         print("Login successful.")
     except Exception as e:
         print(f"Error during login: {e}")
-        return
+        return False
 
     print("\nFetching project status...")
 
     try:
-        # Fetch projects
-        trpc_url_proj = f"{url}/api/trpc/project.all?batch=1&input=%7B%220%22%3A%7B%22json%22%3Anull%7D%7D"
-        resp_proj = s.get(trpc_url_proj, timeout=30)
-
-        # Handle empty/error responses
-        if resp_proj.status_code != 200:
-            print(f"Error fetching projects: {resp_proj.status_code}")
-            return
-
-        projects_data = resp_proj.json()
-        if not projects_data or "error" in projects_data[0]:
-            print(f"Error in project response: {projects_data}")
-            return
-
-        projects = projects_data[0]["result"]["data"]["json"]
+        projects = fetch_projects(s, url)
 
         print("\n" + "=" * 40)
         print("DEPLOYMENT STATUS")
         print("=" * 40)
 
-        for project in projects:
+        # A deployment seen by an earlier run is already in the apps series
+        recorded = history.last_deployment_ids(recorder.db_path, url) if recorder else {}
+        for project, environments in projects:
             print(f"\nProject: {project['name']}")
-            # Re-fetch project one to get environments if not present
-            trpc_url_one = f"{url}/api/trpc/project.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22projectId%22%3A%22{project['projectId']}%22%7D%7D%7D"
-            resp_one = s.get(trpc_url_one, timeout=30)
-            project_details = resp_one.json()[0]["result"]["data"]["json"]
-
-            for env in project_details.get("environments", []):
-                env_id = env['environmentId']
-                print(f" Environment: {env['name']} ({env_id})")
-
-                # Fetch full environment details to get apps/compose
-                trpc_env_one = f"{url}/api/trpc/environment.one?batch=1&input=%7B%220%22%3A%7B%22json%22%3A%7B%22environmentId%22%3A%22{env_id}%22%7D%7D%7D"
-                env_resp = s.get(trpc_env_one, timeout=30)
-                env_details = env_resp.json()[0]["result"]["data"]["json"]
+            for env_details in environments:
+                print(f" Environment: {env_details['name']} ({env_details['environmentId']})")
 
                 composes = env_details.get("compose", [])
                 apps = env_details.get("applications", [])
 
                 if not composes and not apps:
                     print("  (No services found in this environment)")
-                
+
+                deployments = {}
+                if recorder:
+                    deployments = latest_deployments(s, url, [c["composeId"] for c in composes])
                 for c in composes:
                     print(
                         f"  [Compose] {c['name']} | Status: {c['composeStatus']} | Created: {c['createdAt']}"
                     )
+                    if recorder:
+                        deploy_status, duration, _, deployment_id = deployments[c["composeId"]]
+                        if duration is not None:
+                            print(f"            Last deployment: {deploy_status} in {duration:.0f}s")
+                        if deployment_id and deployment_id != recorded.get(c["name"]):
+                            recorder.record_deploy(c["name"], duration, c["composeStatus"], deployment_id)
                 for a in apps:
                     print(
                         f"  [App] {a['name']} | Status: {a['applicationStatus']} | Created: {a['createdAt']}"
@@ -80,6 +149,202 @@ def verify(url, email, password):
 
     except Exception as e:
         print(f"Error during verification: {e}")
+        return False
+    return True
+
+
+# name -> (type, help) of everything the exporter serves
+METRICS = {
+    "dokploy_up": ("gauge", "Whether the last collection from the Dokploy API succeeded"),
+    "dokploy_collect_duration_seconds": ("gauge", "Time taken by the last collection"),
+    "dokploy_cache_age_seconds": ("gauge", "Age of the cached collection served by this scrape"),
+    "dokploy_compose_status": ("gauge", "Compose status (1 for the current status)"),
+    "dokploy_compose_last_deployment_age_seconds": ("gauge", "Time since the last deployment of a compose finished"),
+    "dokploy_compose_last_deployment_duration_seconds": ("gauge", "Duration of the last deployment of a compose"),
+    "dokploy_api_request_duration_seconds": ("summary", "Latency of Dokploy API requests by procedure"),
+    "dokploy_probe_success": ("gauge", "Whether the exposure answered over HTTPS without a server error"),
+    "dokploy_probe_status_code": ("gauge", "HTTP status code returned by the exposure"),
+    "dokploy_probe_duration_seconds": ("gauge", "Latency of the exposure probe"),
+}
+
+COMPOSE_STATUSES = ("idle", "running", "done", "error")
+
+
+def config_exposures(config_path, domain):
+    """(app, host) of every app/exposure domain in dokploy_config.json."""
+    with open(config_path, "r") as f:
+        app_configs = json.load(f)
+    exposures = []
+    for cfg in app_configs:
+        for exposure in cfg.get("exposures", [cfg]):
+            if exposure.get("domain"):
+                exposures.append((cfg["name"], exposure["domain"].replace("{{DOMAIN}}", domain)))
+    return exposures
+
+
+def probe(host, timeout=10):
+    """GET https://host/ -> (success, status_code, seconds)."""
+    start = time.time()
+    try:
+        resp = requests.get(f"https://{host}/", timeout=timeout)
+        return resp.status_code < 500, resp.status_code, time.time() - start
+    except Exception:
+        return False, 0, time.time() - start
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class MetricsExporter:
+    """Prometheus metrics for a Dokploy instance, collected at most once per `cache_ttl` seconds."""
+
+    def __init__(self, url, email, password, exposures=(), cache_ttl=30, probe_timeout=10):
+        self.url = url
+        self.email = email
+        self.password = password
+        self.exposures = list(exposures)
+        self.cache_ttl = cache_ttl
+        self.probe_timeout = probe_timeout
+        self.session = None
+        self.cache = None  # (collected_at, samples)
+        self.api_calls = {}  # procedure -> [count, total seconds], cumulative
+        self.lock = threading.Lock()
+
+    def _record_call(self, resp, *args, **kwargs):
+        # One label per batch shape, not per batch size
+        procedure = ",".join(sorted(set(history.endpoint_from_url(resp.url).split(","))))
+        stats = self.api_calls.setdefault(procedure, [0, 0.0])
+        stats[0] += 1
+        stats[1] += resp.elapsed.total_seconds()
+
+    def _login(self):
+        session = requests.Session()
+        session.hooks["response"].append(self._record_call)
+        resp = session.post(
+            f"{self.url}/api/auth/sign-in/email",
+            json={"email": self.email, "password": self.password}, timeout=30,
+        )
+        if resp.status_code != 200:
+            raise RuntimeError(f"Login failed: {resp.status_code}")
+        self.session = session
+
+    def _collect_api(self):
+        """Compose samples [(name, labels, value)]; deployment ages are kept as timestamps."""
+        if self.session is None:
+            self._login()
+        try:
+            projects = fetch_projects(self.session, self.url)
+        except RuntimeError:
+            self._login()  # Session expired
+            projects = fetch_projects(self.session, self.url)
+
+        samples = []
+        for project, environments in projects:
+            for env_details in environments:
+                composes = env_details.get("compose", [])
+                deployments = latest_deployments(self.session, self.url, [c["composeId"] for c in composes])
+                for c in composes:
+                    labels = {"project": project["name"], "environment": env_details["name"], "compose": c["name"]}
+                    for status in COMPOSE_STATUSES:
+                        samples.append((
+                            "dokploy_compose_status", dict(labels, status=status),
+                            1 if c["composeStatus"] == status else 0,
+                        ))
+                    _, duration, finished, _ = deployments[c["composeId"]]
+                    if finished is not None:
+                        samples.append(("dokploy_compose_last_deployment_age_seconds", labels, finished))
+                    if duration is not None:
+                        samples.append(("dokploy_compose_last_deployment_duration_seconds", labels, duration))
+        return samples
+
+    def collect(self):
+        start = time.time()
+        samples = []
+        try:
+            samples.extend(self._collect_api())
+            up = 1
+        except Exception as e:
+            print(f"Warning: Collection from {self.url} failed: {e}")
+            self.session = None
+            up = 0
+        samples.append(("dokploy_up", {}, up))
+
+        with ThreadPoolExecutor(max_workers=min(8, len(self.exposures) or 1)) as pool:
+            probes = pool.map(lambda e: probe(e[1], self.probe_timeout), self.exposures)
+            for (app, host), (success, status_code, seconds) in zip(self.exposures, probes):
+                labels = {"app": app, "host": host}
+                samples.append(("dokploy_probe_success", labels, 1 if success else 0))
+                samples.append(("dokploy_probe_status_code", labels, status_code))
+                samples.append(("dokploy_probe_duration_seconds", labels, seconds))
+
+        samples.append(("dokploy_collect_duration_seconds", {}, time.time() - start))
+        return samples
+
+    def render(self):
+        """Text exposition of the cached collection, refreshed when older than cache_ttl."""
+        with self.lock:
+            now = time.time()
+            if self.cache is None or now - self.cache[0] >= self.cache_ttl:
+                self.cache = (now, self.collect())
+                now = time.time()
+            collected_at, samples = self.cache
+            samples = samples + [("dokploy_cache_age_seconds", {}, now - collected_at)]
+            api_calls = {proc: list(stats) for proc, stats in self.api_calls.items()}
+
+        by_name = {}
+        for name, labels, value in samples:
+            if name == "dokploy_compose_last_deployment_age_seconds":
+                value = now - value
+            by_name.setdefault(name, []).append(f"{name}{format_labels(labels)} {value:g}")
+        for proc, (count, total) in sorted(api_calls.items()):
+            labels = format_labels({"procedure": proc})
+            by_name.setdefault("dokploy_api_request_duration_seconds", []).extend([
+                f"dokploy_api_request_duration_seconds_sum{labels} {total:g}",
+                f"dokploy_api_request_duration_seconds_count{labels} {count}",
+            ])
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            if name in by_name:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines.extend(by_name[name])
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(exporter, port, host="0.0.0.0"):
+    """Serve exporter.render() on /metrics until interrupted."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = exporter.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving metrics for {exporter.url} on http://{host}:{port}/metrics (cache {exporter.cache_ttl}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
 
 if __name__ == "__main__":
@@ -87,6 +352,27 @@ if __name__ == "__main__":
     parser.add_argument("--url", required=True, help="Dokploy URL")
     parser.add_argument("--email", required=True, help="Admin email")
     parser.add_argument("--password", required=True, help="Admin password")
+    parser.add_argument("--history-db", default=history.DEFAULT_DB_PATH, help="Run history SQLite database")
+    parser.add_argument("--no-history", action="store_true", help="Do not record this run in the history database")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Run as a Prometheus exporter on this port")
+    parser.add_argument("--listen", default="0.0.0.0", help="Exporter bind address (default: 0.0.0.0)")
+    parser.add_argument("--cache-ttl", type=float, default=30, help="Seconds a collection is reused across scrapes (default: 30)")
+    parser.add_argument("--config", help="dokploy_config.json whose domains the exporter probes")
+    parser.add_argument("--domain", default="cpdemo.ca", help="Root domain for {{DOMAIN}} in --config (default: cpdemo.ca)")
 
     args = parser.parse_args()
-    verify(args.url.rstrip("/"), args.email, args.password)
+    url = args.url.rstrip("/")
+
+    if args.serve:
+        exposures = config_exposures(args.config, args.domain) if args.config else []
+        serve_metrics(MetricsExporter(url, args.email, args.password, exposures, args.cache_ttl), args.serve, args.listen)
+        sys.exit(0)
+
+    recorder = None
+    if not args.no_history:
+        recorder = history.start_run("verify", target=url, db_path=args.history_db)
+    with history.phase("verify"):
+        verified = verify(url, args.email, args.password)
+    if recorder:
+        recorder.save("ok" if verified else "failed")
+    sys.exit(0 if verified else 1)
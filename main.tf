@@ -274,6 +274,7 @@ resource "null_resource" "dokploy_setup" {
   triggers = {
     vm_id            = azurerm_linux_virtual_machine.vm.id
     automation_script = filesha256("automation/dokploy_automate.py")
+    automation_lib    = sha256(join("", [for f in fileset("automation/dokploy_lib", "*.py") : filesha256("automation/dokploy_lib/${f}")]))
     automation_config = filesha256("automation/dokploy_config.json")
     # env_agentic       = filesha256("automation/.env_agentic")
     # env_dev_hub       = filesha256("automation/.env_dev-hub")
@@ -286,7 +287,7 @@ resource "null_resource" "dokploy_setup" {
       echo "Waiting 90s for VM cloud-init and Dokploy startup..."
       sleep 90
       echo "Copying automation files to VM..."
-      scp -o StrictHostKeyChecking=no -i ~/.ssh/id_rsa automation/dokploy_automate.py automation/dokploy_config.json ${var.admin_username}@${azurerm_public_ip.pip.ip_address}:/tmp/
+      scp -r -o StrictHostKeyChecking=no -i ~/.ssh/id_rsa automation/dokploy_automate.py automation/dokploy_lib automation/dokploy_config.json ${var.admin_username}@${azurerm_public_ip.pip.ip_address}:/tmp/
       # echo "Copying env files to VM..."
       # scp -o StrictHostKeyChecking=no -i ~/.ssh/id_rsa automation/.env_agentic automation/.env_lakera-demo automation/.env_training-portal automation/.env_dev-hub ${var.admin_username}@${azurerm_public_ip.pip.ip_address}:/tmp/
       echo "Running automation script on VM..."